@@ -1,12 +1,21 @@
+import os
 import time
+import asyncio
 import logging
-from typing import List
+from typing import Any, AsyncIterator, List, Optional, Tuple, Union
 from .models import (
     TriageRequest, TriageResponse, ClassificationResult,
-    AgentSuggestion, CategoryEnum
+    AgentSuggestion, TriageThresholds,
+    DraftRequest, DraftResponse
 )
-from .llm_provider import LLMProvider
+from .llm_provider import LLMFallbackError, LLMProvider
 from .kb_service import KnowledgeBaseService
+from .batching import MicroBatcher
+from .cache import TriageCache, cache_key
+from .dedup import ClusterResult, DuplicateDetector, TicketCluster
+from .pipeline import Stage, execute_plan
+from .kb_index import QueryScores
+from .metrics import RequestMetrics, request_metrics_var, trace_id_var, timed_stage
 
 logger = logging.getLogger(__name__)
 
@@ -18,86 +27,565 @@ class AgentService:
     def __init__(self):
         self.llm_provider = LLMProvider()
         self.kb_service = KnowledgeBaseService()
+        
+        # Coalesce concurrent classifications into packed LLM calls. Stub
+        # classification is effectively free, so batching is off by default there.
+        default_window = "0" if self.llm_provider.stub_mode else "10"
+        window_ms = float(os.getenv("TRIAGE_BATCH_WINDOW_MS", default_window))
+        self.classification_batcher = None
+        if window_ms > 0:
+            self.classification_batcher = MicroBatcher(
+                # Failed items raise, so keyword results are never cached
+                lambda texts: self.llm_provider.classify_batch(texts, fallback=False),
+                max_batch_size=self.llm_provider.classify_batch_size,
+                window_ms=window_ms
+            )
+        
+        self.cache = None
+        if os.getenv("TRIAGE_CACHE_ENABLED", "true").lower() == "true":
+            self.cache = TriageCache()
+        
+        # Near-duplicate tickets reuse the triage of their cluster's first ticket
+        self.dedup = None
+        if os.getenv("TRIAGE_DEDUP_ENABLED", "true").lower() == "true":
+            self.dedup = DuplicateDetector()
     
     async def process_triage(self, request: TriageRequest) -> TriageResponse:
         """
         Execute the complete agentic triage workflow
         """
         start_time = time.time()
+        trace_id_var.set(request.traceId)
+        request_metrics_var.set(RequestMetrics())
         
         try:
+            cluster, is_new = self._assign_cluster(request.ticket)
+            if cluster is not None and not is_new:
+                response = await self._triage_from_cluster(request, cluster, start_time)
+                if response is not None:
+                    return response
+                # The cluster's first ticket failed; triage this one on its own
+                cluster = None
+            
             # Step 1: Plan the workflow
-            plan = self._create_plan(request.ticket)
+            plan = self._create_plan(request.ticket, request.thresholds,
+                                     combined=self.llm_provider.combined_mode)
             logger.info(f"Created plan: {plan}")
             
-            # Step 2: Classify the ticket
-            classification = await self._classify_ticket(request.ticket)
-            logger.info(f"Classification: {classification.predictedCategory} "
-                       f"(confidence: {classification.confidence:.3f})")
+            # Step 2: Execute it, running independent stages concurrently
+            try:
+                results = await execute_plan(plan)
+            except BaseException:
+                if cluster is not None:
+                    self.dedup.discard(cluster)
+                    cluster.result.set_result(None)
+                raise
             
-            # Step 3: Retrieve relevant KB articles
-            articles = await self._retrieve_articles(request.ticket, classification)
-            logger.info(f"Retrieved {len(articles)} articles")
+            if cluster is not None:
+                cluster.result.set_result(ClusterResult(
+                    results["classify_category"],
+                    results["rerank_kb_articles"],
+                    results["draft_response"]
+                ))
             
-            # Step 4: Draft response
-            draft_reply = await self._draft_response(
-                request.ticket, articles, classification
+            return self._build_response(
+                request.ticket,
+                results["classify_category"],
+                results["rerank_kb_articles"],
+                results["draft_response"],
+                start_time,
+                cluster=cluster
             )
-            logger.info(f"Generated draft reply ({len(draft_reply)} chars)")
             
-            # Step 5: Calculate final confidence
-            final_confidence = self._calculate_confidence(
-                classification.confidence, len(articles)
+        except Exception as e:
+            logger.error(f"Triage processing failed: {str(e)}")
+            raise
+    
+    async def stream_triage(self, request: TriageRequest) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Run the triage workflow, yielding (event, data) pairs as results
+        become available
+        
+        Classification and article matches are emitted as soon as their
+        stages finish, the draft is streamed as it is generated and the
+        complete TriageResponse is the final "suggestion" event.
+        """
+        start_time = time.time()
+        trace_id_var.set(request.traceId)
+        request_metrics_var.set(RequestMetrics())
+        ticket = request.ticket
+        
+        plan = [
+            stage for stage in self._create_plan(ticket, request.thresholds)
+            if stage.name != "draft_response"
+        ]
+        events: asyncio.Queue = asyncio.Queue()
+        
+        def on_complete(name, result):
+            if name == "classify_category":
+                events.put_nowait(("classification", result.model_dump(mode="json")))
+            elif name == "rerank_kb_articles":
+                events.put_nowait(("articles", [a.model_dump(mode="json") for a in result]))
+        
+        plan_task = asyncio.ensure_future(execute_plan(plan, on_complete))
+        try:
+            async for event in self._events_until_done(plan_task, events):
+                yield event
+            results = plan_task.result()
+        finally:
+            plan_task.cancel()
+        
+        classification = results["classify_category"]
+        articles = results["rerank_kb_articles"]
+        category = classification.predictedCategory.value
+        
+        draft_reply = None
+        if self._should_draft(request.thresholds, classification, articles):
+            with timed_stage("draft_response"):
+                draft_task = asyncio.ensure_future(
+                    self._stream_draft(ticket, articles, category, events)
+                )
+                try:
+                    async for event in self._events_until_done(draft_task, events):
+                        yield event
+                    draft_reply = draft_task.result()
+                finally:
+                    draft_task.cancel()
+        
+        response = self._build_response(ticket, classification, articles, draft_reply, start_time)
+        if draft_reply is None:
+            yield ("draft_delta", {"text": response.suggestion.draftReply})
+        
+        yield ("suggestion", response.model_dump(mode="json"))
+    
+    @staticmethod
+    async def _events_until_done(task: asyncio.Future,
+                                 events: asyncio.Queue) -> AsyncIterator[Tuple[str, Any]]:
+        """Yield queued events as they arrive until the task is done and the queue drained"""
+        while not (task.done() and events.empty()):
+            getter = asyncio.ensure_future(events.get())
+            await asyncio.wait({task, getter}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                yield getter.result()
+            else:
+                getter.cancel()
+    
+    async def _stream_draft(self, ticket, articles, category: str,
+                            events: asyncio.Queue) -> str:
+        """Stream draft chunks into the event queue and return the full draft"""
+        key = self._draft_cache_key(ticket, articles, category)
+        cached = self.cache.get(key) if self.cache else None
+        if cached is not None:
+            events.put_nowait(("draft_delta", {"text": cached}))
+            return cached
+        
+        chunks = []
+        try:
+            async for chunk in self.llm_provider.stream_draft(
+                    ticket, articles, category, fallback=False):
+                chunks.append(chunk)
+                events.put_nowait(("draft_delta", {"text": chunk}))
+        except Exception as e:
+            if chunks:
+                # Part of a draft was already sent; tell the client to discard it
+                logger.error(f"Streaming draft failed mid-way: {e}")
+                events.put_nowait(("draft_reset", {}))
+            # The template stands in for this request only and is not cached
+            draft_reply = self.llm_provider.template_draft(ticket, articles, category)
+            events.put_nowait(("draft_delta", {"text": draft_reply}))
+            return draft_reply
+        
+        draft_reply = "".join(chunks).strip()
+        if self.cache:
+            self.cache.set(key, draft_reply)
+        return draft_reply
+    
+    async def process_batch(self, requests: List[TriageRequest]) -> List[Union[TriageResponse, Exception]]:
+        """
+        Triage several tickets together
+        
+        Classification is packed into shared LLM calls and retrieval runs as a
+        single pass over the index. Failures are returned per ticket, and a
+        ticket that fails one stage is left out of the later ones.
+        """
+        start_time = time.time()
+        # Stage timings and tokens are reported for the batch as a whole
+        request_metrics_var.set(RequestMetrics())
+        
+        async def classify(request):
+            # Runs in its own task, so the trace id only applies to this ticket
+            trace_id_var.set(request.traceId)
+            return await self._classify_ticket(request.ticket)
+        
+        with timed_stage("classify_category"):
+            # Goes through the cache and micro-batcher, which packs misses into shared calls
+            classifications = await asyncio.gather(
+                *[classify(r) for r in requests], return_exceptions=True
             )
-            
-            # Create suggestion
-            suggestion = AgentSuggestion(
-                predictedCategory=classification.predictedCategory,
-                articleIds=[article.id for article in articles],
-                draftReply=draft_reply,
-                confidence=final_confidence,
-                modelInfo={
-                    "provider": self.llm_provider.get_provider_name(),
-                    "model": self.llm_provider.get_model_name(),
-                    "promptVersion": "v1.0",
-                    "latencyMs": int((time.time() - start_time) * 1000)
-                }
+        failures: List[Optional[Exception]] = [
+            c if isinstance(c, Exception) else None for c in classifications
+        ]
+        
+        classified = [i for i, failure in enumerate(failures) if failure is None]
+        with timed_stage("retrieve_kb_articles"):
+            searched = await self._search_batch([
+                (f"{requests[i].ticket.title} {requests[i].ticket.description}",
+                 classifications[i].predictedCategory.value)
+                for i in classified
+            ])
+        article_lists: List[Optional[List]] = [None] * len(requests)
+        for i, articles in zip(classified, searched):
+            if isinstance(articles, Exception):
+                failures[i] = articles
+            else:
+                article_lists[i] = articles
+        
+        async def draft(request, articles, classification):
+            trace_id_var.set(request.traceId)
+            if not self._should_draft(request.thresholds, classification, articles):
+                return None
+            return await self._draft_response(request.ticket, articles, classification)
+        
+        retrieved = [i for i, failure in enumerate(failures) if failure is None]
+        with timed_stage("draft_response"):
+            drafts = await asyncio.gather(*[
+                draft(requests[i], article_lists[i], classifications[i]) for i in retrieved
+            ], return_exceptions=True)
+        draft_replies: List[Optional[str]] = [None] * len(requests)
+        for i, draft_reply in zip(retrieved, drafts):
+            if isinstance(draft_reply, Exception):
+                failures[i] = draft_reply
+            else:
+                draft_replies[i] = draft_reply
+        
+        logger.info(f"Batch triaged {len(requests)} tickets, "
+                    f"{sum(f is not None for f in failures)} failed")
+        
+        results = []
+        for i, r in enumerate(requests):
+            if failures[i] is not None:
+                results.append(failures[i])
+                continue
+            trace_id_var.set(r.traceId)
+            results.append(self._build_response(
+                r.ticket, classifications[i], article_lists[i], draft_replies[i], start_time
+            ))
+        return results
+    
+    async def _search_batch(self, queries: List[Tuple[str, Optional[str]]]) -> List[Union[List, Exception]]:
+        """
+        Retrieve articles for several tickets in one pass, searching them one
+        by one if the shared pass fails so only the failing tickets are lost
+        """
+        try:
+            return await self.kb_service.search_batch(queries)
+        except Exception as e:
+            logger.error(f"Batch retrieval failed, searching tickets separately: {e}")
+        
+        results = []
+        for query, category in queries:
+            try:
+                results.append(await self.kb_service.search_articles(query, category))
+            except Exception as e:
+                results.append(e)
+        return results
+    
+    async def generate_draft(self, request: DraftRequest) -> DraftResponse:
+        """
+        Draft a reply on demand, for tickets whose triage skipped drafting
+        """
+        start_time = time.time()
+        trace_id_var.set(request.traceId)
+        request_metrics = RequestMetrics()
+        request_metrics_var.set(request_metrics)
+        ticket = request.ticket
+        
+        if request.category:
+            classification = ClassificationResult(
+                predictedCategory=request.category, confidence=1.0
+            )
+        else:
+            classification = await self._classify_ticket(ticket)
+        
+        if request.articleIds is not None:
+            articles = self.kb_service.get_articles(request.articleIds)
+        else:
+            articles = self.kb_service.rank_articles(
+                self._retrieve_candidates(ticket),
+                classification.predictedCategory.value
             )
+        
+        draft_reply = await self._draft_response(ticket, articles, classification)
+        logger.info(f"Generated on-demand draft ({len(draft_reply)} chars)")
+        
+        return DraftResponse(
+            draftReply=draft_reply,
+            articleIds=[article.id for article in articles],
+            modelInfo={
+                "provider": self.llm_provider.get_provider_name(),
+                "model": self.llm_provider.get_model_name(),
+                "promptVersion": self.llm_provider.prompt_version,
+                "tokens": request_metrics.tokens
+            },
+            processingTimeMs=int((time.time() - start_time) * 1000)
+        )
+    
+    def _assign_cluster(self, ticket) -> Tuple[Optional[TicketCluster], bool]:
+        if not self.dedup:
+            return None, True
+        with timed_stage("dedup_lookup"):
+            return self.dedup.assign(f"{ticket.title} {ticket.description}")
+    
+    async def _triage_from_cluster(self, request: TriageRequest, cluster: TicketCluster,
+                                   start_time: float) -> Optional[TriageResponse]:
+        """
+        Triage a near-duplicate with its cluster's classification and articles
+        
+        Waits for the cluster's first ticket if it is still in flight.
+        Returns None if the first ticket's triage failed.
+        
+        The first ticket's draft was written to another customer, so it is
+        only offered to the human agent: the response is marked
+        clusterReused and the backend never auto-closes it. For the same
+        reason no draft is generated here when the first ticket skipped one.
+        """
+        with timed_stage("await_cluster"):
+            # Shielded so a cancelled duplicate cannot cancel the shared result
+            shared = await asyncio.shield(cluster.result)
+        if shared is None:
+            return None
+        
+        return self._build_response(
+            request.ticket, shared.classification, shared.articles, shared.draft,
+            start_time, cluster=cluster, reused=True
+        )
+    
+    def _build_response(self, ticket, classification: ClassificationResult,
+                        articles: List, draft_reply: Optional[str],
+                        start_time: float, cluster: Optional[TicketCluster] = None,
+                        reused: bool = False) -> TriageResponse:
+        """Assemble the agent suggestion for a triaged ticket"""
+        final_confidence = self._calculate_confidence(
+            classification.confidence, len(articles)
+        )
+        
+        request_metrics = request_metrics_var.get()
+        
+        # A skipped draft is replaced by the free template reply, since the
+        # ticket goes to a human who can request a full draft from /draft
+        skipped_stages = []
+        if draft_reply is None:
+            skipped_stages.append("draft_response")
+            draft_reply = self.llm_provider.template_draft(
+                ticket, articles, classification.predictedCategory.value
+            )
+        
+        suggestion = AgentSuggestion(
+            predictedCategory=classification.predictedCategory,
+            articleIds=[article.id for article in articles],
+            draftReply=draft_reply,
+            confidence=final_confidence,
+            clusterId=cluster.id if cluster else None,
+            modelInfo={
+                "provider": self.llm_provider.get_provider_name(),
+                "model": self.llm_provider.get_model_name(),
+                "promptVersion": self.llm_provider.prompt_version,
+                "latencyMs": int((time.time() - start_time) * 1000),
+                "skippedStages": skipped_stages,
+                "traceId": trace_id_var.get(),
+                # Whether the triage came from the cluster's first ticket; the
+                # backend never auto-closes these with another ticket's draft
+                "clusterReused": reused,
+                **(request_metrics.to_dict() if request_metrics else {})
+            }
+        )
+        
+        return TriageResponse(
+            suggestion=suggestion,
+            processingTimeMs=int((time.time() - start_time) * 1000),
+            skippedStages=skipped_stages
+        )
+    
+    def _should_draft(self, thresholds: Optional[TriageThresholds],
+                      classification: ClassificationResult, articles: List) -> bool:
+        """
+        Only pay for drafting when the ticket could be auto-closed, as the
+        backend discards the draft otherwise
+        """
+        if thresholds is None:
+            return True
+        
+        confidence = self._calculate_confidence(classification.confidence, len(articles))
+        return thresholds.can_auto_close(classification.predictedCategory.value, confidence)
+    
+    def _create_plan(self, ticket, thresholds: Optional[TriageThresholds] = None,
+                     combined: bool = False) -> List[Stage]:
+        """
+        Create execution plan for the ticket
+        
+        Retrieval only needs the category for a ranking bonus, so lexical
+        scoring runs alongside classification and is re-ranked afterwards.
+        
+        In combined mode classification waits for retrieval instead: articles
+        are ranked by the stub classifier's category and a single LLM call
+        returns the category and a draft citing those articles. If that call
+        fails, classification and drafting fall back to separate calls.
+        """
+        combined_result = {}
+        
+        async def classify(results):
+            classification = await self._classify_ticket(ticket)
+            logger.info(f"Classification: {classification.predictedCategory} "
+                       f"(confidence: {classification.confidence:.3f})")
+            return classification
+        
+        async def classify_and_draft(results):
+            provisional = self.llm_provider.stub_classifier.classify(
+                f"{ticket.title} {ticket.description}"
+            ).predictedCategory.value
+            articles = self.kb_service.rank_articles(results["retrieve_kb_articles"], provisional)
+            try:
+                classification, draft_reply = await self._classify_and_draft(ticket, articles)
+            except Exception:
+                return await classify(results)
+            
+            logger.info(f"Combined classification: {classification.predictedCategory} "
+                       f"(confidence: {classification.confidence:.3f}), "
+                       f"draft reply ({len(draft_reply)} chars)")
+            combined_result.update(articles=articles, draft=draft_reply)
+            return classification
+        
+        async def retrieve(results):
+            return self._retrieve_candidates(ticket)
+        
+        async def rerank(results):
+            # The combined draft cites the articles it was given
+            if "articles" in combined_result:
+                return combined_result["articles"]
             
-            return TriageResponse(
-                suggestion=suggestion,
-                processingTimeMs=int((time.time() - start_time) * 1000)
+            articles = self.kb_service.rank_articles(
+                results["retrieve_kb_articles"],
+                results["classify_category"].predictedCategory.value
             )
+            logger.info(f"Retrieved {len(articles)} articles")
+            return articles
+        
+        async def draft(results):
+            # Already paid for, so kept even below the auto-close threshold
+            if "draft" in combined_result:
+                return combined_result["draft"]
             
-        except Exception as e:
-            logger.error(f"Triage processing failed: {str(e)}")
-            raise
-    
-    def _create_plan(self, ticket) -> List[str]:
-        """Create execution plan for the ticket"""
-        return [
-            "classify_category",
-            "retrieve_kb_articles", 
-            "draft_response",
-            "calculate_confidence"
+            classification = results["classify_category"]
+            articles = results["rerank_kb_articles"]
+            if not self._should_draft(thresholds, classification, articles):
+                logger.info("Skipping draft, ticket is below the auto-close threshold")
+                return None
+            
+            draft_reply = await self._draft_response(ticket, articles, classification)
+            logger.info(f"Generated draft reply ({len(draft_reply)} chars)")
+            return draft_reply
+        
+        if combined:
+            classify_stages = [
+                Stage("retrieve_kb_articles", retrieve),
+                Stage("classify_category", classify_and_draft,
+                      depends_on=["retrieve_kb_articles"])
+            ]
+        else:
+            classify_stages = [
+                Stage("classify_category", classify),
+                Stage("retrieve_kb_articles", retrieve)
+            ]
+        
+        return classify_stages + [
+            Stage("rerank_kb_articles", rerank,
+                  depends_on=["classify_category", "retrieve_kb_articles"]),
+            Stage("draft_response", draft,
+                  depends_on=["classify_category", "rerank_kb_articles"])
         ]
     
     async def _classify_ticket(self, ticket) -> ClassificationResult:
         """Classify ticket category"""
         text = f"{ticket.title} {ticket.description}"
-        return await self.llm_provider.classify_ticket(text)
+        
+        async def classify():
+            if self.classification_batcher:
+                return await self.classification_batcher.submit(text)
+            return await self.llm_provider.classify_ticket(text, fallback=False)
+        
+        try:
+            if not self.cache:
+                return await classify()
+            
+            key = cache_key(
+                "classify", text, self.llm_provider.prompt_version,
+                self.llm_provider.get_model_name()
+            )
+            return await self.cache.get_or_compute(
+                key, classify,
+                encode=lambda result: result.model_dump(mode="json"),
+                decode=ClassificationResult.model_validate
+            )
+        except LLMFallbackError:
+            # Not cached, so the LLM is tried again once it recovers
+            return self.llm_provider.keyword_classify(text)
     
-    async def _retrieve_articles(self, ticket, classification) -> List:
-        """Retrieve relevant KB articles"""
-        query = f"{ticket.title} {ticket.description}"
-        return await self.kb_service.search_articles(
-            query, classification.predictedCategory.value
+    async def _classify_and_draft(self, ticket, articles) -> Tuple[ClassificationResult, str]:
+        """Classify and draft with one LLM call, cached like the separate stages"""
+        async def classify_and_draft():
+            return await self.llm_provider.classify_and_draft(ticket, articles)
+        
+        if not self.cache:
+            return await classify_and_draft()
+        
+        key = cache_key(
+            "triage", ticket.title, ticket.description,
+            ",".join(article.id for article in articles),
+            self.kb_service.index.fingerprint, self.llm_provider.prompt_version,
+            self.llm_provider.get_model_name()
         )
+        return await self.cache.get_or_compute(
+            key, classify_and_draft,
+            encode=lambda result: {
+                "classification": result[0].model_dump(mode="json"), "draft": result[1]
+            },
+            decode=lambda data: (
+                ClassificationResult.model_validate(data["classification"]), data["draft"]
+            )
+        )
+    
+    def _retrieve_candidates(self, ticket) -> QueryScores:
+        """Score KB articles, before the category is known"""
+        query = f"{ticket.title} {ticket.description}"
+        return self.kb_service.score_articles(query)
     
     async def _draft_response(self, ticket, articles, classification) -> str:
         """Draft response using ticket and articles"""
-        return await self.llm_provider.draft_response(
-            ticket, articles, classification.predictedCategory.value
+        category = classification.predictedCategory.value
+        
+        async def draft():
+            return await self.llm_provider.draft_response(
+                ticket, articles, category, fallback=False
+            )
+        
+        try:
+            if not self.cache:
+                return await draft()
+            
+            return await self.cache.get_or_compute(
+                self._draft_cache_key(ticket, articles, category), draft,
+                encode=lambda text: text, decode=lambda text: text
+            )
+        except LLMFallbackError:
+            # Not cached, so the LLM is tried again once it recovers
+            return self.llm_provider.template_draft(ticket, articles, category)
+    
+    def _draft_cache_key(self, ticket, articles, category: str) -> str:
+        return cache_key(
+            "draft", ticket.title, ticket.description, category,
+            ",".join(article.id for article in articles),
+            self.kb_service.index.fingerprint, self.llm_provider.prompt_version,
+            self.llm_provider.get_model_name()
         )
     
     def _calculate_confidence(self, classification_confidence: float, 
@@ -0,0 +1,69 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single calls into batches
+
+    Items submitted within `window_ms` of the first pending item are passed
+    together to `process_batch`, which must return one result per item (an
+    Exception instance marks a per-item failure). A batch is flushed early
+    once it reaches `max_batch_size`.
+    """
+
+    def __init__(self, process_batch: Callable[[List[Any]], Awaitable[List[Any]]],
+                 max_batch_size: int = 8, window_ms: float = 10.0):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.window_seconds = window_ms / 1000
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._flush_handle = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def submit(self, item: Any) -> Any:
+        """Queue an item for the next batch and wait for its result"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                self.window_seconds, self._flush
+            )
+
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        batch, self._pending = self._pending, []
+        # Callers that were cancelled while waiting don't need a result
+        batch = [(item, future) for item, future in batch if not future.done()]
+        if batch:
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]):
+        items = [item for item, _ in batch]
+        try:
+            results = await self.process_batch(items)
+        except Exception as e:
+            logger.error(f"Batch of {len(items)} failed: {e}")
+            results = [e] * len(items)
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -0,0 +1,145 @@
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Normalize ticket text so trivially different copies share a key"""
+    return WHITESPACE_PATTERN.sub(" ", text.lower()).strip()
+
+
+def cache_key(namespace: str, *parts: Any) -> str:
+    """Content-addressed key over the normalized parts"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(normalize_text(str(part)).encode("utf-8"))
+        digest.update(b"\x00")
+    return f"triage:{namespace}:{digest.hexdigest()}"
+
+
+class TriageCache:
+    """
+    LRU + TTL cache for triage stages with stampede protection
+
+    Concurrent lookups of the same key share one in-flight computation.
+    Entries can additionally be shared across workers through Redis.
+    """
+
+    def __init__(self, max_entries: int = None, ttl_seconds: float = None,
+                 redis_url: Optional[str] = None):
+        self.max_entries = max_entries if max_entries is not None else \
+            int(os.getenv("TRIAGE_CACHE_MAX_ENTRIES", "1024"))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else \
+            float(os.getenv("TRIAGE_CACHE_TTL_SECONDS", "300"))
+        self.redis_url = redis_url if redis_url is not None else \
+            os.getenv("TRIAGE_CACHE_REDIS_URL")
+
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._redis = None
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "redisHits": 0,
+            "evictions": 0
+        }
+
+    def _get_redis(self):
+        if self._redis is None and self.redis_url:
+            # Imported lazily so the in-memory cache works without redis installed
+            import redis.asyncio as aioredis
+            self._redis = aioredis.from_url(self.redis_url)
+        return self._redis
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return a live in-memory entry, refreshing its LRU position"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]],
+                             encode: Callable[[Any], Any] = None,
+                             decode: Callable[[Any], Any] = None) -> Any:
+        """
+        Return the cached value for key, computing it at most once
+
+        encode/decode convert values to and from JSON-compatible data for the
+        shared Redis backend; without them only the local cache is used.
+        """
+        value = self.get(key)
+        if value is not None:
+            self.stats["hits"] += 1
+            return value
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            self.stats["misses"] += 1
+            task = asyncio.ensure_future(self._load(key, compute, encode, decode))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+
+        # Shield so one cancelled caller doesn't fail everyone sharing the task
+        return await asyncio.shield(task)
+
+    async def _load(self, key: str, compute, encode, decode) -> Any:
+        shared = encode is not None and decode is not None and self._get_redis()
+
+        if shared:
+            try:
+                raw = await self._redis.get(key)
+                if raw is not None:
+                    value = decode(json.loads(raw))
+                    self.stats["redisHits"] += 1
+                    self.set(key, value)
+                    return value
+            except Exception as e:
+                logger.warning(f"Redis cache read failed: {e}")
+
+        value = await compute()
+        self.set(key, value)
+
+        if shared:
+            try:
+                await self._redis.set(key, json.dumps(encode(value)),
+                                      ex=max(1, int(self.ttl_seconds)))
+            except Exception as e:
+                logger.warning(f"Redis cache write failed: {e}")
+
+        return value
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"] + self.stats["coalesced"]
+        served = self.stats["hits"] + self.stats["coalesced"] + self.stats["redisHits"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "hitRatio": served / lookups if lookups else 0.0
+        }
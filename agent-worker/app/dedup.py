@@ -0,0 +1,208 @@
+import os
+import re
+import time
+import uuid
+import zlib
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Character shingles tolerate reordered words and typos better than word
+# shingles on ticket-length texts
+SHINGLE_SIZE = 5
+NON_WORD_PATTERN = re.compile(r"[^a-z0-9]+")
+
+# Odd 64-bit multiplier (golden ratio) spreading 32-bit shingle hashes
+MULTIPLIER = 0x9E3779B97F4A7C15
+MASK_64 = (1 << 64) - 1
+MASK_32 = (1 << 32) - 1
+
+
+def shingle_hashes(text: str, size: int = SHINGLE_SIZE) -> Set[int]:
+    """32-bit hashes of the distinct character shingles of normalized text"""
+    normalized = " ".join(NON_WORD_PATTERN.sub(" ", text.lower()).split())
+    if len(normalized) <= size:
+        grams = {normalized} if normalized else set()
+    else:
+        grams = {normalized[i:i + size] for i in range(len(normalized) - size + 1)}
+    return {zlib.crc32(gram.encode("utf-8")) for gram in grams}
+
+
+class MinHasher:
+    """
+    One-permutation MinHash signatures
+
+    Each shingle is hashed once: the high bits pick one of `num_perm` bins
+    and the bin keeps the smallest low bits. Empty bins borrow the value of
+    the next non-empty bin, offset by the distance (rotation densification),
+    so signatures of any two texts stay comparable position by position.
+    The fraction of equal positions estimates the Jaccard similarity of the
+    shingle sets, at one hash per shingle rather than one per permutation.
+    Seeded, so signatures are comparable across processes and restarts.
+    """
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        self.num_perm = num_perm
+        self.seed = seed
+
+    def signature(self, text: str) -> Optional[Tuple[int, ...]]:
+        hashes = shingle_hashes(text)
+        if not hashes:
+            return None
+
+        num_perm = self.num_perm
+        bins: List[Optional[int]] = [None] * num_perm
+        for value in hashes:
+            mixed = ((value ^ self.seed) * MULTIPLIER) & MASK_64
+            slot = (mixed >> 32) % num_perm
+            low = mixed & MASK_32
+            current = bins[slot]
+            if current is None or low < current:
+                bins[slot] = low
+
+        # Walk the ring backwards twice so every empty bin sees the nearest
+        # non-empty bin after it, wrapping around
+        signature = list(bins)
+        next_value, next_slot = 0, 0
+        for slot in range(2 * num_perm - 1, -1, -1):
+            value = bins[slot % num_perm]
+            if value is not None:
+                next_value, next_slot = value, slot
+            elif slot < num_perm:
+                signature[slot] = next_value + ((next_slot - slot) << 32)
+        return tuple(signature)
+
+
+class ClusterResult(NamedTuple):
+    """Triage outcome of a cluster's first ticket, reused by the others"""
+    classification: Any
+    articles: List[Any]
+    draft: Optional[str]
+
+
+class TicketCluster:
+    """
+    Tickets describing the same problem, represented by the first one
+
+    `result` resolves to the ClusterResult once the first ticket has been
+    triaged, or to None if that failed.
+    """
+
+    __slots__ = ("id", "signature", "band_keys", "created_at", "size", "result")
+
+    def __init__(self, signature: Tuple[int, ...], band_keys: List[Tuple[int, ...]]):
+        self.id = f"cl_{uuid.uuid4().hex[:12]}"
+        self.signature = signature
+        self.band_keys = band_keys
+        self.created_at = time.monotonic()
+        self.size = 1
+        self.result: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class DuplicateDetector:
+    """
+    Streaming near-duplicate detection of tickets with MinHash and LSH
+
+    Each cluster's signature is split into bands, and each band is hashed
+    into a bucket, so only clusters that share a band with a new ticket are
+    compared. A ticket joins the most similar candidate at or above
+    `threshold` estimated Jaccard similarity, otherwise it starts a cluster.
+    Clusters expire `window_seconds` after they were created, which bounds
+    how stale a reused classification and article list can be.
+
+    State is per process; with several workers a cluster forms per worker.
+    """
+
+    def __init__(self, threshold: float = None, window_seconds: float = None,
+                 max_clusters: int = None, num_perm: int = 64, bands: int = 16):
+        self.threshold = threshold if threshold is not None else \
+            float(os.getenv("TRIAGE_DEDUP_SIMILARITY", "0.6"))
+        self.window_seconds = window_seconds if window_seconds is not None else \
+            float(os.getenv("TRIAGE_DEDUP_WINDOW_SECONDS", "900"))
+        self.max_clusters = max_clusters if max_clusters is not None else \
+            int(os.getenv("TRIAGE_DEDUP_MAX_CLUSTERS", "10000"))
+
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.hasher = MinHasher(num_perm)
+        self.bands = bands
+        self.rows = num_perm // bands
+
+        # Creation order, so expired clusters are always at the front
+        self.clusters: "OrderedDict[str, TicketCluster]" = OrderedDict()
+        self.buckets: List[Dict[Tuple[int, ...], List[str]]] = [{} for _ in range(bands)]
+        self.stats = {"tickets": 0, "duplicates": 0, "clusters": 0}
+
+    def _band_keys(self, signature: Tuple[int, ...]) -> List[Tuple[int, ...]]:
+        return [
+            signature[band * self.rows:(band + 1) * self.rows]
+            for band in range(self.bands)
+        ]
+
+    def _expire(self):
+        now = time.monotonic()
+        while self.clusters:
+            oldest = next(iter(self.clusters.values()))
+            if now - oldest.created_at < self.window_seconds and \
+                    len(self.clusters) < self.max_clusters:
+                break
+            self.discard(oldest)
+
+    def discard(self, cluster: TicketCluster):
+        """Forget a cluster, e.g. because triaging its first ticket failed"""
+        if self.clusters.pop(cluster.id, None) is None:
+            return
+        for bucket, key in zip(self.buckets, cluster.band_keys):
+            members = bucket.get(key)
+            if members is not None:
+                members.remove(cluster.id)
+                if not members:
+                    del bucket[key]
+
+    def assign(self, text: str) -> Tuple[Optional[TicketCluster], bool]:
+        """
+        Return the cluster a ticket belongs to and whether it was just created
+
+        Must be called on the event loop. Returns (None, True) for text with
+        nothing to compare.
+        """
+        signature = self.hasher.signature(text)
+        if signature is None:
+            return None, True
+
+        self._expire()
+        self.stats["tickets"] += 1
+        band_keys = self._band_keys(signature)
+
+        candidates = set()
+        for bucket, key in zip(self.buckets, band_keys):
+            candidates.update(bucket.get(key, ()))
+
+        best, best_similarity = None, self.threshold
+        for cluster_id in candidates:
+            cluster = self.clusters[cluster_id]
+            similarity = sum(
+                a == b for a, b in zip(cluster.signature, signature)
+            ) / len(signature)
+            if similarity >= best_similarity:
+                best, best_similarity = cluster, similarity
+
+        if best is not None:
+            best.size += 1
+            self.stats["duplicates"] += 1
+            logger.info(f"Ticket joined cluster {best.id} (similarity {best_similarity:.2f}, "
+                        f"size {best.size})")
+            return best, False
+
+        cluster = TicketCluster(signature, band_keys)
+        self.clusters[cluster.id] = cluster
+        for bucket, key in zip(self.buckets, band_keys):
+            bucket.setdefault(key, []).append(cluster.id)
+        self.stats["clusters"] += 1
+        return cluster, True
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "activeClusters": len(self.clusters)}
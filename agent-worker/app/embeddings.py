@@ -0,0 +1,171 @@
+import os
+import json
+import zlib
+import logging
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class HashedNgramEmbedder:
+    """
+    Dependency-free embedder hashing word and character n-grams into a
+    fixed number of dimensions
+
+    Character n-grams make spelling and morphology variants ("log in",
+    "login", "logging") land close together without any model download.
+    """
+
+    def __init__(self, dim: int = 512, ngram_range: Tuple[int, int] = (3, 5)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self.name = f"hashed-ngram-{dim}"
+
+    def _features(self, text: str) -> List[str]:
+        words = text.lower().split()
+        features = list(words)
+        # Word boundaries are dropped so "log in" and "login" share n-grams
+        joined = "#" + "".join(words) + "#"
+        for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+            features.extend(joined[i:i + n] for i in range(len(joined) - n + 1))
+        return features
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                h = zlib.crc32(feature.encode("utf-8"))
+                # The top bit picks a sign so collisions cancel out on average
+                vectors[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+class SentenceTransformerEmbedder:
+    """
+    Local CPU sentence-transformers model
+    """
+
+    def __init__(self, model_name: str):
+        # Imported lazily; only needed when a model is configured
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.name = model_name
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(
+            texts, normalize_embeddings=True, convert_to_numpy=True
+        ).astype(np.float32)
+
+
+def create_embedder():
+    """Build the embedder configured by KB_EMBEDDER (hashed or st:<model>)"""
+    spec = os.getenv("KB_EMBEDDER", "hashed")
+    if spec.startswith("st:"):
+        return SentenceTransformerEmbedder(spec[3:])
+    return HashedNgramEmbedder(dim=int(os.getenv("KB_EMBEDDING_DIM", "512")))
+
+
+class VectorIndex:
+    """
+    Article vectors in one contiguous float32 matrix
+
+    With a path the matrix is a memory-mapped .npy file backed by the OS page
+    cache; otherwise it lives in memory. Rows of removed articles are zeroed
+    and reused.
+    """
+
+    def __init__(self, dim: int, path: Optional[str] = None, capacity: int = 1024):
+        self.dim = dim
+        self.path = path
+        self.ids: List[Optional[str]] = []
+        self.rows: Dict[str, int] = {}
+        self.free_rows: List[int] = []
+        self.matrix = self._allocate(capacity)
+
+    @classmethod
+    def from_matrix(cls, matrix: np.ndarray, ids: List[str]) -> "VectorIndex":
+        """Wrap an existing (e.g. memory-mapped, read-only) matrix without copying"""
+        index = cls.__new__(cls)
+        index.dim = matrix.shape[1]
+        index.path = None
+        index.ids = list(ids)
+        index.rows = {article_id: row for row, article_id in enumerate(ids)}
+        index.free_rows = []
+        index.matrix = matrix
+        return index
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _allocate(self, capacity: int) -> np.ndarray:
+        if not self.path:
+            return np.zeros((capacity, self.dim), dtype=np.float32)
+
+        # Each allocation is a new file swapped into place, so matrices still
+        # mapped by an older index keep their own inode and stay valid
+        matrix = np.lib.format.open_memmap(
+            self.path + ".tmp", mode="w+", dtype=np.float32, shape=(capacity, self.dim)
+        )
+        os.replace(self.path + ".tmp", self.path)
+        return matrix
+
+    def _grow(self):
+        grown = self._allocate(self.matrix.shape[0] * 2)
+        grown[:self.matrix.shape[0]] = self.matrix
+        self.matrix = grown
+
+    def upsert_batch(self, article_ids: List[str], vectors: np.ndarray):
+        for article_id, vector in zip(article_ids, vectors):
+            row = self.rows.get(article_id)
+            if row is None:
+                if self.free_rows:
+                    row = self.free_rows.pop()
+                    self.ids[row] = article_id
+                else:
+                    row = len(self.ids)
+                    if row >= self.matrix.shape[0]:
+                        self._grow()
+                    self.ids.append(article_id)
+                self.rows[article_id] = row
+            self.matrix[row] = vector
+
+    def remove(self, article_id: str):
+        row = self.rows.pop(article_id, None)
+        if row is not None:
+            self.matrix[row] = 0.0
+            self.ids[row] = None
+            self.free_rows.append(row)
+
+    def search_batch(self, queries: np.ndarray, limit: int) -> List[Dict[str, float]]:
+        """Return the top cosine similarities per query as {article_id: score}"""
+        used = len(self.ids)
+        if used == 0:
+            return [{} for _ in range(len(queries))]
+
+        # One matrix product scores every article against every query
+        similarities = self.matrix[:used] @ queries.T
+        limit = min(limit, used)
+
+        results = []
+        for column in similarities.T:
+            top_rows = np.argpartition(-column, limit - 1)[:limit]
+            results.append({
+                self.ids[row]: float(column[row])
+                for row in top_rows
+                if self.ids[row] is not None and column[row] > 0
+            })
+        return results
+
+    def flush(self):
+        """Persist the matrix and row ids next to it"""
+        if not self.path:
+            return
+        self.matrix.flush()
+        with open(self.path + ".ids.json", "w", encoding="utf-8") as f:
+            json.dump(self.ids, f)
@@ -0,0 +1,558 @@
+import re
+import math
+import heapq
+import hashlib
+import logging
+from array import array
+from collections import Counter
+from collections.abc import Mapping
+from typing import Dict, FrozenSet, Iterator, List, Optional, Tuple, Any
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+# Finds tokens in original-case text so snippet offsets match the body
+TOKEN_PATTERN_ANY_CASE = re.compile(r"[a-z0-9]+", re.IGNORECASE)
+
+# Field weights kept identical to the original keyword matcher
+FIELD_WEIGHTS = {
+    "title": 3.0,
+    "tags": 2.0,
+    "body": 1.0
+}
+FIELDS = tuple(FIELD_WEIGHTS)
+
+CATEGORY_BONUS = 2.0
+MIN_SCORE = 0.1
+
+# Number of nearest articles by embedding considered for hybrid ranking
+SEMANTIC_CANDIDATES = 20
+
+SNIPPET_LENGTH = 150
+# Characters of context kept before the first matched term in a snippet
+SNIPPET_LEAD = 40
+
+# Per-term score lists cached between mutations; only long postings lists
+# are worth caching, and they are the ones shared by most queries
+TERM_CACHE_MIN_POSTINGS = 64
+TERM_CACHE_MAX_TERMS = 512
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase and split text into alphanumeric tokens"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def article_digest(article: Dict[str, Any]) -> int:
+    """128-bit hash of the indexed content of an article"""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (article["id"], article["title"], " ".join(article.get("tags", [])),
+                 article.get("category") or "", article["body"]):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return int.from_bytes(digest.digest(), "big")
+
+
+def make_snippet(body: str, terms: FrozenSet[str] = frozenset(),
+                 length: int = SNIPPET_LENGTH) -> str:
+    """
+    Excerpt of an article body around the region matching most query terms
+
+    Falls back to the start of the body when nothing matches or the best
+    region already falls within the leading excerpt.
+    """
+    start = 0
+    if terms and len(body) > length:
+        start = _best_region(body, terms, length)
+
+    snippet = body[start:start + length]
+    if start > 0:
+        snippet = "..." + snippet
+    if start + length < len(body):
+        snippet += "..."
+    return snippet
+
+
+def _best_region(body: str, terms: FrozenSet[str], length: int) -> int:
+    """Start offset of the window covering the most distinct query terms"""
+    matches = [
+        (m.start(), m.group().lower()) for m in TOKEN_PATTERN_ANY_CASE.finditer(body)
+        if m.group().lower() in terms
+    ]
+    best_count, best_start, best_end = 0, 0, 0
+    window: Dict[str, int] = {}
+    left = 0
+    for position, term in matches:
+        window[term] = window.get(term, 0) + 1
+        while position - matches[left][0] > length - SNIPPET_LEAD:
+            left_term = matches[left][1]
+            window[left_term] -= 1
+            if not window[left_term]:
+                del window[left_term]
+            left += 1
+        if len(window) > best_count:
+            best_count = len(window)
+            best_start, best_end = matches[left][0], position + len(term)
+
+    if best_end <= length:
+        return 0
+    # Keep some context before the first matched term, starting on a word
+    start = max(0, best_start - SNIPPET_LEAD)
+    space = body.find(" ", start, best_start)
+    return space + 1 if start > 0 and space >= 0 else start
+
+
+class QueryScores:
+    """
+    Category-independent scores for one query
+
+    lexical holds raw BM25 sums for articles sharing a term with the query,
+    semantic the cosine similarity of the nearest articles by embedding.
+    terms are the query's tokens, kept for building snippets.
+    """
+
+    __slots__ = ("lexical", "num_terms", "semantic", "terms")
+
+    def __init__(self, lexical: Dict[str, float], num_terms: int,
+                 semantic: Optional[Dict[str, float]] = None,
+                 terms: FrozenSet[str] = frozenset()):
+        self.lexical = lexical
+        self.num_terms = num_terms
+        self.semantic = semantic or {}
+        self.terms = terms
+
+    @property
+    def normalizer(self) -> int:
+        """
+        Divisor for lexical scores and the category bonus
+
+        A query without terms is not normalized, so category members still
+        rank on the full bonus as they did with the original keyword matcher.
+        """
+        return self.num_terms or 1
+
+
+class ArticleRecord:
+    """
+    Indexed article metadata; the body lives in the index's body buffer
+    """
+
+    __slots__ = ("id", "title", "tags", "category", "updated_at",
+                 "slot", "body_offset", "body_length")
+
+    def __init__(self, article: Dict[str, Any], slot: int,
+                 body_offset: int, body_length: int):
+        self.id = article["id"]
+        self.title = article["title"]
+        self.tags = tuple(article.get("tags", ()))
+        self.category = article.get("category")
+        self.updated_at = article.get("updatedAt")
+        self.slot = slot
+        self.body_offset = body_offset
+        self.body_length = body_length
+
+
+class TermPostings:
+    """
+    Postings of one term: article slots and per-field term frequencies,
+    interleaved as (title, tags, body) triples
+    """
+
+    __slots__ = ("slots", "tfs")
+
+    def __init__(self):
+        self.slots = array("I")
+        self.tfs = array("H")
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def append(self, slot: int, field_tfs: List[int]):
+        self.slots.append(slot)
+        if max(field_tfs) > 0xFFFF:
+            field_tfs = [min(tf, 0xFFFF) for tf in field_tfs]
+        self.tfs.extend(field_tfs)
+
+    def remove(self, slot: int):
+        i = self.slots.index(slot)
+        del self.slots[i]
+        del self.tfs[3 * i:3 * i + 3]
+
+
+class ArticleView(Mapping):
+    """
+    Read-only mapping of article id to article dict, materialized on access
+    """
+
+    def __init__(self, index: "KBIndex"):
+        self._index = index
+
+    def __getitem__(self, article_id: str) -> Dict[str, Any]:
+        record = self._index.records[article_id]
+        article = {
+            "id": record.id,
+            "title": record.title,
+            "body": self._index.body(record),
+            "tags": list(record.tags),
+            "category": record.category
+        }
+        if record.updated_at is not None:
+            article["updatedAt"] = record.updated_at
+        return article
+
+    def __contains__(self, article_id) -> bool:
+        return article_id in self._index.records
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index.records)
+
+    def __len__(self) -> int:
+        return len(self._index.records)
+
+
+class KBIndex:
+    """
+    Inverted index over knowledge base articles with field-weighted BM25 scoring
+
+    Terms are interned to integer ids, postings are packed arrays of article
+    slots and term frequencies, and article bodies are stored as UTF-8 in one
+    contiguous buffer, so memory stays proportional to the text itself.
+
+    With an embedder, article vectors are computed when articles are added
+    and fused with the lexical score at query time (hybrid retrieval).
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, embedder=None,
+                 vector_path: Optional[str] = None, semantic_weight: float = 1.0):
+        self.k1 = k1
+        self.b = b
+        self.embedder = embedder
+        self.semantic_weight = semantic_weight
+        self.vectors = None
+        if embedder is not None:
+            from .embeddings import VectorIndex
+            self.vectors = VectorIndex(embedder.dim, path=vector_path)
+
+        self.records: Dict[str, ArticleRecord] = {}
+        self.articles = ArticleView(self)
+        self.bodies = bytearray()
+        self.garbage = 0
+
+        # term -> term id, and postings per term id
+        self.term_ids: Dict[str, int] = {}
+        self.postings: List[TermPostings] = []
+
+        # Article slot -> id, and per-field token counts by slot
+        self.slot_ids: List[Optional[str]] = []
+        self.free_slots: List[int] = []
+        self.field_lengths = {field: array("I") for field in FIELDS}
+        self.total_field_lengths = {field: 0 for field in FIELDS}
+
+        # category -> article ids, used to apply the category bonus
+        self.category_members: Dict[str, set] = {}
+        # Bumped on every mutation so callers can detect index changes
+        self.version = 0
+        # XOR of article digests, kept up to date on add and remove
+        self._fingerprint = 0
+
+        self._norms_version = -1
+        self._norms: List[array] = []
+        self._term_cache: Dict[int, Tuple[array, array]] = {}
+
+    def __len__(self) -> int:
+        return len(self.articles)
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        Hash of the indexed articles, independent of insertion order
+
+        Unlike `version`, which counts mutations in this process, it is the
+        same in every process serving the same articles, so it can key
+        results shared through Redis.
+        """
+        return f"{self._fingerprint:032x}"
+
+    def build(self, articles: List[Dict[str, Any]]):
+        """Index a batch of articles"""
+        for article in articles:
+            self.add(article, embed=False)
+        if self.vectors is not None:
+            self._embed(articles)
+        logger.info(f"Indexed {len(self.articles)} articles, "
+                    f"{len(self.vocabulary())} terms")
+
+    def add(self, article: Dict[str, Any], embed: bool = True):
+        """Add or replace a single article in the index"""
+        article_id = article["id"]
+        if article_id in self.records:
+            self.remove(article_id)
+        if embed and self.vectors is not None:
+            self._embed([article])
+
+        if self.free_slots:
+            slot = self.free_slots.pop()
+            self.slot_ids[slot] = article_id
+        else:
+            slot = len(self.slot_ids)
+            self.slot_ids.append(article_id)
+            for lengths in self.field_lengths.values():
+                lengths.append(0)
+
+        body = article["body"].encode("utf-8")
+        self.records[article_id] = ArticleRecord(article, slot, len(self.bodies), len(body))
+        self.bodies += body
+        self.category_members.setdefault(article.get("category"), set()).add(article_id)
+        self._fingerprint ^= article_digest(article)
+
+        term_tfs: Dict[str, List[int]] = {}
+        for f, (field, tokens) in enumerate(self._field_tokens(article).items()):
+            self.field_lengths[field][slot] = len(tokens)
+            self.total_field_lengths[field] += len(tokens)
+            for token, tf in Counter(tokens).items():
+                field_tfs = term_tfs.get(token)
+                if field_tfs is None:
+                    field_tfs = term_tfs[token] = [0, 0, 0]
+                field_tfs[f] = tf
+
+        for token, field_tfs in term_tfs.items():
+            term_id = self.term_ids.get(token)
+            if term_id is None:
+                term_id = self.term_ids[token] = len(self.postings)
+                self.postings.append(TermPostings())
+            self.postings[term_id].append(slot, field_tfs)
+
+        self.version += 1
+
+    def remove(self, article_id: str) -> bool:
+        """Remove an article from the index, returning False if it was absent"""
+        record = self.records.get(article_id)
+        if record is None:
+            return False
+        article = self.articles[article_id]
+        del self.records[article_id]
+        self._fingerprint ^= article_digest(article)
+
+        slot = record.slot
+        for field, lengths in self.field_lengths.items():
+            self.total_field_lengths[field] -= lengths[slot]
+            lengths[slot] = 0
+        self.slot_ids[slot] = None
+        self.free_slots.append(slot)
+
+        self.category_members.get(record.category, set()).discard(article_id)
+        if self.vectors is not None:
+            self.vectors.remove(article_id)
+
+        terms = set()
+        for tokens in self._field_tokens(article).values():
+            terms.update(tokens)
+        for term in terms:
+            self.postings[self.term_ids[term]].remove(slot)
+
+        self.garbage += record.body_length
+        if self.garbage > 1 << 20 and self.garbage > len(self.bodies) // 2:
+            self._compact_bodies()
+
+        self.version += 1
+        return True
+
+    def body(self, record: ArticleRecord) -> str:
+        start = record.body_offset
+        return self.bodies[start:start + record.body_length].decode("utf-8")
+
+    def _compact_bodies(self):
+        """Rewrite the body buffer without the bodies of removed articles"""
+        compacted = bytearray()
+        for record in self.records.values():
+            start = record.body_offset
+            record.body_offset = len(compacted)
+            compacted += self.bodies[start:start + record.body_length]
+        self.bodies = compacted
+        self.garbage = 0
+
+    def vocabulary(self) -> List[str]:
+        """Terms that currently occur in at least one article"""
+        return [term for term, term_id in self.term_ids.items() if self.postings[term_id]]
+
+    def _embed(self, articles: List[Dict[str, Any]]):
+        """Compute and store vectors for articles, once at index time"""
+        texts = [
+            f"{a['title']} {' '.join(a.get('tags', []))} {a['body']}" for a in articles
+        ]
+        self.vectors.upsert_batch(
+            [a["id"] for a in articles], self.embedder.embed_batch(texts)
+        )
+
+    def _field_tokens(self, article: Dict[str, Any]) -> Dict[str, List[str]]:
+        """Tokenize each indexed field of an article"""
+        return {
+            "title": tokenize(article["title"]),
+            "tags": tokenize(" ".join(article.get("tags", []))),
+            "body": tokenize(article["body"])
+        }
+
+    def search(self, query: str, category: Optional[str] = None,
+               limit: int = 3) -> Tuple[List[Tuple[float, str]], int]:
+        """
+        Score articles for the query and return the top results as
+        (score, article_id) pairs along with the number of relevant articles
+        """
+        return self.search_batch([(query, category)], limit)[0]
+
+    def score(self, query: str) -> QueryScores:
+        """
+        Compute category-independent lexical scores for a query
+
+        The result can be ranked later with rank() once the category is known.
+        """
+        return self.score_batch([query])[0]
+
+    def score_batch(self, queries: List[str]) -> List[QueryScores]:
+        """
+        Compute lexical scores for several queries at once
+
+        Each postings list is walked a single time for all queries sharing
+        the term, so overlapping batches (e.g. during incidents) are cheap.
+        """
+        query_terms = [frozenset(tokenize(query)) for query in queries]
+        scores: List[Dict[int, float]] = [{} for _ in queries]
+
+        term_queries: Dict[str, List[int]] = {}
+        for i, terms in enumerate(query_terms):
+            for term in terms:
+                term_queries.setdefault(term, []).append(i)
+
+        for term, query_ids in term_queries.items():
+            slots, term_scores = self._slot_scores(term)
+            for i in query_ids:
+                acc = scores[i]
+                for slot, term_score in zip(slots, term_scores):
+                    acc[slot] = acc.get(slot, 0.0) + term_score
+
+        semantic = [None] * len(queries)
+        if self.vectors is not None and len(self.vectors):
+            semantic = self.vectors.search_batch(
+                self.embedder.embed_batch(queries), SEMANTIC_CANDIDATES
+            )
+
+        slot_ids = self.slot_ids
+        return [
+            QueryScores(
+                {slot_ids[slot]: score for slot, score in scores[i].items()},
+                len(query_terms[i]), semantic[i], query_terms[i]
+            )
+            for i in range(len(queries))
+        ]
+
+    def search_batch(self, queries: List[Tuple[str, Optional[str]]],
+                     limit: int = 3) -> List[Tuple[List[Tuple[float, str]], int]]:
+        """Score and rank several (query, category) pairs at once"""
+        scored = self.score_batch([query for query, _ in queries])
+        return [
+            self.rank(query_scores, category, limit)
+            for query_scores, (_, category) in zip(scored, queries)
+        ]
+
+    def rank(self, query_scores: QueryScores, category: Optional[str],
+             limit: int = 3) -> Tuple[List[Tuple[float, str]], int]:
+        """
+        Apply the category bonus, normalize, fuse semantic scores and select
+        the top results
+
+        Only scored articles are visited; articles that match the category
+        but have no other score all tie on the bonus and just fill remaining slots.
+        """
+        if not self.articles:
+            return [], 0
+
+        members = self.category_members.get(category, set()) if category else set()
+        bonus = CATEGORY_BONUS / query_scores.normalizer
+
+        candidates = []
+        scored_ids = query_scores.lexical.keys() | query_scores.semantic.keys()
+        for article_id in scored_ids:
+            score = self.lexical_score(query_scores, article_id, members, bonus) + \
+                self.semantic_weight * query_scores.semantic.get(article_id, 0.0)
+            if score > MIN_SCORE:
+                candidates.append((score, article_id))
+
+        num_matches = len(candidates)
+        top = heapq.nlargest(limit, candidates)
+
+        if bonus > MIN_SCORE:
+            unscored = len(members) - sum(1 for article_id in scored_ids if article_id in members)
+            num_matches += unscored
+            if len(top) < limit or top[-1][0] < bonus:
+                fill = []
+                for article_id in members:
+                    if article_id not in scored_ids:
+                        fill.append((bonus, article_id))
+                        if len(fill) == limit:
+                            break
+                top = heapq.nlargest(limit, top + fill)
+
+        return top, num_matches
+
+    def lexical_score(self, query_scores: QueryScores, article_id: str,
+                      members: set, bonus: float) -> float:
+        """Normalized lexical score including the category bonus"""
+        score = query_scores.lexical.get(article_id, 0.0) / query_scores.normalizer
+        if article_id in members:
+            score += bonus
+        return score
+
+    def _length_norms(self) -> List[array]:
+        """Per-field BM25 length normalization by slot, recomputed after mutations"""
+        if self._norms_version != self.version:
+            num_docs = len(self.records) or 1
+            self._norms = []
+            for field in FIELDS:
+                avg_length = (self.total_field_lengths[field] / num_docs) or 1.0
+                scale = self.k1 * self.b / avg_length
+                base = self.k1 * (1 - self.b)
+                self._norms.append(array("d", (
+                    base + scale * length for length in self.field_lengths[field]
+                )))
+            self._term_cache.clear()
+            self._norms_version = self.version
+        return self._norms
+
+    def _slot_scores(self, term: str) -> Tuple[array, array]:
+        """Article slots containing a term and the term's BM25 contribution to each"""
+        term_id = self.term_ids.get(term)
+        if term_id is None or not self.postings[term_id]:
+            return array("I"), array("d")
+
+        norms = self._length_norms()
+        cached = self._term_cache.get(term_id)
+        if cached is not None:
+            return cached
+
+        postings = self.postings[term_id]
+        num_docs = len(self.records)
+        df = len(postings)
+        idf = math.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+        k1_plus_1 = self.k1 + 1
+        weights = [FIELD_WEIGHTS[field] for field in FIELDS]
+
+        tfs = postings.tfs
+        term_scores = array("d")
+        for i, slot in enumerate(postings.slots):
+            term_score = 0.0
+            for f in range(3):
+                tf = tfs[3 * i + f]
+                if tf:
+                    term_score += weights[f] * tf * k1_plus_1 / (tf + norms[f][slot])
+            term_scores.append(idf * term_score)
+
+        result = (postings.slots, term_scores)
+        if df >= TERM_CACHE_MIN_POSTINGS and len(self._term_cache) < TERM_CACHE_MAX_TERMS:
+            self._term_cache[term_id] = result
+        return result
+
+    def _term_scores(self, term: str):
+        """Yield the field-weighted BM25 contribution of a term per article"""
+        slots, term_scores = self._slot_scores(term)
+        for slot, term_score in zip(slots, term_scores):
+            yield self.slot_ids[slot], term_score
@@ -1,130 +1,184 @@
+import os
 import logging
-from typing import List, Optional
+from typing import List, Optional, Dict, Any, Tuple
 from .models import ArticleMatch
+from .kb_index import KBIndex, QueryScores, CATEGORY_BONUS, make_snippet
 
 logger = logging.getLogger(__name__)
 
+# Sample knowledge base articles, used when no article source is configured
+SAMPLE_ARTICLES = [
+    {
+        "id": "kb_001",
+        "title": "How to update your payment method",
+        "body": "To update your payment method, go to Account Settings > Billing > Payment Methods. Click 'Add Payment Method' and follow the prompts. You can also remove old payment methods from this page. All changes take effect immediately.",
+        "tags": ["billing", "payments", "account"],
+        "category": "billing"
+    },
+    {
+        "id": "kb_002",
+        "title": "Troubleshooting 500 Internal Server Errors",
+        "body": "A 500 error indicates a server-side problem. First, try refreshing the page. If the error persists, check your internet connection. Clear your browser cache and cookies. If you're still seeing the error, please contact support with the exact error message and steps to reproduce.",
+        "tags": ["tech", "errors", "troubleshooting", "500"],
+        "category": "tech"
+    },
+    {
+        "id": "kb_003",
+        "title": "How to track your shipment",
+        "body": "You can track your shipment using the tracking number provided in your shipping confirmation email. Visit our tracking page and enter your tracking number. Updates are provided in real-time from our shipping partners. Typical delivery time is 3-5 business days.",
+        "tags": ["shipping", "delivery", "tracking"],
+        "category": "shipping"
+    },
+    {
+        "id": "kb_004",
+        "title": "Password reset instructions",
+        "body": "To reset your password, click 'Forgot Password' on the login page. Enter your email address and check your inbox for a reset link. The link expires in 24 hours for security. If you don't receive the email, check your spam folder.",
+        "tags": ["tech", "password", "login", "account"],
+        "category": "tech"
+    },
+    {
+        "id": "kb_005",
+        "title": "Refund policy and process",
+        "body": "We offer full refunds within 30 days of purchase. To request a refund, go to Order History and click 'Request Refund'. Include the reason for return. Refunds are processed within 3-5 business days to your original payment method.",
+        "tags": ["billing", "refund", "policy"],
+        "category": "billing"
+    },
+    {
+        "id": "kb_006",
+        "title": "Shipping address changes",
+        "body": "You can change your shipping address before your order ships. Go to Order History, find your order, and click 'Change Address'. If your order has already shipped, contact our support team immediately. Some restrictions may apply for international orders.",
+        "tags": ["shipping", "address", "orders"],
+        "category": "shipping"
+    },
+    {
+        "id": "kb_007",
+        "title": "Login troubleshooting",
+        "body": "If you can't log in, first check that you're using the correct email and password. Try resetting your password if needed. Clear your browser cache and cookies. Disable browser extensions temporarily. If issues persist, your account may be temporarily locked for security.",
+        "tags": ["tech", "login", "troubleshooting"],
+        "category": "tech"
+    },
+    {
+        "id": "kb_008",
+        "title": "Billing cycle and charges",
+        "body": "Your billing cycle starts on the date you first subscribe. Monthly subscriptions renew automatically. Annual subscriptions provide a 20% discount. You'll receive an email notification 3 days before each renewal. You can view your billing history in Account Settings.",
+        "tags": ["billing", "subscription", "charges"],
+        "category": "billing"
+    }
+]
+
 class KnowledgeBaseService:
     """
     Knowledge base service for article search and retrieval
     """
     
-    def __init__(self):
-        # Sample knowledge base articles
-        self.articles = [
-            {
-                "id": "kb_001",
-                "title": "How to update your payment method",
-                "body": "To update your payment method, go to Account Settings > Billing > Payment Methods. Click 'Add Payment Method' and follow the prompts. You can also remove old payment methods from this page. All changes take effect immediately.",
-                "tags": ["billing", "payments", "account"],
-                "category": "billing"
-            },
-            {
-                "id": "kb_002",
-                "title": "Troubleshooting 500 Internal Server Errors",
-                "body": "A 500 error indicates a server-side problem. First, try refreshing the page. If the error persists, check your internet connection. Clear your browser cache and cookies. If you're still seeing the error, please contact support with the exact error message and steps to reproduce.",
-                "tags": ["tech", "errors", "troubleshooting", "500"],
-                "category": "tech"
-            },
-            {
-                "id": "kb_003",
-                "title": "How to track your shipment",
-                "body": "You can track your shipment using the tracking number provided in your shipping confirmation email. Visit our tracking page and enter your tracking number. Updates are provided in real-time from our shipping partners. Typical delivery time is 3-5 business days.",
-                "tags": ["shipping", "delivery", "tracking"],
-                "category": "shipping"
-            },
-            {
-                "id": "kb_004",
-                "title": "Password reset instructions",
-                "body": "To reset your password, click 'Forgot Password' on the login page. Enter your email address and check your inbox for a reset link. The link expires in 24 hours for security. If you don't receive the email, check your spam folder.",
-                "tags": ["tech", "password", "login", "account"],
-                "category": "tech"
-            },
-            {
-                "id": "kb_005",
-                "title": "Refund policy and process",
-                "body": "We offer full refunds within 30 days of purchase. To request a refund, go to Order History and click 'Request Refund'. Include the reason for return. Refunds are processed within 3-5 business days to your original payment method.",
-                "tags": ["billing", "refund", "policy"],
-                "category": "billing"
-            },
-            {
-                "id": "kb_006",
-                "title": "Shipping address changes",
-                "body": "You can change your shipping address before your order ships. Go to Order History, find your order, and click 'Change Address'. If your order has already shipped, contact our support team immediately. Some restrictions may apply for international orders.",
-                "tags": ["shipping", "address", "orders"],
-                "category": "shipping"
-            },
-            {
-                "id": "kb_007",
-                "title": "Login troubleshooting",
-                "body": "If you can't log in, first check that you're using the correct email and password. Try resetting your password if needed. Clear your browser cache and cookies. Disable browser extensions temporarily. If issues persist, your account may be temporarily locked for security.",
-                "tags": ["tech", "login", "troubleshooting"],
-                "category": "tech"
-            },
-            {
-                "id": "kb_008",
-                "title": "Billing cycle and charges",
-                "body": "Your billing cycle starts on the date you first subscribe. Monthly subscriptions renew automatically. Annual subscriptions provide a 20% discount. You'll receive an email notification 3 days before each renewal. You can view your billing history in Account Settings.",
-                "tags": ["billing", "subscription", "charges"],
-                "category": "billing"
-            }
-        ]
+    def __init__(self, articles: Optional[List[Dict[str, Any]]] = None):
+        # Hybrid mode fuses lexical BM25 with embedding similarity
+        self.retrieval_mode = os.getenv("KB_RETRIEVAL_MODE", "lexical")
+        self.embedder = None
+        if self.retrieval_mode == "hybrid":
+            from .embeddings import create_embedder
+            self.embedder = create_embedder()
+            logger.info(f"Hybrid retrieval enabled with {self.embedder.name} embeddings")
+        
+        self.index = self.new_index()
+        self.index.build(SAMPLE_ARTICLES if articles is None else articles)
+    
+    def new_index(self) -> KBIndex:
+        """Create an empty index configured for the current retrieval mode"""
+        return KBIndex(
+            embedder=self.embedder,
+            vector_path=os.getenv("KB_VECTOR_PATH") or None,
+            semantic_weight=float(os.getenv("KB_SEMANTIC_WEIGHT", "1.0"))
+        )
+    
+    def replace_index(self, index: KBIndex):
+        """Atomically swap in a fully built index"""
+        self.index = index
+        logger.info(f"Swapped in KB index with {len(index)} articles")
+    
+    def apply_changes(self, upserts: List[Dict[str, Any]], deletes: List[str]):
+        """Apply incremental article changes to the live index"""
+        for article in upserts:
+            self.index.add(article)
+        for article_id in deletes:
+            self.index.remove(article_id)
     
     async def search_articles(self, query: str, 
                             category: Optional[str] = None) -> List[ArticleMatch]:
         """
-        Search knowledge base articles using keyword matching
+        Search knowledge base articles using the BM25 inverted index
+        """
+        return self.rank_articles(self.score_articles(query), category)
+    
+    def score_articles(self, query: str) -> QueryScores:
+        """
+        Compute category-independent lexical (and semantic) scores, so
+        retrieval can run before classification has finished
         """
-        query_lower = query.lower()
-        query_words = set(query_lower.split())
+        return self.index.score(query)
+    
+    def rank_articles(self, query_scores: QueryScores,
+                      category: Optional[str] = None) -> List[ArticleMatch]:
+        """Apply the category bonus to precomputed scores and return the top 3"""
+        top_hits, num_matches = self.index.rank(query_scores, category, limit=3)
+        top_matches = self._to_matches(top_hits, query_scores, category)
         
-        matches = []
+        logger.info(f"Found {num_matches} articles, returning top {len(top_matches)}")
         
-        for article in self.articles:
-            score = 0.0
-            
-            # Title matching (highest weight)
-            title_words = set(article["title"].lower().split())
-            title_matches = len(query_words.intersection(title_words))
-            score += title_matches * 3.0
-            
-            # Body matching
-            body_words = set(article["body"].lower().split())
-            body_matches = len(query_words.intersection(body_words))
-            score += body_matches * 1.0
-            
-            # Tag matching (medium weight)
-            tag_words = set(" ".join(article["tags"]).lower().split())
-            tag_matches = len(query_words.intersection(tag_words))
-            score += tag_matches * 2.0
-            
-            # Category match bonus
-            if category and article.get("category") == category:
-                score += 2.0
-            
-            # Normalize by query length
-            if len(query_words) > 0:
-                score = score / len(query_words)
-            
-            if score > 0.1:  # Minimum relevance threshold
-                # Create snippet
-                snippet = article["body"][:150]
-                if len(article["body"]) > 150:
-                    snippet += "..."
-                
-                matches.append(ArticleMatch(
-                    id=article["id"],
-                    title=article["title"],
-                    score=score,
-                    snippet=snippet
-                ))
+        return top_matches
+    
+    async def search_batch(self, queries: List[Tuple[str, Optional[str]]]) -> List[List[ArticleMatch]]:
+        """
+        Search for several (query, category) pairs in one pass over the index
+        """
+        scored = self.index.score_batch([query for query, _ in queries])
         
-        # Sort by relevance score
-        matches.sort(key=lambda x: x.score, reverse=True)
+        results = []
+        for query_scores, (_, category) in zip(scored, queries):
+            top_hits, _ = self.index.rank(query_scores, category, limit=3)
+            results.append(self._to_matches(top_hits, query_scores, category))
         
-        # Return top 3 matches
-        top_matches = matches[:3]
+        logger.info(f"Searched {len(queries)} queries in batch")
         
-        logger.info(f"Found {len(matches)} articles, returning top {len(top_matches)}")
+        return results
+    
+    def get_articles(self, article_ids: List[str]) -> List[ArticleMatch]:
+        """Look up articles by id, skipping ones no longer in the index"""
+        return self._to_matches([
+            (0.0, article_id) for article_id in article_ids
+            if article_id in self.index.articles
+        ])
+    
+    def _to_matches(self, top_hits: List[Tuple[float, str]],
+                    query_scores: Optional[QueryScores] = None,
+                    category: Optional[str] = None) -> List[ArticleMatch]:
+        """Build article matches with snippets and component scores for the top hits"""
+        matches = []
+        for score, article_id in top_hits:
+            article = self.index.articles[article_id]
+            
+            lexical_score = semantic_score = None
+            if query_scores is not None:
+                members = self.index.category_members.get(category, set()) if category else set()
+                lexical_score = self.index.lexical_score(
+                    query_scores, article_id, members,
+                    CATEGORY_BONUS / query_scores.normalizer
+                )
+                if self.embedder is not None:
+                    semantic_score = query_scores.semantic.get(article_id, 0.0)
+            
+            # Built only for the final hits, around the region the query matched
+            snippet = make_snippet(
+                article["body"], query_scores.terms if query_scores is not None else frozenset()
+            )
+            
+            matches.append(ArticleMatch(
+                id=article["id"],
+                title=article["title"],
+                score=score,
+                snippet=snippet,
+                lexicalScore=lexical_score,
+                semanticScore=semantic_score
+            ))
         
-        return top_matches
+        return matches
@@ -0,0 +1,356 @@
+import os
+import json
+import mmap
+import asyncio
+import logging
+import argparse
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from .kb_index import KBIndex, QueryScores, SEMANTIC_CANDIDATES, article_digest, tokenize
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"KBSNAP01"
+ALIGNMENT = 64
+CURRENT_FILE = "CURRENT"
+
+
+def write_snapshot(index: KBIndex, path: str, generation: int):
+    """
+    Serialize an index into a single file that processes can map read-only
+
+    Postings are stored with their BM25 contribution precomputed (the
+    corpus statistics are frozen in a snapshot), titles and bodies in one
+    UTF-8 buffer, and article vectors, if any, as one float32 matrix.
+    """
+    ids = list(index.articles)
+    articles = [index.articles[article_id] for article_id in ids]
+    doc_index = {article_id: i for i, article_id in enumerate(ids)}
+
+    terms = sorted(index.vocabulary())
+    term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    post_docs, post_scores = [], []
+    for t, term in enumerate(terms):
+        for article_id, term_score in index._term_scores(term):
+            post_docs.append(doc_index[article_id])
+            post_scores.append(term_score)
+        term_offsets[t + 1] = len(post_docs)
+
+    categories = sorted({article.get("category") or "" for article in articles})
+    category_index = {category: i for i, category in enumerate(categories)}
+
+    text = bytearray()
+    text_offsets = np.zeros(2 * len(ids) + 1, dtype=np.int64)
+    for i, article in enumerate(articles):
+        text += article["title"].encode("utf-8")
+        text_offsets[2 * i + 1] = len(text)
+        text += article["body"].encode("utf-8")
+        text_offsets[2 * i + 2] = len(text)
+
+    arrays = {
+        "term_offsets": term_offsets,
+        "post_docs": np.asarray(post_docs, dtype=np.int32),
+        "post_scores": np.asarray(post_scores, dtype=np.float64),
+        "doc_category": np.asarray(
+            [category_index[article.get("category") or ""] for article in articles],
+            dtype=np.int16
+        ),
+        "text_offsets": text_offsets,
+        "text": np.frombuffer(bytes(text), dtype=np.uint8)
+    }
+    if index.vectors is not None:
+        rows = [index.vectors.rows[article_id] for article_id in ids]
+        arrays["vector_matrix"] = np.asarray(index.vectors.matrix[rows], dtype=np.float32)
+
+    header = {
+        "generation": generation,
+        "fingerprint": index.fingerprint,
+        "k1": index.k1,
+        "b": index.b,
+        "semanticWeight": index.semantic_weight,
+        "embedder": index.embedder.name if index.embedder is not None else None,
+        "ids": ids,
+        "tags": [list(article.get("tags", [])) for article in articles],
+        "categories": categories,
+        "terms": terms,
+        "arrays": {}
+    }
+
+    # Array offsets are relative to the aligned data section after the header
+    offset = 0
+    for name, array in arrays.items():
+        header["arrays"][name] = [offset, array.dtype.str, list(array.shape)]
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = -(-(len(MAGIC) + 8 + len(header_bytes)) // ALIGNMENT) * ALIGNMENT
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(header_bytes).to_bytes(8, "little"))
+        f.write(header_bytes)
+        f.write(b"\0" * (data_start - f.tell()))
+        for name, array in arrays.items():
+            f.write(array.tobytes())
+            f.write(b"\0" * (-array.nbytes % ALIGNMENT))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class SnapshotArticles(Mapping):
+    """
+    Read-only article mapping decoded on access from the mapped text buffer
+    """
+
+    def __init__(self, snapshot: "SnapshotIndex"):
+        self._snapshot = snapshot
+
+    def __getitem__(self, article_id: str) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        i = snapshot.doc_index[article_id]
+        start, middle, end = snapshot.text_offsets[2 * i:2 * i + 3]
+        return {
+            "id": article_id,
+            "title": bytes(snapshot.text[start:middle]).decode("utf-8"),
+            "body": bytes(snapshot.text[middle:end]).decode("utf-8"),
+            "tags": snapshot.tags[i],
+            "category": snapshot.categories[snapshot.doc_category[i]] or None
+        }
+
+    def __contains__(self, article_id) -> bool:
+        return article_id in self._snapshot.doc_index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._snapshot.ids)
+
+    def __len__(self) -> int:
+        return len(self._snapshot.ids)
+
+
+class SnapshotIndex(KBIndex):
+    """
+    Read-only KB index backed by a memory-mapped snapshot file
+
+    The arrays are views into the shared page cache, so any number of
+    worker processes can attach to one snapshot without copying it.
+    Ranking is inherited from KBIndex; scoring sums the precomputed
+    postings with numpy.
+    """
+
+    def __init__(self, path: str, embedder=None):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a KB snapshot")
+        header_length = int.from_bytes(self._mmap[len(MAGIC):len(MAGIC) + 8], "little")
+        header_end = len(MAGIC) + 8 + header_length
+        header = json.loads(self._mmap[len(MAGIC) + 8:header_end])
+        data_start = -(-header_end // ALIGNMENT) * ALIGNMENT
+
+        super().__init__(k1=header["k1"], b=header["b"],
+                         semantic_weight=header["semanticWeight"])
+        self.path = path
+        self.version = header["generation"]
+
+        for name, (offset, dtype, shape) in header["arrays"].items():
+            count = int(np.prod(shape))
+            array = np.frombuffer(self._mmap, dtype=np.dtype(dtype), count=count,
+                                  offset=data_start + offset)
+            setattr(self, name, array.reshape(shape))
+
+        self.ids: List[str] = header["ids"]
+        self.tags: List[List[str]] = header["tags"]
+        self.categories: List[str] = header["categories"]
+        self.doc_index = {article_id: i for i, article_id in enumerate(self.ids)}
+        self.term_ids = {term: t for t, term in enumerate(header["terms"])}
+        self.articles = SnapshotArticles(self)
+
+        for i, article_id in enumerate(self.ids):
+            category = self.categories[self.doc_category[i]] or None
+            self.category_members.setdefault(category, set()).add(article_id)
+
+        if "fingerprint" in header:
+            self._fingerprint = int(header["fingerprint"], 16)
+        else:
+            # Snapshots written before fingerprints were recorded
+            for article in self.articles.values():
+                self._fingerprint ^= article_digest(article)
+
+        # Query embeddings must come from the model the snapshot was built with
+        if header["embedder"] is not None:
+            if embedder is None or embedder.name != header["embedder"]:
+                raise ValueError(
+                    f"Snapshot built with {header['embedder']} embeddings, "
+                    f"worker has {getattr(embedder, 'name', None)}"
+                )
+            from .embeddings import VectorIndex
+            self.embedder = embedder
+            self.vectors = VectorIndex.from_matrix(self.vector_matrix, self.ids)
+
+        logger.info(f"Attached KB snapshot generation {self.version} "
+                    f"({len(self.ids)} articles, {len(self.term_ids)} terms)")
+
+    def add(self, article: Dict[str, Any], embed: bool = True):
+        raise TypeError("Snapshot indexes are read-only")
+
+    def remove(self, article_id: str) -> bool:
+        raise TypeError("Snapshot indexes are read-only")
+
+    def score_batch(self, queries: List[str]) -> List[QueryScores]:
+        """Sum the precomputed postings of each query's terms"""
+        results = []
+        for query in queries:
+            terms = frozenset(tokenize(query))
+            spans = [
+                (self.term_offsets[t], self.term_offsets[t + 1])
+                for t in (self.term_ids.get(term) for term in terms) if t is not None
+            ]
+            lexical = {}
+            if spans:
+                docs = np.concatenate([self.post_docs[start:end] for start, end in spans])
+                scores = np.concatenate([self.post_scores[start:end] for start, end in spans])
+                unique, inverse = np.unique(docs, return_inverse=True)
+                sums = np.bincount(inverse, weights=scores)
+                lexical = dict(zip([self.ids[i] for i in unique.tolist()], sums.tolist()))
+            results.append(QueryScores(lexical, len(terms), terms=terms))
+
+        if self.vectors is not None and len(self.vectors):
+            semantic = self.vectors.search_batch(
+                self.embedder.embed_batch(queries), SEMANTIC_CANDIDATES
+            )
+            for query_scores, nearest in zip(results, semantic):
+                query_scores.semantic = nearest
+
+        return results
+
+
+class SnapshotPublisher:
+    """
+    Writes index generations into a directory and points CURRENT at the latest
+
+    Older generations beyond `keep` are unlinked; processes still mapping
+    them keep a valid view until they swap.
+    """
+
+    def __init__(self, directory: str, keep: int = 3):
+        self.directory = directory
+        self.keep = keep
+        os.makedirs(directory, exist_ok=True)
+        current = read_current(directory)
+        self.generation = current[1] if current else 0
+
+    def publish(self, index: KBIndex) -> str:
+        self.generation += 1
+        name = f"kb-{self.generation:08d}.snap"
+        write_snapshot(index, os.path.join(self.directory, name), self.generation)
+
+        pointer = os.path.join(self.directory, CURRENT_FILE)
+        with open(pointer + ".tmp", "w", encoding="utf-8") as f:
+            f.write(name)
+        os.replace(pointer + ".tmp", pointer)
+        logger.info(f"Published KB snapshot {name} ({len(index)} articles)")
+
+        snapshots = sorted(
+            entry for entry in os.listdir(self.directory)
+            if entry.startswith("kb-") and entry.endswith(".snap")
+        )
+        for stale in snapshots[:-self.keep]:
+            os.unlink(os.path.join(self.directory, stale))
+        return name
+
+
+def read_current(directory: str) -> Optional[Tuple[str, int]]:
+    """Return (file name, generation) of the current snapshot, if any"""
+    try:
+        with open(os.path.join(directory, CURRENT_FILE), encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return name, int(name[len("kb-"):-len(".snap")])
+
+
+class SnapshotFollower:
+    """
+    Attaches a worker's KB service to the current snapshot and hot-swaps
+    to new generations as the publisher writes them
+    """
+
+    def __init__(self, kb_service, directory: str, poll_interval: float = None):
+        self.kb_service = kb_service
+        self.directory = directory
+        self.poll_interval = poll_interval if poll_interval is not None else \
+            float(os.getenv("KB_SNAPSHOT_POLL_SECONDS", "1"))
+        self.current = None
+        self._task = None
+
+    def refresh(self) -> bool:
+        """Swap in the current generation if it changed, returning whether it did"""
+        current = read_current(self.directory)
+        if current is None or current[0] == self.current:
+            return False
+        index = SnapshotIndex(os.path.join(self.directory, current[0]),
+                              embedder=self.kb_service.embedder)
+        self.kb_service.replace_index(index)
+        self.current = current[0]
+        return True
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                logger.error(f"KB snapshot refresh failed: {e}")
+
+    async def start(self):
+        await asyncio.to_thread(self.refresh)
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+def publish_from_source(directory: str) -> str:
+    """Load the configured article source once and publish it as a snapshot"""
+    from .kb_service import KnowledgeBaseService
+    from .kb_sync import KBSyncService, create_article_source
+
+    kb_service = KnowledgeBaseService()
+    source = create_article_source()
+    if source is not None:
+        sync = KBSyncService(kb_service, source)
+
+        async def load():
+            try:
+                await sync.initial_load()
+            finally:
+                await source.close()
+
+        asyncio.run(load())
+    return SnapshotPublisher(directory).publish(kb_service.index)
+
+
+def main():
+    """
+    Prebuild a KB snapshot, e.g. while building the worker image, so a
+    worker started with KB_BOOTSTRAP_SNAPSHOT_DIR maps it instead of
+    indexing the knowledge base before serving
+    """
+    parser = argparse.ArgumentParser(description="Publish a KB snapshot from the configured article source")
+    parser.add_argument("directory", help="snapshot directory (created if missing)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    publish_from_source(args.directory)
+
+
+if __name__ == "__main__":
+    main()
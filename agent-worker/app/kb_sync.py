@@ -0,0 +1,304 @@
+import os
+import json
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set, Tuple, Any
+from .kb_service import KnowledgeBaseService
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def normalize_article(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert an Article document (Mongo or exported JSON) into index form"""
+    article_id = doc.get("id") or doc.get("_id")
+    if isinstance(article_id, dict):
+        # Extended JSON export: {"_id": {"$oid": "..."}}
+        article_id = article_id.get("$oid")
+
+    return {
+        "id": str(article_id),
+        "title": doc.get("title", ""),
+        "body": doc.get("body", ""),
+        "tags": list(doc.get("tags") or []),
+        "category": doc.get("category", "other"),
+        "status": doc.get("status", "published"),
+        "updatedAt": _parse_timestamp(doc.get("updatedAt"))
+    }
+
+
+def _parse_timestamp(value) -> datetime:
+    """Parse updatedAt values from Mongo, extended JSON or ISO strings"""
+    if isinstance(value, dict):
+        value = value.get("$date")
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+    if isinstance(value, str):
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+    return EPOCH
+
+
+class ArticleSource(ABC):
+    """
+    Source of knowledge base articles for the sync service
+    """
+
+    @abstractmethod
+    async def load_all(self) -> List[Dict[str, Any]]:
+        """Return every published article"""
+
+    @abstractmethod
+    async def fetch_changes(self, since: datetime) -> List[Dict[str, Any]]:
+        """Return articles (any status) updated at or after the cursor"""
+
+    @abstractmethod
+    async def list_ids(self) -> Set[str]:
+        """Return the ids of all published articles, used to detect deletes"""
+
+    async def close(self):
+        pass
+
+
+class MongoArticleSource(ArticleSource):
+    """
+    Reads the backend's Article collection with a polling cursor on updatedAt
+    """
+
+    def __init__(self, uri: str, collection: str = "articles"):
+        # Imported lazily so file/in-memory sources work without pymongo
+        from pymongo import MongoClient
+
+        self.client = MongoClient(uri)
+        self.collection = self.client.get_default_database()[collection]
+
+    async def load_all(self) -> List[Dict[str, Any]]:
+        docs = await asyncio.to_thread(
+            lambda: list(self.collection.find({"status": "published"}))
+        )
+        return [normalize_article(doc) for doc in docs]
+
+    async def fetch_changes(self, since: datetime) -> List[Dict[str, Any]]:
+        docs = await asyncio.to_thread(
+            lambda: list(self.collection.find({"updatedAt": {"$gte": since}}))
+        )
+        return [normalize_article(doc) for doc in docs]
+
+    async def list_ids(self) -> Set[str]:
+        ids = await asyncio.to_thread(
+            lambda: self.collection.distinct("_id", {"status": "published"})
+        )
+        return {str(article_id) for article_id in ids}
+
+    async def close(self):
+        self.client.close()
+
+
+class InMemoryArticleSource(ArticleSource):
+    """
+    In-process article store, used by tests and local development
+    """
+
+    def __init__(self, articles: Optional[List[Dict[str, Any]]] = None):
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        for doc in articles or []:
+            self.put(doc)
+
+    def put(self, doc: Dict[str, Any]):
+        """Create or update an article"""
+        article = normalize_article(doc)
+        if doc.get("updatedAt") is None:
+            article["updatedAt"] = datetime.now(timezone.utc)
+        self.docs[article["id"]] = article
+
+    def delete(self, article_id: str):
+        """Hard-delete an article, as routes/kb.js does"""
+        self.docs.pop(article_id, None)
+
+    async def load_all(self) -> List[Dict[str, Any]]:
+        return [doc for doc in self.docs.values() if doc["status"] == "published"]
+
+    async def fetch_changes(self, since: datetime) -> List[Dict[str, Any]]:
+        return [doc for doc in self.docs.values() if doc["updatedAt"] >= since]
+
+    async def list_ids(self) -> Set[str]:
+        return {doc["id"] for doc in self.docs.values() if doc["status"] == "published"}
+
+
+class FileArticleSource(InMemoryArticleSource):
+    """
+    Articles from a JSON array or JSONL export, reloaded when the file changes
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self.mtime = None
+
+    async def _refresh(self):
+        mtime = os.path.getmtime(self.path)
+        if mtime == self.mtime:
+            return
+        self.mtime = mtime
+
+        docs = await asyncio.to_thread(self._read)
+        previous = self.docs
+        self.docs = {}
+        now = datetime.now(timezone.utc)
+        for doc in docs:
+            article = normalize_article(doc)
+            if doc.get("updatedAt") is None:
+                # Exports without updatedAt: keep the old timestamp if unchanged
+                old = previous.get(article["id"])
+                unchanged = old is not None and _same_content(old, article)
+                article["updatedAt"] = old["updatedAt"] if unchanged else now
+            self.docs[article["id"]] = article
+
+    def _read(self) -> List[Dict[str, Any]]:
+        with open(self.path, encoding="utf-8") as f:
+            content = f.read().strip()
+        if content.startswith("["):
+            return json.loads(content)
+        return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+    async def load_all(self) -> List[Dict[str, Any]]:
+        await self._refresh()
+        return await super().load_all()
+
+    async def fetch_changes(self, since: datetime) -> List[Dict[str, Any]]:
+        await self._refresh()
+        return await super().fetch_changes(since)
+
+    async def list_ids(self) -> Set[str]:
+        await self._refresh()
+        return await super().list_ids()
+
+
+def _same_content(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    fields = ("title", "body", "tags", "category", "status")
+    return all(a[field] == b[field] for field in fields)
+
+
+def create_article_source() -> Optional[ArticleSource]:
+    """Build the article source configured through the environment"""
+    source = os.getenv("KB_SOURCE", "mongo" if os.getenv("MONGO_URI") else "builtin")
+
+    if source == "mongo":
+        return MongoArticleSource(os.getenv("MONGO_URI", "mongodb://localhost:27017/helpdesk"))
+    if source == "file":
+        return FileArticleSource(os.environ["KB_SOURCE_PATH"])
+    return None
+
+
+class KBSyncService:
+    """
+    Keeps the knowledge base index in sync with an article source
+
+    Articles are bulk-loaded once at startup, then updates are polled on the
+    updatedAt cursor and applied incrementally. Hard deletes do not show up
+    in the cursor, so published ids are reconciled every few polls.
+    """
+
+    def __init__(self, kb_service: KnowledgeBaseService, source: ArticleSource,
+                 poll_interval: float = None, reconcile_every: int = None,
+                 apply_batch_size: int = 100):
+        self.kb_service = kb_service
+        self.source = source
+        self.poll_interval = poll_interval if poll_interval is not None else \
+            float(os.getenv("KB_POLL_INTERVAL_SECONDS", "5"))
+        self.reconcile_every = reconcile_every if reconcile_every is not None else \
+            int(os.getenv("KB_RECONCILE_EVERY", "12"))
+        self.apply_batch_size = apply_batch_size
+        self.cursor = EPOCH
+        self.polls = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def initial_load(self):
+        """Bulk-load published articles into a fresh index and swap it in"""
+        articles = await self.source.load_all()
+        index = self.kb_service.new_index()
+        # Build off the event loop so /triage keeps serving the old index
+        await asyncio.to_thread(index.build, articles)
+        self.kb_service.replace_index(index)
+        self._advance_cursor(articles)
+        logger.info(f"Loaded {len(articles)} published articles from source")
+
+    async def poll_once(self) -> Tuple[int, int]:
+        """Fetch and apply one round of changes, returning (upserts, deletes)"""
+        changes = await self.source.fetch_changes(self.cursor)
+        upserts = [doc for doc in changes if doc["status"] == "published"]
+        deletes = [doc["id"] for doc in changes if doc["status"] != "published"]
+
+        self.polls += 1
+        if self.reconcile_every and self.polls % self.reconcile_every == 0:
+            live_ids = await self.source.list_ids()
+            deletes.extend(set(self.kb_service.index.articles) - live_ids)
+
+        await self._apply(upserts, deletes)
+        self._advance_cursor(changes)
+        return len(upserts), len(deletes)
+
+    async def _apply(self, upserts: List[Dict[str, Any]], deletes: List[str]):
+        """Apply changes in small batches, yielding to pending requests"""
+        upserts = [doc for doc in upserts if not self._is_current(doc)]
+        for start in range(0, len(upserts), self.apply_batch_size):
+            self.kb_service.apply_changes(upserts[start:start + self.apply_batch_size], [])
+            await asyncio.sleep(0)
+        if deletes:
+            self.kb_service.apply_changes([], deletes)
+
+        if upserts or deletes:
+            logger.info(f"Applied KB delta: {len(upserts)} upserts, {len(deletes)} deletes")
+
+    def _is_current(self, doc: Dict[str, Any]) -> bool:
+        """Skip re-indexing articles the cursor window returned unchanged"""
+        existing = self.kb_service.index.articles.get(doc["id"])
+        return existing is not None and existing.get("updatedAt") == doc["updatedAt"]
+
+    def _advance_cursor(self, docs: List[Dict[str, Any]]):
+        for doc in docs:
+            if doc["updatedAt"] > self.cursor:
+                self.cursor = doc["updatedAt"]
+
+    async def run(self):
+        """Poll the source until cancelled"""
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.poll_once()
+            except Exception as e:
+                logger.error(f"KB sync poll failed: {e}")
+
+    async def start(self, wait_for_load: bool = True):
+        """
+        Load the source and start polling; without `wait_for_load` the load
+        runs in the background, e.g. while a prebuilt snapshot serves
+        """
+        if not wait_for_load:
+            self._task = asyncio.create_task(self._load_then_run())
+            return
+        await self.initial_load()
+        self._task = asyncio.create_task(self.run())
+
+    async def _load_then_run(self):
+        try:
+            await self.initial_load()
+        except Exception as e:
+            # Deltas can't be applied to a read-only snapshot index
+            logger.error(f"KB sync startup failed, keeping the current index: {e}")
+            return
+        await self.run()
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self.source.close()
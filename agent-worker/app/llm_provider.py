@@ -1,121 +1,395 @@
 import os
-import re
+import time
+import asyncio
 import logging
-from typing import List
-import google.generativeai as genai
-from .models import ClassificationResult, CategoryEnum
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
+from .models import ClassificationResult
+from .metrics import LLM_FALLBACKS, LLM_HEDGES, record_prompt_savings, record_tokens
+from .prompts import Prompt, PromptBuilder
+from .providers import Generation, create_provider
+from .resilience import AdaptiveLimiter, CircuitBreaker, CircuitOpenError, LatencyTracker
+from .stub_classifier import KeywordClassifier
+from .structured_output import (
+    CLASSIFICATION_BATCH_SCHEMA, CLASSIFICATION_SCHEMA, TRIAGE_SCHEMA,
+    StructuredOutputError, extract_json, parse_classification, parse_triage
+)
 
 logger = logging.getLogger(__name__)
 
+
+def fallback_cause(error: Exception) -> str:
+    """Reason an LLM result was replaced by the stub, for the fallback metric"""
+    if isinstance(error, StructuredOutputError):
+        return error.cause
+    if isinstance(error, CircuitOpenError):
+        return "circuit_open"
+    if isinstance(error, TimeoutError):
+        return "timeout"
+    return "provider_error"
+
+
+class LLMFallbackError(Exception):
+    """
+    The LLM result was unusable and the caller asked for no stub substitute,
+    e.g. so the stub result is not cached as if the model had produced it
+    """
+
+    def __init__(self, operation: str, cause: str):
+        super().__init__(f"LLM {operation} fell back ({cause})")
+        self.operation = operation
+        self.cause = cause
+
+
 class LLMProvider:
     """
-    LLM provider supporting both Gemini AI and deterministic stub mode
+    LLM provider routing to Gemini (or a fake provider) with a deterministic
+    stub fallback
     """
     
-    def __init__(self):
+    def __init__(self, provider=None):
         self.stub_mode = os.getenv("STUB_MODE", "false").lower() == "true"
+        # Compiled once; also the fallback path whenever the LLM fails
+        self.stub_classifier = KeywordClassifier.from_file()
+        # Versioned templates, rendered within PROMPT_MAX_INPUT_TOKENS
+        self.prompts = PromptBuilder()
+        
+        # Upper bound on in-flight calls (adapted below it) and per-call timeout
+        self.max_concurrency = int(os.getenv("GEMINI_MAX_CONCURRENCY", "32"))
+        self.timeout_seconds = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "20"))
+        self.limiter = AdaptiveLimiter(self.max_concurrency)
+        
+        # Number of tickets packed into a single classification prompt
+        self.classify_batch_size = int(os.getenv("GEMINI_CLASSIFY_BATCH_SIZE", "8"))
         
+        # Fire a second attempt once a call runs past the recent p95 latency
+        self.hedge_enabled = os.getenv("LLM_HEDGE_ENABLED", "true").lower() == "true"
+        self.hedge_quantile = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+        self.latency = LatencyTracker()
+        
+        self.provider = None
         if not self.stub_mode:
-            api_key = os.getenv("GEMINI_API_KEY")
-            if not api_key:
-                logger.warning("No Gemini API key found, falling back to stub mode")
+            self.provider = provider or create_provider()
+            if self.provider is None:
                 self.stub_mode = True
-            else:
-                genai.configure(api_key=api_key)
-                self.model = genai.GenerativeModel('gemini-pro')
+        
+        # Ask the provider for schema-constrained JSON where it supports it
+        self.json_mode = self.provider is not None and \
+            getattr(self.provider, "supports_json_mode", False) and \
+            os.getenv("LLM_JSON_MODE", "true").lower() == "true"
+        # Classify and draft a ticket in one call instead of two
+        self.combined_mode = self.provider is not None and \
+            "triage" in self.prompts.templates and \
+            os.getenv("LLM_COMBINED_TRIAGE", "true").lower() == "true"
+        
+        self.breaker = None
+        if self.provider is not None:
+            self.breaker = CircuitBreaker(
+                f"{self.provider.name}/{self.provider.model_name}",
+                failure_threshold=int(os.getenv("LLM_CIRCUIT_FAILURES", "5")),
+                reset_seconds=float(os.getenv("LLM_CIRCUIT_RESET_SECONDS", "30"))
+            )
     
     def get_provider_name(self) -> str:
-        return "stub" if self.stub_mode else "gemini"
+        return "stub" if self.stub_mode else self.provider.name
     
     def get_model_name(self) -> str:
-        return "deterministic-v1" if self.stub_mode else "gemini-pro"
+        return "deterministic-v1" if self.stub_mode else self.provider.model_name
     
-    async def classify_ticket(self, text: str) -> ClassificationResult:
-        """Classify ticket category"""
+    @property
+    def prompt_version(self) -> str:
+        return self.prompts.version
+    
+    async def classify_ticket(self, text: str, fallback: bool = True) -> ClassificationResult:
+        """
+        Classify ticket category
+        
+        Without `fallback`, an LLM failure raises LLMFallbackError instead of
+        returning the keyword classification.
+        """
         if self.stub_mode:
             return self._stub_classify(text)
         else:
-            return await self._gemini_classify(text)
+            return await self._llm_classify(text, fallback)
+    
+    async def classify_batch(self, texts: List[str],
+                             fallback: bool = True) -> List[Union[ClassificationResult, Exception]]:
+        """
+        Classify several tickets, packing them into shared prompts
+        
+        Without `fallback`, tickets the LLM failed on get an LLMFallbackError
+        in their place, as MicroBatcher expects for per-item failures.
+        """
+        if self.stub_mode:
+            return self.stub_classifier.classify_batch(texts)
+        
+        chunks = [
+            texts[start:start + self.classify_batch_size]
+            for start in range(0, len(texts), self.classify_batch_size)
+        ]
+        results = await asyncio.gather(
+            *[self._llm_classify_batch(chunk, fallback) for chunk in chunks]
+        )
+        return [result for chunk_results in results for result in chunk_results]
     
-    async def draft_response(self, ticket, articles: List, category: str) -> str:
-        """Draft response for ticket"""
+    async def draft_response(self, ticket, articles: List, category: str,
+                             fallback: bool = True) -> str:
+        """
+        Draft response for ticket
+        
+        Without `fallback`, an LLM failure raises LLMFallbackError instead of
+        returning the template reply.
+        """
         if self.stub_mode:
             return self._stub_draft(ticket, articles, category)
         else:
-            return await self._gemini_draft(ticket, articles, category)
+            return await self._llm_draft(ticket, articles, category, fallback)
     
-    def _stub_classify(self, text: str) -> ClassificationResult:
-        """Deterministic classification using keywords"""
-        text_lower = text.lower()
-        
-        # Keyword patterns for each category
-        patterns = {
-            CategoryEnum.BILLING: [
-                "refund", "invoice", "payment", "charge", "bill", "money",
-                "cost", "price", "subscription", "credit", "debit", "account"
-            ],
-            CategoryEnum.TECH: [
-                "error", "bug", "crash", "broken", "not working", "stack trace",
-                "exception", "500", "404", "login", "password", "api", "database"
-            ],
-            CategoryEnum.SHIPPING: [
-                "delivery", "shipment", "package", "tracking", "shipping",
-                "address", "delayed", "lost", "arrived", "courier", "order"
-            ]
-        }
+    async def classify_and_draft(self, ticket, articles: List) -> Tuple[ClassificationResult, str]:
+        """
+        Classify a ticket and draft its reply with a single LLM call
         
-        # Calculate scores for each category
-        scores = {}
-        for category, keywords in patterns.items():
-            matches = sum(1 for keyword in keywords if keyword in text_lower)
-            if matches > 0:
-                scores[category] = matches / len(keywords) + 0.3
-        
-        # Determine predicted category and confidence
-        if scores:
-            predicted_category = max(scores, key=scores.get)
-            confidence = min(0.95, scores[predicted_category])
-        else:
-            predicted_category = CategoryEnum.OTHER
-            confidence = 0.2
+        Raises if the call fails or its response is unusable, after counting
+        the fallback, so the caller can fall back to separate calls.
+        """
+        try:
+            result_text = await self._generate(
+                self.prompts.triage(ticket, articles), schema=TRIAGE_SCHEMA
+            )
+            return parse_triage(extract_json(result_text, dict))
+        except Exception as e:
+            logger.error(f"LLM combined triage failed: {e}")
+            LLM_FALLBACKS.inc("triage", fallback_cause(e))
+            raise
+    
+    async def stream_draft(self, ticket, articles: List, category: str,
+                           fallback: bool = True) -> AsyncIterator[str]:
+        """
+        Stream a draft response as it is generated
         
-        return ClassificationResult(
-            predictedCategory=predicted_category,
-            confidence=confidence
-        )
+        Falls back to the template reply if the LLM fails before producing
+        any text, or raises LLMFallbackError without `fallback`; a failure
+        mid-stream raises so the caller can reset.
+        """
+        if self.stub_mode:
+            for chunk in self._chunk_text(self._stub_draft(ticket, articles, category)):
+                yield chunk
+            return
+        
+        emitted = False
+        try:
+            async for chunk in self._generate_stream(
+                    self._draft_prompt(ticket, articles, category)):
+                emitted = True
+                yield chunk
+        except Exception as e:
+            if emitted:
+                raise
+            logger.error(f"LLM streaming draft failed: {e}")
+            cause = fallback_cause(e)
+            LLM_FALLBACKS.inc("draft", cause)
+            if not fallback:
+                raise LLMFallbackError("draft", cause) from e
+            for chunk in self._chunk_text(self._stub_draft(ticket, articles, category)):
+                yield chunk
+    
+    def _chunk_text(self, text: str) -> List[str]:
+        """Split a finished text into line-sized chunks for streaming"""
+        return text.splitlines(keepends=True)
+    
+    async def _generate(self, prompt: Prompt, schema: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Run a completion through the circuit breaker and concurrency limiter
+        
+        Fails fast with CircuitOpenError while the provider is unhealthy, so
+        callers fall back to the stub path without waiting. Once enough
+        latencies are known, a call still running past the hedge quantile
+        gets a second attempt and the first to succeed wins. The whole call
+        is subject to a timeout; cancellation propagates to the attempts.
+        
+        `schema` requests JSON output in json_mode and is ignored otherwise.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"Circuit {self.breaker.name} is open")
+        
+        try:
+            generation = await asyncio.wait_for(
+                self._hedged(prompt.text, schema if self.json_mode else None),
+                timeout=self.timeout_seconds
+            )
+        except asyncio.TimeoutError:
+            self.breaker.record_failure()
+            self.limiter.decrease()
+            raise TimeoutError(f"LLM call exceeded {self.timeout_seconds}s")
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        
+        self.breaker.record_success()
+        record_tokens(generation.prompt_tokens, generation.completion_tokens)
+        record_prompt_savings(prompt.saved_tokens)
+        return generation.text
     
-    async def _gemini_classify(self, text: str) -> ClassificationResult:
-        """Classify using Gemini AI"""
+    async def _attempt(self, prompt: str, schema: Optional[Dict[str, Any]],
+                       acquired: bool = False) -> Generation:
+        """One provider call holding a concurrency slot"""
+        if not acquired:
+            await self.limiter.acquire()
+        success = None
+        start = time.perf_counter()
         try:
-            prompt = f"""
-            Classify the following support ticket into one of these categories:
-            - billing: payment, refund, invoice, subscription issues
-            - tech: technical problems, errors, bugs, login issues  
-            - shipping: delivery, package, tracking, shipping issues
-            - other: general inquiries, other topics
-            
-            Ticket: {text}
-            
-            Respond with JSON format: {{"category": "billing|tech|shipping|other", "confidence": 0.0-1.0}}
-            """
-            
-            response = self.model.generate_content(prompt)
-            result_text = response.text.strip()
-            
-            # Extract JSON from response
-            import json
-            result = json.loads(result_text)
+            generation = await self.provider.generate(prompt, schema=schema)
+            success = True
+        finally:
+            # Errors are the breaker's concern; only timeouts shrink the limit
+            self.limiter.release(success)
+        self.latency.observe(time.perf_counter() - start)
+        return generation
+    
+    async def _hedged(self, prompt: str, schema: Optional[Dict[str, Any]]) -> Generation:
+        first = asyncio.ensure_future(self._attempt(prompt, schema))
+        hedge_after = self.latency.percentile(self.hedge_quantile) if self.hedge_enabled else None
+        if hedge_after is None:
+            return await first
+        
+        attempts = [first]
+        try:
+            done, _ = await asyncio.wait(attempts, timeout=hedge_after)
+            # Only hedge into spare capacity so hedges cannot deepen an overload
+            if not done and self.limiter.try_acquire():
+                LLM_HEDGES.inc()
+                attempts.append(asyncio.ensure_future(self._attempt(prompt, schema, acquired=True)))
             
-            return ClassificationResult(
-                predictedCategory=CategoryEnum(result["category"]),
-                confidence=float(result["confidence"])
+            pending = set(attempts)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for attempt in done:
+                    if attempt.exception() is None:
+                        return attempt.result()
+                    error = attempt.exception()
+            raise error
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+    
+    async def _generate_stream(self, prompt: Prompt) -> AsyncIterator[str]:
+        """Stream a completion under the same breaker, limit and timeout as _generate"""
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"Circuit {self.breaker.name} is open")
+        
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout_seconds
+        
+        async def next_chunk(iterator):
+            try:
+                return await asyncio.wait_for(
+                    iterator.__anext__(), timeout=max(0.0, deadline - loop.time())
+                )
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"LLM call exceeded {self.timeout_seconds}s")
+        
+        await self.limiter.acquire()
+        completed = False
+        try:
+            iterator = self.provider.stream(prompt.text).__aiter__()
+            while True:
+                try:
+                    generation = await next_chunk(iterator)
+                except StopAsyncIteration:
+                    break
+                if generation.text:
+                    yield generation.text
+                if generation.prompt_tokens or generation.completion_tokens:
+                    record_tokens(generation.prompt_tokens, generation.completion_tokens)
+            completed = True
+            record_prompt_savings(prompt.saved_tokens)
+        except TimeoutError:
+            self.breaker.record_failure()
+            self.limiter.decrease()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        finally:
+            self.limiter.release(completed or None)
+            if completed:
+                self.breaker.record_success()
+            else:
+                # No-op unless this stream was the half-open probe
+                self.breaker.release()
+    
+    def template_draft(self, ticket, articles: List, category: str) -> str:
+        """Deterministic template reply that costs no LLM call"""
+        return self._stub_draft(ticket, articles, category)
+    
+    def keyword_classify(self, text: str) -> ClassificationResult:
+        """Deterministic keyword classification that costs no LLM call"""
+        return self._stub_classify(text)
+    
+    def _stub_classify(self, text: str) -> ClassificationResult:
+        """Deterministic classification using keywords"""
+        return self.stub_classifier.classify(text)
+    
+    async def _llm_classify(self, text: str, fallback: bool = True) -> ClassificationResult:
+        """Classify using the LLM"""
+        try:
+            result_text = await self._generate(
+                self.prompts.classify(text), schema=CLASSIFICATION_SCHEMA
             )
+            return parse_classification(extract_json(result_text, dict))
             
         except Exception as e:
-            logger.error(f"Gemini classification failed: {e}")
+            logger.error(f"LLM classification failed: {e}")
+            cause = fallback_cause(e)
+            LLM_FALLBACKS.inc("classify", cause)
+            if not fallback:
+                raise LLMFallbackError("classify", cause) from e
             # Fallback to stub
             return self._stub_classify(text)
     
+    async def _llm_classify_batch(self, texts: List[str],
+                                  fallback: bool = True) -> List[Union[ClassificationResult, Exception]]:
+        """Classify several tickets with a single LLM call"""
+        if len(texts) == 1:
+            try:
+                return [await self._llm_classify(texts[0], fallback)]
+            except LLMFallbackError as e:
+                return [e]
+        
+        try:
+            result_text = await self._generate(
+                self.prompts.classify_batch(texts), schema=CLASSIFICATION_BATCH_SCHEMA
+            )
+            by_index = {}
+            for item in extract_json(result_text, list):
+                try:
+                    by_index[int(item["index"])] = item
+                except (KeyError, TypeError, ValueError):
+                    continue
+            failure = None
+        except Exception as e:
+            logger.error(f"LLM batch classification failed: {e}")
+            by_index = {}
+            failure = fallback_cause(e)
+        
+        results = []
+        for i, text in enumerate(texts):
+            try:
+                if i not in by_index:
+                    raise StructuredOutputError("missing_item", f"Ticket {i} missing from response")
+                results.append(parse_classification(by_index[i]))
+            except StructuredOutputError as e:
+                # Fallback to stub for tickets missing from the response
+                cause = failure or e.cause
+                LLM_FALLBACKS.inc("classify_batch", cause)
+                results.append(self._stub_classify(text) if fallback
+                               else LLMFallbackError("classify_batch", cause))
+        
+        return results
+    
     def _stub_draft(self, ticket, articles: List, category: str) -> str:
         """Generate deterministic draft response"""
         # Category-specific templates
@@ -145,36 +419,22 @@ class LLMProvider:
         response += "\n\nBest regards,\nSupport Team"
         return response
     
-    async def _gemini_draft(self, ticket, articles: List, category: str) -> str:
-        """Generate response using Gemini AI"""
+    def _draft_prompt(self, ticket, articles: List, category: str) -> Prompt:
+        """Build the drafting prompt for a ticket and its articles"""
+        return self.prompts.draft(ticket, articles, category)
+    
+    async def _llm_draft(self, ticket, articles: List, category: str,
+                         fallback: bool = True) -> str:
+        """Generate response using the LLM"""
         try:
-            # Prepare articles context
-            articles_text = ""
-            if articles:
-                articles_text = "\n\nRelevant knowledge base articles:\n"
-                for i, article in enumerate(articles, 1):
-                    articles_text += f"{i}. {article.title}\n{article.snippet}\n\n"
-            
-            prompt = f"""
-            You are a helpful customer support agent. Write a professional, empathetic response to this support ticket.
-
-            Ticket Title: {ticket.title}
-            Ticket Description: {ticket.description}
-            Category: {category}
-            {articles_text}
-            
-            Guidelines:
-            - Be helpful and professional
-            - Reference relevant articles if provided
-            - Offer next steps or escalation if needed
-            - Keep response concise but complete
-            - End with a professional closing
-            """
-            
-            response = self.model.generate_content(prompt)
-            return response.text.strip()
+            prompt = self._draft_prompt(ticket, articles, category)
+            return await self._generate(prompt)
             
         except Exception as e:
-            logger.error(f"Gemini drafting failed: {e}")
+            logger.error(f"LLM drafting failed: {e}")
+            cause = fallback_cause(e)
+            LLM_FALLBACKS.inc("draft", cause)
+            if not fallback:
+                raise LLMFallbackError("draft", cause) from e
             # Fallback to stub
             return self._stub_draft(ticket, articles, category)
@@ -1,13 +1,33 @@
-from fastapi import FastAPI, HTTPException
+import time
+# Start of the worker's own import, the baseline for the startup timings
+IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 import uvicorn
 import os
+import uuid
+import json
+import asyncio
 import logging
-from .models import TriageRequest, TriageResponse
-from .agent import AgentService
+from .models import (
+    TriageRequest, TriageResponse, BatchTriageRequest,
+    BatchTriageResponse, BatchTriageResult, DraftRequest, DraftResponse
+)
+from .kb_sync import KBSyncService, create_article_source
+from .queue_consumer import create_queue_consumer
+from .metrics import (
+    REGISTRY, REQUEST_DURATION, TraceIdFilter, register_gauge, trace_id_var
+)
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(levelname)s:%(name)s:[%(trace_id)s] %(message)s"
+)
+for handler in logging.getLogger().handlers:
+    handler.addFilter(TraceIdFilter())
 logger = logging.getLogger(__name__)
 
 app = FastAPI(
@@ -25,8 +45,233 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize agent
-agent_service = AgentService()
+class TraceMiddleware:
+    """
+    Propagates X-Trace-ID into the request context and times triage routes
+    """
+    
+    # Triage requests currently being handled, across all instances
+    in_flight = 0
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        
+        headers = dict(scope["headers"])
+        trace_id = headers.get(b"x-trace-id", b"").decode() or uuid.uuid4().hex
+        token = trace_id_var.set(trace_id)
+        
+        async def send_with_trace(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-trace-id", trace_id.encode())
+                ]
+            await send(message)
+        
+        path = scope["path"]
+        timed = path.startswith("/triage") or path == "/draft"
+        start = time.perf_counter()
+        TraceMiddleware.in_flight += timed
+        try:
+            await self.app(scope, receive, send_with_trace)
+        finally:
+            TraceMiddleware.in_flight -= timed
+            if timed:
+                REQUEST_DURATION.observe(time.perf_counter() - start, path)
+            trace_id_var.reset(token)
+
+app.add_middleware(TraceMiddleware)
+
+# Created by the background warm-up so the server binds and answers /health
+# right away; /ready and the triage routes wait for it to finish
+agent_service = None
+kb_sync = None
+queue_consumer = None
+warm_up_task = None
+warm_up_error = None
+startup_seconds = {}
+
+def _queue_depth():
+    batcher = agent_service.classification_batcher if agent_service else None
+    return {
+        ("in_flight",): TraceMiddleware.in_flight,
+        ("classification_batch",): batcher.pending if batcher else 0,
+        ("queue_jobs",): queue_consumer.in_flight if queue_consumer else 0
+    }
+
+def _cache_stats():
+    if not agent_service or not agent_service.cache:
+        return {}
+    stats = agent_service.cache.get_stats()
+    return {(key,): stats[key] for key in ("hits", "misses", "coalesced", "redisHits")}
+
+register_gauge("triage_queue_depth", "Triage work waiting or in flight", _queue_depth, ("queue",))
+register_gauge("triage_cache_lookups", "Triage cache lookups by outcome", _cache_stats, ("result",))
+register_gauge(
+    "triage_cache_hit_ratio", "Share of triage cache lookups served without computing",
+    lambda: {(): agent_service.cache.get_stats()["hitRatio"]}
+    if agent_service and agent_service.cache else {}
+)
+
+def _dedup_stats():
+    if not agent_service or not agent_service.dedup:
+        return {}
+    stats = agent_service.dedup.get_stats()
+    return {(key,): stats[key] for key in ("tickets", "duplicates", "clusters", "activeClusters")}
+
+register_gauge("triage_dedup", "Near-duplicate ticket clustering", _dedup_stats, ("value",))
+
+def _llm_state():
+    if not agent_service or not agent_service.llm_provider.breaker:
+        return {}
+    provider = agent_service.llm_provider
+    return {
+        ("circuit_open",): int(provider.breaker.state != provider.breaker.CLOSED),
+        ("concurrency_limit",): int(provider.limiter.limit),
+        ("in_flight",): provider.limiter.in_flight
+    }
+
+register_gauge("llm_provider_state", "LLM circuit breaker and concurrency limiter state",
+               _llm_state, ("value",))
+
+register_gauge("agent_worker_startup_seconds",
+               "Seconds from the start of the worker's import to each startup phase",
+               lambda: {(phase,): seconds for phase, seconds in startup_seconds.items()},
+               ("phase",))
+
+async def start_kb_sync():
+    """
+    Load the knowledge base from the configured source and keep it in sync
+
+    With KB_BOOTSTRAP_SNAPSHOT_DIR set, the worker first maps a prebuilt
+    snapshot and serves from it while the source is loaded in the background.
+    """
+    global kb_sync
+    # Imported lazily, snapshots pull in numpy
+    from .kb_snapshot import SnapshotFollower
+    
+    snapshot_dir = os.getenv("KB_SNAPSHOT_DIR")
+    if snapshot_dir:
+        # Under the supervisor the parent syncs; workers follow its snapshots
+        kb_sync = SnapshotFollower(agent_service.kb_service, snapshot_dir)
+        await kb_sync.start()
+        return
+    
+    bootstrapped = False
+    bootstrap_dir = os.getenv("KB_BOOTSTRAP_SNAPSHOT_DIR")
+    if bootstrap_dir:
+        try:
+            bootstrapped = await asyncio.to_thread(
+                SnapshotFollower(agent_service.kb_service, bootstrap_dir).refresh
+            )
+        except Exception as e:
+            logger.error(f"Loading KB snapshot from {bootstrap_dir} failed: {e}")
+        if not bootstrapped:
+            logger.warning(f"No usable KB snapshot in {bootstrap_dir}, loading the KB without it")
+    
+    source = create_article_source()
+    if source is None:
+        if not bootstrapped:
+            logger.info("No KB source configured, using built-in sample articles")
+        return
+    
+    kb_sync = KBSyncService(agent_service.kb_service, source)
+    try:
+        # The snapshot serves until the freshly loaded index is swapped in
+        await kb_sync.start(wait_for_load=not bootstrapped)
+    except Exception as e:
+        logger.error(f"KB sync startup failed, using built-in sample articles: {e}")
+        kb_sync = None
+
+async def start_queue_consumer():
+    """Consume triage jobs from the Redis stream when enabled"""
+    global queue_consumer
+    queue_consumer = create_queue_consumer(agent_service)
+    if queue_consumer:
+        await queue_consumer.start()
+
+async def warm_up():
+    """
+    Build the agent, load the knowledge base and run one retrieval so the
+    first real request does not pay for lazy imports or cold index pages
+    """
+    global agent_service, warm_up_error
+    try:
+        def build_agent():
+            from .agent import AgentService
+            return AgentService()
+        
+        # Off the event loop, so /health keeps answering during heavy imports
+        agent_service = await asyncio.to_thread(build_agent)
+        startup_seconds["agent"] = time.perf_counter() - IMPORT_STARTED
+        
+        await start_kb_sync()
+        startup_seconds["kb"] = time.perf_counter() - IMPORT_STARTED
+        
+        await agent_service.kb_service.search_articles("warm up login billing shipping")
+        await start_queue_consumer()
+    except Exception as e:
+        warm_up_error = str(e)
+        logger.error(f"Warm-up failed, worker will not become ready: {e}")
+        return
+    
+    startup_seconds["ready"] = time.perf_counter() - IMPORT_STARTED
+    logger.info(f"Worker ready {startup_seconds['ready']:.2f}s after import started "
+                f"(import {startup_seconds['import']:.2f}s, agent {startup_seconds['agent']:.2f}s, "
+                f"KB {startup_seconds['kb']:.2f}s, {len(agent_service.kb_service.index)} articles)")
+
+@app.on_event("startup")
+async def start_warm_up():
+    global warm_up_task
+    warm_up_task = asyncio.create_task(warm_up())
+
+@app.on_event("shutdown")
+async def stop_warm_up():
+    if warm_up_task and not warm_up_task.done():
+        warm_up_task.cancel()
+
+@app.on_event("shutdown")
+async def stop_kb_sync():
+    if kb_sync:
+        await kb_sync.stop()
+
+@app.on_event("shutdown")
+async def stop_queue_consumer():
+    if queue_consumer:
+        await queue_consumer.stop()
+
+class ClientDisconnected(Exception):
+    pass
+
+async def cancel_on_disconnect(http_request: Request, coro):
+    """
+    Await the coroutine, cancelling it if the client disconnects first
+    """
+    work = asyncio.ensure_future(coro)
+    
+    async def wait_for_disconnect():
+        while True:
+            message = await http_request.receive()
+            if message["type"] == "http.disconnect":
+                return
+    
+    watcher = asyncio.ensure_future(wait_for_disconnect())
+    try:
+        done, _ = await asyncio.wait(
+            {work, watcher}, return_when=asyncio.FIRST_COMPLETED
+        )
+        if work in done:
+            return work.result()
+        
+        work.cancel()
+        raise ClientDisconnected()
+    finally:
+        watcher.cancel()
+        if not work.done():
+            work.cancel()
 
 @app.get("/health")
 async def health_check():
@@ -37,19 +282,60 @@ async def health_check():
         "version": "1.0.0"
     }
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe, 503 until warm-up has finished"""
+    timings = {phase: round(seconds, 3) for phase, seconds in startup_seconds.items()}
+    if "ready" not in startup_seconds:
+        status = "failed" if warm_up_error else "warming_up"
+        return JSONResponse(
+            status_code=503,
+            content={"status": status, "error": warm_up_error, "startupSeconds": timings}
+        )
+    return {"status": "ready", "startupSeconds": timings}
+
+def require_ready():
+    """
+    Reject work until warm-up has finished, so no ticket is answered from
+    the built-in sample articles while the configured KB is still loading
+    """
+    if "ready" not in startup_seconds:
+        raise HTTPException(status_code=503, detail="Agent worker is warming up")
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics"""
+    return PlainTextResponse(
+        REGISTRY.render(), media_type="text/plain; version=0.0.4"
+    )
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Triage cache hit/miss statistics"""
+    if not agent_service or not agent_service.cache:
+        return {"enabled": False}
+    return {"enabled": True, **agent_service.cache.get_stats()}
+
 @app.post("/triage", response_model=TriageResponse)
-async def triage_ticket(request: TriageRequest):
+async def triage_ticket(request: TriageRequest, http_request: Request):
     """
     Process ticket triage using agentic workflow
     """
+    require_ready()
     try:
         logger.info(f"Processing triage for ticket {request.ticket.id}")
         
-        result = await agent_service.process_triage(request)
+        result = await cancel_on_disconnect(
+            http_request, agent_service.process_triage(request)
+        )
         
         logger.info(f"Triage completed for ticket {request.ticket.id}")
         return result
         
+    except ClientDisconnected:
+        logger.info(f"Client disconnected, cancelled triage for ticket {request.ticket.id}")
+        raise HTTPException(status_code=499, detail="Client closed request")
+        
     except Exception as e:
         logger.error(f"Triage failed: {str(e)}")
         raise HTTPException(
@@ -57,6 +343,104 @@ async def triage_ticket(request: TriageRequest):
             detail=f"Triage processing failed: {str(e)}"
         )
 
+def _sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/triage/stream")
+async def triage_stream(request: TriageRequest):
+    """
+    Process ticket triage, streaming partial results as server-sent events
+    
+    Emits classification and articles as soon as they are known, then
+    draft_delta chunks, and finally the full suggestion. Work stops when
+    the client disconnects.
+    """
+    require_ready()
+    logger.info(f"Streaming triage for ticket {request.ticket.id}")
+    
+    async def events():
+        try:
+            async for event, data in agent_service.stream_triage(request):
+                yield _sse_event(event, data)
+            logger.info(f"Streamed triage completed for ticket {request.ticket.id}")
+        except asyncio.CancelledError:
+            logger.info(f"Client disconnected, cancelled triage stream for ticket {request.ticket.id}")
+            raise
+        except Exception as e:
+            logger.error(f"Streaming triage failed: {str(e)}")
+            yield _sse_event("error", {"detail": f"Triage processing failed: {str(e)}"})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/triage/batch", response_model=BatchTriageResponse)
+async def triage_batch(request: BatchTriageRequest, http_request: Request):
+    """
+    Triage several tickets in one call, returning per-ticket results and errors
+    """
+    require_ready()
+    start_time = time.time()
+    logger.info(f"Processing batch triage for {len(request.requests)} tickets")
+    
+    try:
+        outcomes = await cancel_on_disconnect(
+            http_request, agent_service.process_batch(request.requests)
+        )
+    except ClientDisconnected:
+        logger.info("Client disconnected, cancelled batch triage")
+        raise HTTPException(status_code=499, detail="Client closed request")
+    except Exception as e:
+        logger.error(f"Batch triage failed: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Batch triage processing failed: {str(e)}"
+        )
+    
+    results = []
+    for item, outcome in zip(request.requests, outcomes):
+        result = BatchTriageResult(ticketId=item.ticket.id, traceId=item.traceId)
+        if isinstance(outcome, Exception):
+            logger.error(f"Triage failed for ticket {item.ticket.id}: {outcome}")
+            result.error = f"Triage processing failed: {str(outcome)}"
+        else:
+            result.result = outcome
+        results.append(result)
+    
+    return BatchTriageResponse(
+        results=results,
+        processingTimeMs=int((time.time() - start_time) * 1000)
+    )
+
+@app.post("/draft", response_model=DraftResponse)
+async def draft_reply(request: DraftRequest, http_request: Request):
+    """
+    Draft a reply on demand for a ticket whose triage skipped drafting
+    """
+    require_ready()
+    try:
+        logger.info(f"Drafting reply for ticket {request.ticket.id}")
+        
+        return await cancel_on_disconnect(
+            http_request, agent_service.generate_draft(request)
+        )
+        
+    except ClientDisconnected:
+        logger.info(f"Client disconnected, cancelled draft for ticket {request.ticket.id}")
+        raise HTTPException(status_code=499, detail="Client closed request")
+        
+    except Exception as e:
+        logger.error(f"Drafting failed: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Drafting failed: {str(e)}"
+        )
+
+startup_seconds["import"] = time.perf_counter() - IMPORT_STARTED
+logger.info(f"Imported agent worker in {startup_seconds['import']:.2f}s")
+
 if __name__ == "__main__":
     uvicorn.run(
         "app.main:app",
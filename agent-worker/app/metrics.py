@@ -0,0 +1,203 @@
+import time
+import bisect
+import logging
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+
+# Trace id of the request being handled, propagated from X-Trace-ID
+trace_id_var: contextvars.ContextVar[str] = contextvars.ContextVar("trace_id", default="-")
+
+
+class RequestMetrics:
+    """
+    Per-request stage timings and token counts, reported under modelInfo
+    """
+
+    __slots__ = ("stages", "tokens")
+
+    def __init__(self):
+        self.stages: Dict[str, int] = {}
+        # "saved" counts estimated prompt tokens removed by the token budget
+        self.tokens = {"prompt": 0, "completion": 0, "saved": 0}
+
+    def to_dict(self) -> Dict:
+        return {"stagesMs": dict(self.stages), "tokens": dict(self.tokens)}
+
+
+request_metrics_var: contextvars.ContextVar[Optional[RequestMetrics]] = \
+    contextvars.ContextVar("request_metrics", default=None)
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...],
+                   extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Gauge:
+    """Gauge whose value is read from a callback at scrape time"""
+
+    def __init__(self, name: str, documentation: str,
+                 callback: Callable[[], Dict[Tuple[str, ...], float]],
+                 labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        try:
+            values = self.callback()
+        except Exception as e:
+            logger.warning(f"Gauge {self.name} callback failed: {e}")
+            values = {}
+        for labels, value in values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                label_str = _format_labels(self.labelnames, labels, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{label_str} {cumulative}")
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {total}")
+            lines.append(f"{self.name}_count{label_str} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_DURATION = REGISTRY.register(Histogram(
+    "triage_stage_duration_seconds", "Duration of each triage pipeline stage", ("stage",)
+))
+REQUEST_DURATION = REGISTRY.register(Histogram(
+    "triage_request_duration_seconds", "End-to-end duration of triage requests", ("endpoint",)
+))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "llm_tokens_total", "Tokens sent to and received from the LLM", ("direction",)
+))
+LLM_FALLBACKS = REGISTRY.register(Counter(
+    "llm_fallbacks_total", "LLM results replaced by the stub path, by cause",
+    ("operation", "cause")
+))
+LLM_HEDGES = REGISTRY.register(Counter(
+    "llm_hedged_requests_total", "Second LLM attempts fired after the hedge latency"
+))
+LLM_TOKENS_SAVED = REGISTRY.register(Counter(
+    "llm_prompt_tokens_saved_total", "Estimated prompt tokens removed by context compression"
+))
+
+
+def register_gauge(name: str, documentation: str,
+                   callback: Callable[[], Dict[Tuple[str, ...], float]],
+                   labelnames: Tuple[str, ...] = ()):
+    """Expose a value computed at scrape time, e.g. cache or queue state"""
+    REGISTRY.register(Gauge(name, documentation, callback, labelnames))
+
+
+@contextmanager
+def timed_stage(stage: str):
+    """Record a stage duration in the histogram and the current request"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_DURATION.observe(elapsed, stage)
+        current = request_metrics_var.get()
+        if current is not None:
+            current.stages[stage] = int(elapsed * 1000)
+        logger.debug(f"span stage={stage} durationMs={elapsed * 1000:.1f}")
+
+
+def record_tokens(prompt: int, completion: int):
+    LLM_TOKENS.inc("prompt", amount=prompt)
+    LLM_TOKENS.inc("completion", amount=completion)
+    current = request_metrics_var.get()
+    if current is not None:
+        current.tokens["prompt"] += prompt
+        current.tokens["completion"] += completion
+
+
+def record_prompt_savings(saved: int):
+    if not saved:
+        return
+    LLM_TOKENS_SAVED.inc(amount=saved)
+    current = request_metrics_var.get()
+    if current is not None:
+        current.tokens["saved"] += saved
+
+
+class TraceIdFilter(logging.Filter):
+    """Attach the current trace id to log records"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = trace_id_var.get()
+        return True
@@ -14,9 +14,22 @@ class TicketData(BaseModel):
     description: str
     category: Optional[CategoryEnum] = CategoryEnum.OTHER
 
+class TriageThresholds(BaseModel):
+    autoCloseEnabled: bool = True
+    confidenceThreshold: float = 0.78
+    categoryThresholds: Dict[str, float] = {}
+
+    def threshold_for(self, category: str) -> float:
+        """Effective threshold, resolved the same way as the backend"""
+        return self.categoryThresholds.get(category) or self.confidenceThreshold
+
+    def can_auto_close(self, category: str, confidence: float) -> bool:
+        return self.autoCloseEnabled and confidence >= self.threshold_for(category)
+
 class TriageRequest(BaseModel):
     ticket: TicketData
     traceId: str
+    thresholds: Optional[TriageThresholds] = None
 
 class ClassificationResult(BaseModel):
     predictedCategory: CategoryEnum
@@ -27,6 +40,8 @@ class ArticleMatch(BaseModel):
     title: str
     score: float
     snippet: str
+    lexicalScore: Optional[float] = None
+    semanticScore: Optional[float] = None
 
 class AgentSuggestion(BaseModel):
     predictedCategory: CategoryEnum
@@ -34,7 +49,35 @@ class AgentSuggestion(BaseModel):
     draftReply: str
     confidence: float
     modelInfo: Dict[str, Any]
+    # Near-duplicate tickets triaged within the same window share a cluster
+    clusterId: Optional[str] = None
 
 class TriageResponse(BaseModel):
     suggestion: AgentSuggestion
     processingTimeMs: int
+    skippedStages: List[str] = []
+
+class DraftRequest(BaseModel):
+    ticket: TicketData
+    traceId: str
+    category: Optional[CategoryEnum] = None
+    articleIds: Optional[List[str]] = None
+
+class DraftResponse(BaseModel):
+    draftReply: str
+    articleIds: List[str]
+    modelInfo: Dict[str, Any]
+    processingTimeMs: int
+
+class BatchTriageRequest(BaseModel):
+    requests: List[TriageRequest]
+
+class BatchTriageResult(BaseModel):
+    ticketId: str
+    traceId: str
+    result: Optional[TriageResponse] = None
+    error: Optional[str] = None
+
+class BatchTriageResponse(BaseModel):
+    results: List[BatchTriageResult]
+    processingTimeMs: int
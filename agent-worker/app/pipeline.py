@@ -0,0 +1,69 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List
+from .metrics import timed_stage
+
+logger = logging.getLogger(__name__)
+
+
+class Stage:
+    """
+    A named pipeline step and the stages whose results it needs
+    """
+
+    def __init__(self, name: str, run: Callable[[Dict[str, Any]], Awaitable[Any]],
+                 depends_on: List[str] = None):
+        self.name = name
+        self.run = run
+        self.depends_on = depends_on or []
+
+    def __repr__(self) -> str:
+        if self.depends_on:
+            return f"{self.name}<-{'+'.join(self.depends_on)}"
+        return self.name
+
+
+async def execute_plan(plan: List[Stage],
+                       on_complete: Callable[[str, Any], None] = None) -> Dict[str, Any]:
+    """
+    Run a plan as a dependency graph
+
+    Every stage starts as soon as the stages it depends on have finished, so
+    independent stages run concurrently. Each stage receives the results of
+    the stages completed so far, keyed by name. If any stage fails the rest
+    are cancelled and the error is raised.
+
+    on_complete, if given, is called with each stage's name and result as
+    soon as that stage finishes, e.g. to stream partial results.
+    """
+    results: Dict[str, Any] = {}
+    tasks: Dict[str, asyncio.Task] = {}
+
+    # Stages may only depend on earlier stages, which rules out cycles
+    seen = set()
+    for stage in plan:
+        missing = [dep for dep in stage.depends_on if dep not in seen]
+        if missing:
+            raise ValueError(f"Stage {stage.name} depends on {missing}, "
+                             f"which are not earlier in the plan")
+        seen.add(stage.name)
+
+    async def run_stage(stage: Stage):
+        for dep in stage.depends_on:
+            await tasks[dep]
+        with timed_stage(stage.name):
+            results[stage.name] = await stage.run(results)
+        if on_complete is not None:
+            on_complete(stage.name, results[stage.name])
+
+    for stage in plan:
+        tasks[stage.name] = asyncio.ensure_future(run_stage(stage))
+
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        raise
+
+    return results
@@ -0,0 +1,371 @@
+import os
+import re
+from string import Formatter
+from textwrap import dedent
+from typing import Dict, List, NamedTuple, Tuple
+
+# Gemini and most BPE tokenizers average about four characters per token
+# for English text; counting exactly would cost an API round trip
+CHARS_PER_TOKEN = 4
+
+# Stack frames kept from the top and bottom of each trace
+TRACE_HEAD_FRAMES = 3
+TRACE_TAIL_FRAMES = 2
+
+# Articles are dropped rather than cut shorter than this
+MIN_ARTICLE_TOKENS = 24
+
+ARTICLES_HEADER = "\nRelevant knowledge base articles:\n"
+
+FRAME_PATTERN = re.compile(
+    r"^\s*(?:"
+    r"at\s+\S.*"                           # JavaScript, Java, .NET
+    r"|File \".*\", line \d+.*"            # Python
+    r"|\.\.\. \d+ (?:more|common frames omitted)"
+    r"|#\d+\s+(?:0x[0-9a-fA-F]+|\S+\s+at\s).*"  # native backtraces
+    r")$"
+)
+PYTHON_FRAME_PATTERN = re.compile(r'^\s*File ".*", line \d+')
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _frames(lines: List[str], start: int) -> Tuple[List[Tuple[str, ...]], int]:
+    """Consecutive stack frames from `start`, with Python source lines attached"""
+    frames = []
+    i = start
+    while i < len(lines) and FRAME_PATTERN.match(lines[i]):
+        frame = [lines[i]]
+        i += 1
+        if PYTHON_FRAME_PATTERN.match(frame[0]) and i < len(lines) \
+                and lines[i].startswith(" ") and not FRAME_PATTERN.match(lines[i]):
+            frame.append(lines[i])
+            i += 1
+        frames.append(tuple(frame))
+    return frames, i
+
+
+def _compress_frames(frames: List[Tuple[str, ...]]) -> List[str]:
+    # Recursion repeats one frame many times; keep a single copy
+    collapsed: List[Tuple[Tuple[str, ...], int]] = []
+    for frame in frames:
+        if collapsed and collapsed[-1][0] == frame:
+            collapsed[-1] = (frame, collapsed[-1][1] + 1)
+        else:
+            collapsed.append((frame, 1))
+
+    lines = []
+    omitted = len(collapsed) - TRACE_HEAD_FRAMES - TRACE_TAIL_FRAMES
+    for i, (frame, count) in enumerate(collapsed):
+        if omitted > 0 and TRACE_HEAD_FRAMES <= i < len(collapsed) - TRACE_TAIL_FRAMES:
+            if i == TRACE_HEAD_FRAMES:
+                lines.append(f"    [... {omitted} frames omitted]")
+            continue
+        lines.extend(frame)
+        if count > 1:
+            lines.append(f"    [previous frame repeated {count - 1} more times]")
+    return lines
+
+
+def compress_stack_traces(text: str) -> str:
+    """
+    Remove the noise from pasted logs and stack traces
+
+    Each trace keeps its outermost and innermost frames, where the cause
+    usually is; repeated frames, repeated traces and runs of identical log
+    lines are collapsed into a short marker.
+    """
+    lines = text.splitlines()
+    output = []
+    seen_traces = set()
+    i = 0
+    while i < len(lines):
+        frames, end = _frames(lines, i)
+        if frames:
+            key = tuple(tuple(line.strip() for line in frame) for frame in frames)
+            if key in seen_traces:
+                output.append("    [same stack trace as above]")
+            else:
+                seen_traces.add(key)
+                output.extend(_compress_frames(frames))
+            i = end
+            continue
+
+        line = lines[i]
+        end = i + 1
+        while line.strip() and end < len(lines) and lines[end].strip() == line.strip():
+            end += 1
+        output.append(line if end - i == 1 else f"{line} [repeated {end - i} times]")
+        i = end
+    return "\n".join(output)
+
+
+def fit_text(text: str, max_tokens: int) -> str:
+    """
+    Truncate text to about `max_tokens`, keeping its beginning and end
+
+    The opening states the problem and the end tends to hold the latest
+    error, so the middle is dropped at word boundaries.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    budget = max(0, max_tokens * CHARS_PER_TOKEN - 40)
+    if budget == 0:
+        return ""
+    head_end = text.rfind(" ", 0, budget * 2 // 3)
+    head_end = head_end if head_end > 0 else budget * 2 // 3
+    tail_start = text.find(" ", len(text) - budget // 3)
+    tail_start = tail_start if tail_start != -1 else len(text) - budget // 3
+    omitted = tail_start - head_end
+    return f"{text[:head_end]} [... {omitted} characters omitted ...] {text[tail_start:].lstrip()}"
+
+
+class PromptTemplate:
+    """
+    Prompt text parsed once into literal and field segments
+
+    Rendering only joins the segments, and the fixed token cost of the
+    literal text is known up front for budgeting.
+    """
+
+    __slots__ = ("name", "_segments", "fields", "overhead_tokens")
+
+    def __init__(self, name: str, source: str, **constants: str):
+        self.name = name
+        # Constants are folded into the literal text at compile time
+        segments = []
+        for literal, field, _, _ in Formatter().parse(dedent(source).strip()):
+            if field in constants:
+                literal, field = literal + constants[field], None
+            if segments and segments[-1][1] is None:
+                literal = segments.pop()[0] + literal
+            segments.append((literal, field))
+        self._segments = segments
+        self.fields = {field for _, field in self._segments if field}
+        self.overhead_tokens = estimate_tokens("".join(literal for literal, _ in self._segments))
+
+    def render(self, **values: str) -> str:
+        return "".join(
+            literal + (values[field] if field else "") for literal, field in self._segments
+        )
+
+
+class Prompt(NamedTuple):
+    text: str
+    # Estimated tokens sent, and removed from the ticket and article context
+    tokens: int
+    saved_tokens: int = 0
+
+
+CATEGORY_GUIDE = dedent("""
+    - billing: payment, refund, invoice, subscription issues
+    - tech: technical problems, errors, bugs, login issues
+    - shipping: delivery, package, tracking, shipping issues
+    - other: general inquiries, other topics
+""").strip()
+
+# Each version is a complete prompt set; the version is recorded on every
+# suggestion as modelInfo.promptVersion and is part of the cache keys
+PROMPT_SETS: Dict[str, Dict[str, PromptTemplate]] = {
+    "v1.0": {
+        "classify": PromptTemplate("classify", """
+            Classify the following support ticket into one of these categories:
+            {categories}
+
+            Ticket: {ticket}
+
+            Respond with JSON format: {{"category": "billing|tech|shipping|other", "confidence": 0.0-1.0}}
+        """, categories=CATEGORY_GUIDE),
+        "classify_batch": PromptTemplate("classify_batch", """
+            Classify each of the following support tickets into one of these categories:
+            {categories}
+
+            Tickets:
+            {tickets}
+
+            Respond with a JSON array containing one object per ticket, in order:
+            [{{"index": 0, "category": "billing|tech|shipping|other", "confidence": 0.0-1.0}}, ...]
+        """, categories=CATEGORY_GUIDE),
+        "draft": PromptTemplate("draft", """
+            You are a helpful customer support agent. Write a professional, empathetic response to this support ticket.
+
+            Ticket Title: {title}
+            Ticket Description: {description}
+            Category: {category}
+            {articles}
+
+            Guidelines:
+            - Be helpful and professional
+            - Reference relevant articles if provided
+            - Offer next steps or escalation if needed
+            - Keep response concise but complete
+            - End with a professional closing
+        """)
+    },
+    # Instructions first and ticket content last, so every prompt of a kind
+    # shares its prefix and provider-side prefix caching can apply
+    "v1.1": {
+        "classify": PromptTemplate("classify", """
+            Classify the support ticket below into one of these categories:
+            {categories}
+
+            Respond with JSON only: {{"category": "billing|tech|shipping|other", "confidence": 0.0-1.0}}
+
+            Ticket: {ticket}
+        """, categories=CATEGORY_GUIDE),
+        "classify_batch": PromptTemplate("classify_batch", """
+            Classify each support ticket below into one of these categories:
+            {categories}
+
+            Respond with a JSON array only, one object per ticket, in order:
+            [{{"index": 0, "category": "billing|tech|shipping|other", "confidence": 0.0-1.0}}, ...]
+
+            Tickets:
+            {tickets}
+        """, categories=CATEGORY_GUIDE),
+        "draft": PromptTemplate("draft", """
+            You are a helpful customer support agent. Write a professional, empathetic response to the support ticket below.
+
+            Guidelines:
+            - Be helpful and professional
+            - Reference relevant articles if provided
+            - Offer next steps or escalation if needed
+            - Keep response concise but complete
+            - End with a professional closing
+            Long logs in the ticket may have been shortened; omitted parts are marked with [...].
+
+            Category: {category}
+            Ticket Title: {title}
+            Ticket Description: {description}
+            {articles}
+        """),
+        # Classification and draft in a single call
+        "triage": PromptTemplate("triage", """
+            You are a helpful customer support agent. Classify the support ticket below into one of these categories:
+            {categories}
+
+            Then write a professional, empathetic response to it.
+            - Be helpful and professional
+            - Reference relevant articles if provided
+            - Offer next steps or escalation if needed
+            - Keep response concise but complete
+            - End with a professional closing
+            Long logs in the ticket may have been shortened; omitted parts are marked with [...].
+
+            Respond with JSON only:
+            {{"category": "billing|tech|shipping|other", "confidence": 0.0-1.0, "draft": "response to the customer"}}
+
+            Ticket Title: {title}
+            Ticket Description: {description}
+            {articles}
+        """, categories=CATEGORY_GUIDE)
+    }
+}
+
+LATEST_PROMPT_VERSION = "v1.1"
+
+
+class PromptBuilder:
+    """
+    Renders the configured prompt set within a token budget
+
+    Ticket descriptions are cleaned of stack-trace noise, then ticket text
+    and article context are truncated until the whole prompt fits.
+    """
+
+    def __init__(self, version: str = None, max_input_tokens: int = None,
+                 classify_ticket_tokens: int = None):
+        self.version = version or os.getenv("PROMPT_VERSION", LATEST_PROMPT_VERSION)
+        if self.version not in PROMPT_SETS:
+            raise ValueError(
+                f"Unknown prompt version {self.version!r}, "
+                f"expected one of {', '.join(PROMPT_SETS)}"
+            )
+        self.templates = PROMPT_SETS[self.version]
+        self.max_input_tokens = max_input_tokens if max_input_tokens is not None else \
+            int(os.getenv("PROMPT_MAX_INPUT_TOKENS", "2000"))
+        # Per-ticket cap in classification prompts; the category rarely
+        # depends on anything past the first few paragraphs
+        self.classify_ticket_tokens = classify_ticket_tokens if classify_ticket_tokens is not None else \
+            int(os.getenv("PROMPT_CLASSIFY_TICKET_TOKENS", "400"))
+
+    def _ticket_text(self, text: str, max_tokens: int) -> Tuple[str, int]:
+        """Compressed ticket text and the tokens saved on it"""
+        fitted = fit_text(compress_stack_traces(text), max_tokens)
+        return fitted, max(0, estimate_tokens(text) - estimate_tokens(fitted))
+
+    def _prompt(self, template: PromptTemplate, saved_tokens: int, **values: str) -> Prompt:
+        text = template.render(**values)
+        return Prompt(text, estimate_tokens(text), saved_tokens)
+
+    def classify(self, text: str) -> Prompt:
+        template = self.templates["classify"]
+        budget = min(self.classify_ticket_tokens, self.max_input_tokens - template.overhead_tokens)
+        ticket, saved = self._ticket_text(text, budget)
+        return self._prompt(template, saved, ticket=ticket)
+
+    def classify_batch(self, texts: List[str]) -> Prompt:
+        template = self.templates["classify_batch"]
+        budget = min(
+            self.classify_ticket_tokens,
+            (self.max_input_tokens - template.overhead_tokens) // max(1, len(texts))
+        )
+        lines, saved = [], 0
+        for i, text in enumerate(texts):
+            # Keep one ticket per line so indices stay unambiguous
+            ticket, ticket_saved = self._ticket_text(text, budget)
+            lines.append(f"[{i}] {' '.join(ticket.split())}")
+            saved += ticket_saved
+        return self._prompt(template, saved, tickets="\n".join(lines))
+
+    def draft(self, ticket, articles: List, category: str) -> Prompt:
+        return self._ticket_prompt(self.templates["draft"], ticket, articles, category=category)
+
+    def triage(self, ticket, articles: List) -> Prompt:
+        """Combined classification and draft prompt, if this version has one"""
+        return self._ticket_prompt(self.templates["triage"], ticket, articles)
+
+    def _ticket_prompt(self, template: PromptTemplate, ticket, articles: List,
+                       **values: str) -> Prompt:
+        """
+        The description gets at least 60% of the variable budget and any
+        share the articles leave unused; articles are added in rank order
+        and the last one that fits is cut short.
+        """
+        available = self.max_input_tokens - template.overhead_tokens - \
+            sum(estimate_tokens(value) for value in values.values())
+
+        title = fit_text(ticket.title, max(1, available // 10))
+        available -= estimate_tokens(title)
+
+        entries = [f"{i}. {article.title}\n{article.snippet}\n" for i, article in enumerate(articles, 1)]
+        if entries:
+            # The list header and a newline between entries
+            available -= estimate_tokens(ARTICLES_HEADER) + len(entries)
+        articles_need = sum(estimate_tokens(entry) for entry in entries)
+        description_budget = max(available * 3 // 5, available - articles_need)
+        description, saved = self._ticket_text(ticket.description, description_budget)
+        saved += estimate_tokens(ticket.title) - estimate_tokens(title)
+
+        included = []
+        remaining = available - estimate_tokens(description)
+        for entry in entries:
+            cost = estimate_tokens(entry)
+            if cost <= remaining:
+                included.append(entry)
+                remaining -= cost
+            elif remaining >= MIN_ARTICLE_TOKENS:
+                included.append(fit_text(entry, remaining))
+                remaining = 0
+        saved += articles_need - sum(estimate_tokens(entry) for entry in included)
+
+        articles_text = ""
+        if included:
+            articles_text = ARTICLES_HEADER + "\n".join(included)
+
+        return self._prompt(
+            template, max(0, saved),
+            title=title, description=description, articles=articles_text, **values
+        )
@@ -0,0 +1,159 @@
+import os
+import re
+import json
+import random
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Callable, Dict, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+FAKE_REPLY = "This is a fake completion."
+# Tickets of a batch prompt are listed one per line as "[i] ..."
+BATCH_ITEM_PATTERN = re.compile(r"^\[\d+\] ", re.MULTILINE)
+
+
+class Generation(NamedTuple):
+    text: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+class GeminiProvider:
+    """
+    Google Gemini completions
+    """
+
+    name = "gemini"
+
+    def __init__(self, api_key: str, model_name: str = "gemini-pro"):
+        # Imported lazily; the SDK takes most of a second to import and is
+        # not needed in stub or fake mode
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        self.genai = genai
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+        # JSON responses constrained by a schema need Gemini 1.5 or later
+        self.supports_json_mode = not model_name.startswith(("gemini-pro", "gemini-1.0"))
+
+    @staticmethod
+    def _usage(response) -> tuple:
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return 0, 0
+        return usage.prompt_token_count, usage.candidates_token_count
+
+    async def generate(self, prompt: str, schema: Optional[Dict[str, Any]] = None) -> Generation:
+        """Complete a prompt, as JSON matching `schema` if one is given"""
+        generation_config = None
+        if schema is not None:
+            generation_config = self.genai.GenerationConfig(
+                response_mime_type="application/json", response_schema=schema
+            )
+        response = await self.model.generate_content_async(
+            prompt, generation_config=generation_config
+        )
+        return Generation(response.text.strip(), *self._usage(response))
+
+    async def stream(self, prompt: str) -> AsyncIterator[Generation]:
+        """Yield text chunks; the last item carries the token usage"""
+        response = await self.model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            if chunk.text:
+                yield Generation(chunk.text)
+        yield Generation("", *self._usage(response))
+
+
+class FakeProvider:
+    """
+    Local provider with injectable latency and failures, for exercising
+    timeouts, hedging and the circuit breaker offline
+
+    `respond` maps a prompt to the completion text. By default a fixed
+    reply is returned, or JSON matching the schema if one is passed.
+    """
+
+    name = "fake"
+
+    def __init__(self, latency_ms: float = 50.0, jitter_ms: float = 0.0,
+                 error_rate: float = 0.0, respond: Optional[Callable[[str], str]] = None,
+                 seed: Optional[int] = None):
+        self.model_name = "fake-v1"
+        self.supports_json_mode = True
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.respond = respond
+        self.calls = 0
+        self._random = random.Random(seed)
+
+    async def _simulate(self):
+        self.calls += 1
+        delay = self.latency_ms + self._random.uniform(0, self.jitter_ms)
+        await asyncio.sleep(delay / 1000)
+        if self._random.random() < self.error_rate:
+            raise RuntimeError("Injected fake provider failure")
+
+    async def generate(self, prompt: str, schema: Optional[Dict[str, Any]] = None) -> Generation:
+        await self._simulate()
+        if self.respond is None and schema is not None:
+            text = json.dumps(_schema_example(schema, len(BATCH_ITEM_PATTERN.findall(prompt))))
+        else:
+            text = self.respond(prompt) if self.respond else FAKE_REPLY
+        return Generation(text, len(prompt.split()), len(text.split()))
+
+    async def stream(self, prompt: str) -> AsyncIterator[Generation]:
+        await self._simulate()
+        text = self.respond(prompt) if self.respond else FAKE_REPLY
+        for line in text.splitlines(keepends=True):
+            yield Generation(line)
+        yield Generation("", len(prompt.split()), len(text.split()))
+
+
+def _schema_example(schema: Dict[str, Any], items: int = 0, index: int = 0) -> Any:
+    """
+    A value matching a response schema: the first enum value, a placeholder
+    per type, and for arrays one item per ticket of a batch prompt
+    """
+    kind = schema.get("type")
+    if "enum" in schema:
+        return schema["enum"][0]
+    if kind == "object":
+        return {
+            name: index if name == "index" else _schema_example(prop, items, index)
+            for name, prop in schema.get("properties", {}).items()
+        }
+    if kind == "array":
+        return [_schema_example(schema["items"], items, i) for i in range(max(items, 1))]
+    if kind == "integer":
+        return 0
+    if kind == "number":
+        return 0.5
+    if kind == "boolean":
+        return False
+    return FAKE_REPLY
+
+
+def create_provider():
+    """
+    Build the provider selected by LLM_PROVIDER (gemini or fake)
+
+    Returns None when no provider is usable, in which case callers use
+    the deterministic stub path.
+    """
+    kind = os.getenv("LLM_PROVIDER", "gemini")
+    if kind == "fake":
+        logger.info("Using fake LLM provider")
+        return FakeProvider(
+            latency_ms=float(os.getenv("FAKE_LLM_LATENCY_MS", "50")),
+            jitter_ms=float(os.getenv("FAKE_LLM_JITTER_MS", "0")),
+            error_rate=float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+        )
+
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        logger.warning("No Gemini API key found, falling back to stub mode")
+        return None
+    return GeminiProvider(api_key, os.getenv("GEMINI_MODEL", "gemini-pro"))
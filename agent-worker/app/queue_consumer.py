@@ -0,0 +1,283 @@
+import os
+import json
+import socket
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+from pydantic import ValidationError
+from .models import TriageRequest
+
+logger = logging.getLogger(__name__)
+
+
+class TriageQueueConsumer:
+    """
+    Consumes triage jobs from a Redis stream consumer group
+
+    Each job entry carries a JSON `payload` in the shape of a TriageRequest.
+    Results are appended to a results stream and the job is acknowledged in
+    the same transaction, so a job is either answered once or redelivered.
+
+    - Backpressure: at most `prefetch` jobs are held unacknowledged, and
+      only `concurrency` of them are processed at a time; nothing more is
+      read until a slot frees up.
+    - Visibility timeout: jobs left pending longer than
+      `visibility_timeout_ms` (e.g. their worker died) are claimed by
+      another consumer. A live consumer refreshes the idle time of the jobs
+      it holds, including ones still waiting for a slot, so they are not
+      reclaimed while it works on them.
+    - Dead-lettering: malformed jobs, and jobs delivered more than
+      `max_deliveries` times, are moved to the dead-letter stream and
+      answered with an error result.
+    """
+
+    def __init__(self, agent_service, redis, jobs_stream: str = "triage:jobs",
+                 results_stream: str = "triage:results",
+                 dead_letter_stream: str = "triage:dead",
+                 group: str = "agent-workers", consumer: Optional[str] = None,
+                 prefetch: int = 16, concurrency: int = 8,
+                 visibility_timeout_ms: int = 60000, max_deliveries: int = 3,
+                 block_ms: int = 1000, results_maxlen: int = 10000):
+        self.agent_service = agent_service
+        self.redis = redis
+        self.jobs_stream = jobs_stream
+        self.results_stream = results_stream
+        self.dead_letter_stream = dead_letter_stream
+        self.group = group
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.prefetch = max(prefetch, concurrency)
+        self.visibility_timeout_ms = visibility_timeout_ms
+        self.max_deliveries = max_deliveries
+        self.block_ms = block_ms
+        self.results_maxlen = results_maxlen
+
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._active: Dict[str, asyncio.Task] = {}
+        self._slot_freed = asyncio.Event()
+        self._task = None
+        self._stopping = False
+        self.stats = {"processed": 0, "failed": 0, "deadLettered": 0, "reclaimed": 0}
+
+    @property
+    def in_flight(self) -> int:
+        """Jobs read but not yet acknowledged (processing or waiting for a slot)"""
+        return len(self._active)
+
+    async def ensure_group(self):
+        try:
+            await self.redis.xgroup_create(self.jobs_stream, self.group, id="0", mkstream=True)
+            logger.info(f"Created consumer group {self.group} on {self.jobs_stream}")
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def run(self):
+        """Read, reclaim and dispatch jobs until stopped"""
+        await self.ensure_group()
+        loop = asyncio.get_running_loop()
+        next_reclaim = 0.0
+
+        while not self._stopping:
+            try:
+                if loop.time() >= next_reclaim:
+                    await self.reclaim_stale()
+                    next_reclaim = loop.time() + self.visibility_timeout_ms / 2000
+
+                free = self.prefetch - len(self._active)
+                if free <= 0:
+                    # Backpressure: stop reading until a job is acknowledged,
+                    # waking up in time to keep the held jobs' visibility
+                    self._slot_freed.clear()
+                    try:
+                        await asyncio.wait_for(self._slot_freed.wait(),
+                                               timeout=max(0.0, next_reclaim - loop.time()))
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                response = await self.redis.xreadgroup(
+                    self.group, self.consumer, {self.jobs_stream: ">"},
+                    count=free, block=self.block_ms
+                )
+                for _, entries in response or []:
+                    for message_id, fields in entries:
+                        self._dispatch(message_id, fields)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Triage queue read failed: {e}")
+                await asyncio.sleep(1.0)
+
+    async def reclaim_stale(self):
+        """Take over jobs whose consumer has not acknowledged them in time"""
+        await self.extend_visibility()
+        start_id = "0-0"
+        while len(self._active) < self.prefetch:
+            start_id, entries, *_ = await self.redis.xautoclaim(
+                self.jobs_stream, self.group, self.consumer,
+                min_idle_time=self.visibility_timeout_ms, start_id=start_id,
+                count=self.prefetch - len(self._active)
+            )
+            if entries:
+                deliveries = await self._delivery_counts([message_id for message_id, _ in entries])
+                for message_id, fields in entries:
+                    if _decode(message_id) in self._active:
+                        continue
+                    self.stats["reclaimed"] += 1
+                    if deliveries.get(_decode(message_id), 0) > self.max_deliveries:
+                        await self._dead_letter(message_id, fields, "max deliveries exceeded")
+                    else:
+                        logger.warning(f"Reclaimed stale triage job {_decode(message_id)}")
+                        self._dispatch(message_id, fields)
+            if _decode(start_id) == "0-0":
+                break
+
+    async def extend_visibility(self):
+        """Reset the idle time of held jobs without counting a redelivery"""
+        if self._active:
+            await self.redis.xclaim(
+                self.jobs_stream, self.group, self.consumer, min_idle_time=0,
+                message_ids=list(self._active), justid=True
+            )
+
+    async def _delivery_counts(self, message_ids: List) -> Dict[str, int]:
+        counts = {}
+        for message_id in message_ids:
+            pending = await self.redis.xpending_range(
+                self.jobs_stream, self.group, min=message_id, max=message_id, count=1
+            )
+            for entry in pending:
+                counts[_decode(entry["message_id"])] = entry["times_delivered"]
+        return counts
+
+    def _dispatch(self, message_id, fields):
+        key = _decode(message_id)
+        if key in self._active:
+            # Already held; a second task would triage and answer it twice
+            return
+        task = asyncio.create_task(self._handle(message_id, fields))
+        self._active[key] = task
+
+        def done(_):
+            self._active.pop(key, None)
+            self._slot_freed.set()
+
+        task.add_done_callback(done)
+
+    async def _handle(self, message_id, fields):
+        try:
+            request, job = self._parse(fields)
+        except (KeyError, ValueError, ValidationError) as e:
+            logger.error(f"Malformed triage job {_decode(message_id)}: {e}")
+            await self._dead_letter(message_id, fields, f"malformed job: {e}")
+            return
+
+        async with self._semaphore:
+            try:
+                response = await self.agent_service.process_triage(request)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Left unacknowledged; redelivered after the visibility timeout
+                self.stats["failed"] += 1
+                logger.error(f"Triage job {_decode(message_id)} failed: {e}")
+                return
+
+        await self._complete(message_id, {
+            **job,
+            "status": "ok",
+            "result": response.model_dump_json()
+        })
+        self.stats["processed"] += 1
+
+    def _parse(self, fields) -> Tuple[TriageRequest, Dict[str, str]]:
+        fields = {_decode(key): _decode(value) for key, value in fields.items()}
+        request = TriageRequest.model_validate_json(fields["payload"])
+        job = {
+            "jobId": fields.get("jobId", ""),
+            "ticketId": request.ticket.id,
+            "traceId": request.traceId
+        }
+        return request, job
+
+    async def _complete(self, message_id, result: Dict[str, str]):
+        """Publish the result and acknowledge the job atomically"""
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.xadd(self.results_stream, result,
+                      maxlen=self.results_maxlen, approximate=True)
+            pipe.xack(self.jobs_stream, self.group, message_id)
+            await pipe.execute()
+
+    async def _dead_letter(self, message_id, fields, reason: str):
+        fields = {_decode(key): _decode(value) for key, value in fields.items()}
+        try:
+            payload = json.loads(fields.get("payload", "{}"))
+            ticket_id = payload.get("ticket", {}).get("id", "")
+            trace_id = payload.get("traceId", "")
+        except (ValueError, AttributeError):
+            ticket_id = trace_id = ""
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.xadd(self.dead_letter_stream, {
+                **fields, "sourceId": _decode(message_id), "reason": reason
+            })
+            pipe.xadd(self.results_stream, {
+                "jobId": fields.get("jobId", ""),
+                "ticketId": ticket_id,
+                "traceId": trace_id,
+                "status": "error",
+                "error": reason
+            }, maxlen=self.results_maxlen, approximate=True)
+            pipe.xack(self.jobs_stream, self.group, message_id)
+            await pipe.execute()
+
+        self.stats["deadLettered"] += 1
+        logger.warning(f"Dead-lettered triage job {_decode(message_id)}: {reason}")
+
+    async def start(self):
+        await self.ensure_group()
+        self._task = asyncio.create_task(self.run())
+        logger.info(f"Consuming triage jobs from {self.jobs_stream} as {self.consumer}")
+
+    async def stop(self, drain_seconds: float = 10.0):
+        """Stop reading and give in-flight jobs a chance to finish"""
+        self._stopping = True
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._active:
+            # Unfinished jobs stay pending and are reclaimed by another consumer
+            await asyncio.wait(list(self._active.values()), timeout=drain_seconds)
+            for task in self._active.values():
+                task.cancel()
+        await self.redis.aclose()
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def create_queue_consumer(agent_service) -> Optional[TriageQueueConsumer]:
+    """Build the triage queue consumer if TRIAGE_QUEUE_ENABLED is set"""
+    if os.getenv("TRIAGE_QUEUE_ENABLED", "false").lower() != "true":
+        return None
+
+    # Imported lazily so the HTTP-only worker runs without redis installed
+    import redis.asyncio as aioredis
+
+    redis_url = os.getenv("TRIAGE_QUEUE_REDIS_URL") or os.getenv("REDIS_URL", "redis://localhost:6379")
+    return TriageQueueConsumer(
+        agent_service,
+        aioredis.from_url(redis_url),
+        jobs_stream=os.getenv("TRIAGE_JOBS_STREAM", "triage:jobs"),
+        results_stream=os.getenv("TRIAGE_RESULTS_STREAM", "triage:results"),
+        dead_letter_stream=os.getenv("TRIAGE_DEAD_LETTER_STREAM", "triage:dead"),
+        prefetch=int(os.getenv("TRIAGE_QUEUE_PREFETCH", "16")),
+        concurrency=int(os.getenv("TRIAGE_QUEUE_CONCURRENCY", "8")),
+        visibility_timeout_ms=int(os.getenv("TRIAGE_QUEUE_VISIBILITY_TIMEOUT_MS", "60000")),
+        max_deliveries=int(os.getenv("TRIAGE_QUEUE_MAX_DELIVERIES", "3"))
+    )
@@ -0,0 +1,144 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit is open"""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for one provider/model
+
+    After `failure_threshold` failures in a row the circuit opens and calls
+    are rejected immediately. Once `reset_seconds` have passed a single probe
+    call is let through (half-open); its outcome closes or re-opens the circuit.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        """Whether a call may be attempted now"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_seconds:
+                return False
+            self.state = self.HALF_OPEN
+            logger.info(f"Circuit {self.name} half-open, probing")
+        if self._probing:
+            return False
+        self._probing = True
+        return True
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info(f"Circuit {self.name} closed")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"Circuit {self.name} opened after {self.failures} failures")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """Give up a probe slot without an outcome (e.g. the call was cancelled)"""
+        self._probing = False
+
+
+class LatencyTracker:
+    """
+    Sliding window of recent successful call latencies
+    """
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def observe(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Latency at quantile `q`, or None until enough calls were seen"""
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit
+
+    Each success raises the limit by 1/limit (about +1 per round of calls);
+    each overload signal (a timeout) halves it. The limit stays in
+    [min_limit, max_limit].
+    """
+
+    def __init__(self, max_limit: int, min_limit: int = 1, initial_limit: Optional[int] = None):
+        self.max_limit = max_limit
+        self.min_limit = min(min_limit, max_limit)
+        self.limit = float(initial_limit or max_limit)
+        self.in_flight = 0
+        self._waiters: deque = deque()
+
+    def _has_capacity(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    async def acquire(self):
+        while not self._has_capacity():
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        self.in_flight += 1
+
+    def try_acquire(self) -> bool:
+        """Take a slot only if one is free right now"""
+        if not self._has_capacity():
+            return False
+        self.in_flight += 1
+        return True
+
+    def decrease(self):
+        self.limit = max(self.min_limit, self.limit / 2)
+
+    def release(self, success: Optional[bool] = None):
+        """Free a slot; success=None leaves the limit unchanged (e.g. cancellation)"""
+        if success is True:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+        elif success is False:
+            self.decrease()
+        self.in_flight -= 1
+        # Woken waiters re-check capacity, so waking a few extra is harmless
+        for _ in range(max(0, int(self.limit) - self.in_flight)):
+            if not self._waiters:
+                break
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
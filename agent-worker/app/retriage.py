@@ -0,0 +1,499 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import shutil
+import tempfile
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from .models import TriageThresholds
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_VERSION = 1
+
+# Defaults of backend/src/models/Config.js, which the backend applies when
+# no Config document exists or a field is missing from it
+BACKEND_CONFIG_DEFAULTS = {
+    "autoCloseEnabled": True,
+    "confidenceThreshold": 0.78,
+    "categoryThresholds": {"billing": 0.78, "tech": 0.85, "shipping": 0.75, "other": 0.80}
+}
+
+# Worker process state, set up once by _init_worker
+_agent = None
+_loop = None
+_thresholds: Optional[TriageThresholds] = None
+
+
+def _object_id(value) -> Optional[str]:
+    """Plain id from a document field, including extended JSON {"$oid": ...}"""
+    if isinstance(value, dict):
+        value = value.get("$oid")
+    return str(value) if value is not None else None
+
+
+def normalize_ticket(doc: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Convert an exported Ticket document into triage form, or None if unusable"""
+    ticket_id = _object_id(doc.get("id") or doc.get("_id"))
+    if not ticket_id or not doc.get("title") or not doc.get("description"):
+        return None
+    return {
+        "id": ticket_id,
+        "title": doc["title"],
+        "description": doc["description"],
+        "category": doc.get("category") or "other"
+    }
+
+
+def read_chunks(path: str, chunk_size: int,
+                skip: frozenset = frozenset()) -> Iterator[Tuple[int, List[Dict[str, Any]], int]]:
+    """
+    Stream (chunk id, tickets, unusable count) from a mongoexport JSONL file
+
+    Chunks are fixed runs of `chunk_size` lines, so ids are stable across
+    runs and chunks in `skip` are passed over without parsing.
+    """
+    def parse(lines):
+        tickets = [normalize_ticket(json.loads(line)) for line in lines]
+        usable = [ticket for ticket in tickets if ticket is not None]
+        return usable, len(tickets) - len(usable)
+
+    chunk_id, lines = 0, []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            lines.append(line)
+            if len(lines) == chunk_size:
+                if chunk_id not in skip:
+                    yield (chunk_id, *parse(lines))
+                chunk_id, lines = chunk_id + 1, []
+    if lines and chunk_id not in skip:
+        yield (chunk_id, *parse(lines))
+
+
+def load_suggestions(path: str) -> Dict[str, Dict[str, Any]]:
+    """Latest stored AgentSuggestion per ticket id from a mongoexport JSONL file"""
+    def created_at(doc):
+        value = doc.get("createdAt")
+        return str(value.get("$date") if isinstance(value, dict) else value or "")
+
+    latest: Dict[str, Dict[str, Any]] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            doc = json.loads(line)
+            ticket_id = _object_id(doc.get("ticketId"))
+            if ticket_id is None:
+                continue
+            if ticket_id not in latest or created_at(doc) >= created_at(latest[ticket_id]):
+                latest[ticket_id] = doc
+    return latest
+
+
+def load_thresholds(path: Optional[str] = None) -> TriageThresholds:
+    """
+    Auto-close thresholds of the backend, from a mongoexport of the configs
+    collection (JSONL or --jsonArray) or, without one, the Config defaults
+    """
+    doc: Dict[str, Any] = {}
+    if path is not None:
+        with open(path, encoding="utf-8") as f:
+            content = f.read().strip()
+        docs = json.loads(content) if content.startswith("[") else \
+            [json.loads(line) for line in content.splitlines() if line.strip()]
+        if not docs:
+            raise ValueError(f"{path} contains no Config document")
+        # The backend reads the first document (Config.findOne)
+        doc = docs[0]
+
+    defaults = BACKEND_CONFIG_DEFAULTS
+    return TriageThresholds(
+        autoCloseEnabled=doc.get("autoCloseEnabled", defaults["autoCloseEnabled"]),
+        confidenceThreshold=doc.get("confidenceThreshold", defaults["confidenceThreshold"]),
+        categoryThresholds={
+            **defaults["categoryThresholds"], **(doc.get("categoryThresholds") or {})
+        }
+    )
+
+
+def _init_worker(snapshot_dir: str, thresholds: Dict[str, Any]):
+    """Attach the worker to the shared KB snapshot and build its LLM provider"""
+    global _agent, _loop, _thresholds
+    logging.basicConfig(level=logging.WARNING)
+    from .agent import AgentService
+    from .kb_snapshot import SnapshotFollower
+
+    _agent = AgentService()
+    SnapshotFollower(_agent.kb_service, snapshot_dir).refresh()
+    _thresholds = TriageThresholds(**thresholds)
+    # One loop for the life of the worker, as provider clients bind to it
+    _loop = asyncio.new_event_loop()
+
+
+async def _classify(texts: List[str]) -> List[Any]:
+    """
+    Classify in concurrent groups of the size /triage's micro-batcher sends,
+    so each ticket gets the same share of the prompt budget as it does live
+    """
+    size = _agent.llm_provider.classify_batch_size
+    groups = await asyncio.gather(*[
+        _agent.llm_provider.classify_batch(texts[start:start + size])
+        for start in range(0, len(texts), size)
+    ])
+    return [result for group in groups for result in group]
+
+
+async def _triage_chunk(tickets: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Classification and retrieval for a chunk, without drafting"""
+    texts = [f"{ticket['title']} {ticket['description']}" for ticket in tickets]
+    classifications = await _classify(texts)
+    article_lists = await _agent.kb_service.search_batch([
+        (text, classification.predictedCategory.value)
+        for text, classification in zip(texts, classifications)
+    ])
+
+    rows = []
+    for ticket, classification, articles in zip(tickets, classifications, article_lists):
+        category = classification.predictedCategory.value
+        confidence = _agent._calculate_confidence(classification.confidence, len(articles))
+        rows.append({
+            "ticketId": ticket["id"],
+            "predictedCategory": category,
+            "classificationConfidence": round(classification.confidence, 4),
+            "confidence": round(confidence, 4),
+            "autoClose": _thresholds.can_auto_close(category, confidence),
+            "articleIds": [article.id for article in articles]
+        })
+    return rows
+
+
+def _process_chunk(chunk_id: int, tickets: List[Dict[str, Any]]) -> Tuple[int, List[Dict[str, Any]]]:
+    return chunk_id, _loop.run_until_complete(_triage_chunk(tickets))
+
+
+class JsonlResultWriter:
+    """
+    Appends each chunk's rows to one JSONL file
+
+    The checkpoint records the file size after every chunk; on resume the
+    file is cut back to it, dropping rows of a chunk that was interrupted.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def open(self, checkpoint: "Checkpoint"):
+        self._file = open(self.path, "ab")
+        self._file.truncate(checkpoint.output_bytes)
+
+    def write_chunk(self, chunk_id: int, rows: List[Dict[str, Any]]) -> int:
+        self._file.write("".join(json.dumps(row) + "\n" for row in rows).encode("utf-8"))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return self._file.tell()
+
+    def close(self):
+        self._file.close()
+
+    def read_all(self) -> Iterator[Dict[str, Any]]:
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+
+class ParquetResultWriter:
+    """
+    Writes each chunk as a part file of a Parquet dataset directory
+
+    Parts are renamed into place once complete; parts of chunks missing
+    from the checkpoint are removed on open and redone. Requires pyarrow.
+    """
+
+    def __init__(self, path: str):
+        # Imported lazily so JSONL output works without pyarrow installed
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ValueError("Parquet output requires pyarrow (pip install pyarrow)")
+        self.pyarrow = pyarrow
+        self.parquet = pyarrow.parquet
+        self.path = path
+
+    def _part(self, chunk_id: int) -> str:
+        return os.path.join(self.path, f"part-{chunk_id:06d}.parquet")
+
+    def open(self, checkpoint: "Checkpoint"):
+        os.makedirs(self.path, exist_ok=True)
+        keep = {os.path.basename(self._part(chunk_id)) for chunk_id in checkpoint.completed}
+        for name in os.listdir(self.path):
+            if name.startswith("part-") and name not in keep:
+                os.unlink(os.path.join(self.path, name))
+
+    def write_chunk(self, chunk_id: int, rows: List[Dict[str, Any]]) -> int:
+        part = self._part(chunk_id)
+        self.parquet.write_table(self.pyarrow.Table.from_pylist(rows), part + ".tmp")
+        os.replace(part + ".tmp", part)
+        return 0
+
+    def close(self):
+        pass
+
+    def read_all(self) -> Iterator[Dict[str, Any]]:
+        for name in sorted(os.listdir(self.path)):
+            if name.endswith(".parquet"):
+                yield from self.parquet.read_table(os.path.join(self.path, name)).to_pylist()
+
+
+class Checkpoint:
+    """Completed chunk ids and output position of a run, saved atomically"""
+
+    def __init__(self, path: str, settings: Dict[str, Any]):
+        self.path = path
+        self.settings = settings
+        self.completed = set()
+        self.output_bytes = 0
+
+    def load(self):
+        """Resume from the saved checkpoint, if it was made with the same settings"""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return
+        if saved.get("version") != CHECKPOINT_VERSION or saved["settings"] != self.settings:
+            raise ValueError(
+                f"Checkpoint {self.path} was written with different settings "
+                f"({saved.get('settings')}); pass --restart to start over"
+            )
+        self.completed = set(saved["completed"])
+        self.output_bytes = saved["outputBytes"]
+
+    def save(self):
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({
+                "version": CHECKPOINT_VERSION,
+                "settings": self.settings,
+                "completed": sorted(self.completed),
+                "outputBytes": self.output_bytes
+            }, f)
+        os.replace(self.path + ".tmp", self.path)
+
+
+def summarize(rows: Iterator[Dict[str, Any]],
+              stored: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Auto-close rate and category mix of a run, compared per ticket against
+    the stored suggestions where there is one
+    """
+    stored = stored or {}
+    total = auto_closed = compared = agreed = newly_closed = no_longer_closed = 0
+    stored_auto_closed = compared_auto_closed = 0
+    confidence_delta = 0.0
+    by_category: Dict[str, Dict[str, int]] = {}
+
+    for row in rows:
+        total += 1
+        auto_closed += row["autoClose"]
+        category = by_category.setdefault(row["predictedCategory"], {"tickets": 0, "autoClosed": 0})
+        category["tickets"] += 1
+        category["autoClosed"] += row["autoClose"]
+
+        previous = stored.get(row["ticketId"])
+        if previous is None:
+            continue
+        compared += 1
+        was_closed = bool(previous.get("autoClosed"))
+        stored_auto_closed += was_closed
+        compared_auto_closed += row["autoClose"]
+        agreed += row["predictedCategory"] == previous.get("predictedCategory")
+        newly_closed += row["autoClose"] and not was_closed
+        no_longer_closed += was_closed and not row["autoClose"]
+        confidence_delta += row["confidence"] - float(previous.get("confidence") or 0.0)
+
+    def rate(count, of):
+        return round(count / of, 4) if of else None
+
+    summary = {
+        "tickets": total,
+        "autoCloseRate": rate(auto_closed, total),
+        "categories": {
+            name: {**counts, "autoCloseRate": rate(counts["autoClosed"], counts["tickets"])}
+            for name, counts in sorted(by_category.items())
+        }
+    }
+    if stored:
+        summary["comparison"] = {
+            "tickets": compared,
+            "storedAutoCloseRate": rate(stored_auto_closed, compared),
+            "newAutoCloseRate": rate(compared_auto_closed, compared),
+            "categoryAgreement": rate(agreed, compared),
+            "newlyAutoClosed": newly_closed,
+            "noLongerAutoClosed": no_longer_closed,
+            "meanConfidenceDelta": round(confidence_delta / compared, 4) if compared else None
+        }
+    return summary
+
+
+def run(args) -> Dict[str, Any]:
+    """Re-triage the export in parallel chunks and return the summary"""
+    # Every ticket is scored fresh; clustering and caching would skew the rates
+    os.environ["TRIAGE_CACHE_ENABLED"] = "false"
+    os.environ["TRIAGE_DEDUP_ENABLED"] = "false"
+    # Chunks are already packed into classify_batch calls
+    os.environ["TRIAGE_BATCH_WINDOW_MS"] = "0"
+    if args.prompt_version:
+        os.environ["PROMPT_VERSION"] = args.prompt_version
+    if args.stub:
+        os.environ["STUB_MODE"] = "true"
+    if args.kb_articles:
+        os.environ["KB_SOURCE"] = "file"
+        os.environ["KB_SOURCE_PATH"] = args.kb_articles
+
+    from .kb_snapshot import publish_from_source
+    from .llm_provider import LLMProvider
+    from .prompts import LATEST_PROMPT_VERSION
+
+    # Flags override the backend's Config, as exported or by default
+    thresholds = load_thresholds(args.config)
+    if args.auto_close is not None:
+        thresholds.autoCloseEnabled = args.auto_close
+    if args.threshold is not None:
+        thresholds.confidenceThreshold = args.threshold
+    thresholds.categoryThresholds.update(args.category_thresholds)
+
+    # Resolved like the workers do, so a missing API key shows up as stub
+    llm = LLMProvider()
+    settings = {
+        "input": os.path.abspath(args.input),
+        "chunkSize": args.chunk_size,
+        "thresholds": thresholds.model_dump(),
+        "promptVersion": os.getenv("PROMPT_VERSION", LATEST_PROMPT_VERSION),
+        "stub": args.stub,
+        "provider": llm.get_provider_name(),
+        "model": llm.get_model_name(),
+        "kbArticles": args.kb_articles
+    }
+
+    writer = ParquetResultWriter(args.output) if args.format == "parquet" \
+        else JsonlResultWriter(args.output)
+    checkpoint = Checkpoint(args.output.rstrip("/") + ".checkpoint.json", settings)
+    if not args.restart:
+        checkpoint.load()
+    if checkpoint.completed:
+        logger.info(f"Resuming: {len(checkpoint.completed)} chunks already done")
+
+    snapshot_dir = args.kb_snapshot_dir
+    temp_snapshot_dir = None
+    if snapshot_dir is None:
+        snapshot_dir = temp_snapshot_dir = tempfile.mkdtemp(prefix="retriage-kb-")
+
+    start = time.perf_counter()
+    processed = unusable = 0
+
+    def record(future):
+        nonlocal processed
+        chunk_id, rows = future.result()
+        checkpoint.output_bytes = writer.write_chunk(chunk_id, rows)
+        checkpoint.completed.add(chunk_id)
+        checkpoint.save()
+        processed += len(rows)
+        elapsed = time.perf_counter() - start
+        logger.info(f"Chunk {chunk_id} done, {processed} tickets "
+                    f"({processed / elapsed:.1f}/s)")
+
+    writer.open(checkpoint)
+    # Spawned workers don't inherit provider clients or threads from the parent
+    context = multiprocessing.get_context("spawn")
+    try:
+        if temp_snapshot_dir is not None:
+            logger.info(f"Published KB snapshot {publish_from_source(temp_snapshot_dir)}")
+        with ProcessPoolExecutor(args.workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(snapshot_dir, thresholds.model_dump())) as pool:
+            pending = set()
+            for chunk_id, tickets, skipped in read_chunks(
+                    args.input, args.chunk_size, frozenset(checkpoint.completed)):
+                unusable += skipped
+                pending.add(pool.submit(_process_chunk, chunk_id, tickets))
+                # Bound the chunks held in memory while the export streams in
+                if len(pending) >= 2 * args.workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        record(future)
+            for future in pending:
+                record(future)
+    finally:
+        writer.close()
+        if temp_snapshot_dir is not None:
+            shutil.rmtree(temp_snapshot_dir, ignore_errors=True)
+
+    if unusable:
+        logger.warning(f"Skipped {unusable} tickets without an id, title or description")
+
+    stored = load_suggestions(args.suggestions) if args.suggestions else None
+    summary = summarize(writer.read_all(), stored)
+    summary["settings"] = settings
+    summary["elapsedSeconds"] = round(time.perf_counter() - start, 1)
+    return summary
+
+
+def parse_args(argv=None):
+    def category_threshold(value: str) -> Tuple[str, float]:
+        category, _, threshold = value.partition("=")
+        return category, float(threshold)
+
+    parser = argparse.ArgumentParser(
+        description="Re-triage exported tickets offline and compare with stored suggestions"
+    )
+    parser.add_argument("input", help="mongoexport JSONL of the tickets collection")
+    parser.add_argument("output", help="Results file (.jsonl) or directory (.parquet)")
+    parser.add_argument("--format", choices=("jsonl", "parquet"),
+                        help="Defaults to parquet for a .parquet output, else jsonl")
+    parser.add_argument("--suggestions", help="mongoexport JSONL of agentsuggestions to compare with")
+    parser.add_argument("--kb-articles", help="Articles export to score against instead of KB_SOURCE")
+    parser.add_argument("--kb-snapshot-dir", help="Use already published KB snapshots")
+    parser.add_argument("--prompt-version", help="Prompt set to classify with (default: PROMPT_VERSION)")
+    parser.add_argument("--stub", action="store_true", help="Classify with the deterministic stub")
+    parser.add_argument("--config", help="mongoexport of the configs collection to take "
+                        "thresholds from (default: the backend's Config defaults)")
+    parser.add_argument("--threshold", type=float,
+                        help="Threshold for categories without a category threshold")
+    parser.add_argument("--category-threshold", dest="category_thresholds", action="append",
+                        type=category_threshold, default=[], metavar="CATEGORY=THRESHOLD")
+    parser.add_argument("--no-auto-close", dest="auto_close", action="store_const", const=False)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=256)
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+    args = parser.parse_args(argv)
+
+    args.category_thresholds = dict(args.category_thresholds)
+    if args.format is None:
+        args.format = "parquet" if args.output.rstrip("/").endswith(".parquet") else "jsonl"
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+
+    try:
+        summary = run(args)
+    except ValueError as e:
+        logger.error(str(e))
+        sys.exit(2)
+
+    output = json.dumps(summary, indent=2)
+    with open(args.output.rstrip("/") + ".summary.json", "w", encoding="utf-8") as f:
+        f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
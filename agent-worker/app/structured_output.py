@@ -0,0 +1,120 @@
+import re
+import json
+from typing import Any, Tuple
+from .models import CategoryEnum, ClassificationResult
+
+# Strings are matched whole so brackets inside them don't affect nesting
+JSON_TOKEN_PATTERN = re.compile(r'"(?:[^"\\]|\\.)*"|[{}\[\]]', re.DOTALL)
+TRAILING_COMMA_PATTERN = re.compile(r",\s*([}\]])")
+
+CATEGORY_SCHEMA = {"type": "string", "enum": [category.value for category in CategoryEnum]}
+
+# Response schemas for providers with a native JSON mode
+CLASSIFICATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "category": CATEGORY_SCHEMA,
+        "confidence": {"type": "number"}
+    },
+    "required": ["category", "confidence"]
+}
+CLASSIFICATION_BATCH_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "index": {"type": "integer"},
+            "category": CATEGORY_SCHEMA,
+            "confidence": {"type": "number"}
+        },
+        "required": ["index", "category", "confidence"]
+    }
+}
+TRIAGE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "category": CATEGORY_SCHEMA,
+        "confidence": {"type": "number"},
+        "draft": {"type": "string"}
+    },
+    "required": ["category", "confidence", "draft"]
+}
+
+
+class StructuredOutputError(ValueError):
+    """
+    A completion without usable structured output; `cause` is reported as
+    the fallback reason (no_json, invalid_json or schema)
+    """
+
+    def __init__(self, cause: str, message: str):
+        super().__init__(message)
+        self.cause = cause
+
+
+def _balanced_end(text: str, start: int) -> int:
+    """End of the bracketed value opening at `start`, or -1 if it never closes"""
+    depth = 0
+    for match in JSON_TOKEN_PATTERN.finditer(text, start):
+        token = match.group()
+        if token in "{[":
+            depth += 1
+        elif token in "}]":
+            depth -= 1
+            if depth == 0:
+                return match.end()
+    return -1
+
+
+def extract_json(text: str, expected: type = dict) -> Any:
+    """
+    Parse the first JSON object (or array) in a completion
+
+    Models often wrap JSON in code fences or surround it with prose. Rather
+    than stripping those, the text is scanned for the first opening bracket
+    of the expected type and the balanced value from there is parsed,
+    forgiving trailing commas. A value that still fails to parse is skipped
+    and the scan continues after it.
+    """
+    opener = "{" if expected is dict else "["
+    error = None
+    start = text.find(opener)
+    while start != -1:
+        end = _balanced_end(text, start)
+        if end == -1:
+            error = "value is cut off"
+            break
+        candidate = text[start:end]
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError:
+            try:
+                return json.loads(TRAILING_COMMA_PATTERN.sub(r"\1", candidate))
+            except json.JSONDecodeError as e:
+                error = str(e)
+        start = text.find(opener, start + 1)
+
+    if error is not None:
+        raise StructuredOutputError("invalid_json", f"Completion JSON did not parse: {error}")
+    raise StructuredOutputError("no_json", f"No JSON {expected.__name__} in completion")
+
+
+def parse_classification(data: Any) -> ClassificationResult:
+    """Validate a category/confidence object, clamping the confidence to [0, 1]"""
+    try:
+        category = CategoryEnum(str(data["category"]).strip().lower())
+        confidence = float(data["confidence"])
+    except (KeyError, TypeError, ValueError) as e:
+        raise StructuredOutputError("schema", f"Invalid classification {data!r}: {e}")
+    return ClassificationResult(
+        predictedCategory=category, confidence=min(1.0, max(0.0, confidence))
+    )
+
+
+def parse_triage(data: Any) -> Tuple[ClassificationResult, str]:
+    """Validate a combined classification and draft"""
+    classification = parse_classification(data)
+    draft = data.get("draft")
+    if not isinstance(draft, str) or not draft.strip():
+        raise StructuredOutputError("schema", "Combined triage response has no draft")
+    return classification, draft.strip()
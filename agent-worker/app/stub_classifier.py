@@ -0,0 +1,131 @@
+import os
+import re
+import json
+import logging
+from typing import Dict, List, Optional, Tuple
+from .models import ClassificationResult, CategoryEnum
+
+logger = logging.getLogger(__name__)
+
+MAX_MEMOIZED_RESULTS = 4096
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(__file__), "data", "stub_classifier.json")
+
+
+def _trie_pattern(words: List[str]) -> str:
+    """
+    Regex alternation shaped like a trie of the words, so shared prefixes
+    are matched once instead of retrying every keyword at every position
+    """
+    trie: Dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: Dict) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # Greedy optional group: prefer the longer keyword when both match
+        return "(?:" + body + ")?" if "" in node else body
+
+    return build(trie)
+
+
+class KeywordClassifier:
+    """
+    Deterministic keyword classifier compiled into a single regex
+
+    Every keyword of every category is folded into one trie-shaped
+    alternation, so a text is scanned once regardless of how many keywords
+    are configured. Scoring matches the original substring check: each
+    distinct keyword found adds its weight to its categories.
+    """
+
+    def __init__(self, config: Dict):
+        self.base_score = config.get("baseScore", 0.3)
+        self.max_confidence = config.get("maxConfidence", 0.95)
+        fallback = config.get("fallback", {})
+        self.fallback_category = CategoryEnum(fallback.get("category", "other"))
+        self.fallback_confidence = fallback.get("confidence", 0.2)
+
+        # keyword -> [(category, weight)], and total weight per category
+        self.keyword_weights: Dict[str, List[Tuple[CategoryEnum, float]]] = {}
+        self.category_totals: Dict[CategoryEnum, float] = {}
+        for category, keywords in config["categories"].items():
+            category = CategoryEnum(category)
+            if isinstance(keywords, list):
+                keywords = {keyword: 1.0 for keyword in keywords}
+            self.category_totals[category] = float(sum(keywords.values()))
+            for keyword, weight in keywords.items():
+                self.keyword_weights.setdefault(keyword.lower(), []).append(
+                    (category, float(weight))
+                )
+
+        # The lookahead reports the longest keyword starting at every position,
+        # overlapping ones included; keywords contained in a match are implied by it
+        keywords = list(self.keyword_weights)
+        self.pattern = re.compile("(?=(" + _trie_pattern(keywords) + "))")
+        self.implied = {
+            keyword: [other for other in keywords if other in keyword]
+            for keyword in keywords
+        }
+
+        # The result only depends on which keywords matched, and tickets tend
+        # to repeat the same few combinations
+        self._results: Dict[frozenset, ClassificationResult] = {}
+
+    @classmethod
+    def from_file(cls, path: Optional[str] = None) -> "KeywordClassifier":
+        path = path or os.getenv("STUB_CLASSIFIER_CONFIG") or DEFAULT_CONFIG_PATH
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+        logger.info(f"Loaded stub classifier keywords from {path}")
+        return cls(config)
+
+    def classify(self, text: str) -> ClassificationResult:
+        """Classify one text in a single pass over it"""
+        matches = frozenset(self.pattern.findall(text.lower()))
+        result = self._results.get(matches)
+        if result is None:
+            result = self._score(matches)
+            if len(self._results) >= MAX_MEMOIZED_RESULTS:
+                self._results.clear()
+            self._results[matches] = result
+        return result
+
+    def _score(self, matches: frozenset) -> ClassificationResult:
+        found = set()
+        for keyword in matches:
+            found.update(self.implied[keyword])
+
+        weights: Dict[CategoryEnum, float] = {}
+        for keyword in found:
+            for category, weight in self.keyword_weights[keyword]:
+                weights[category] = weights.get(category, 0.0) + weight
+
+        # Iterate in config order so ties resolve the same way every time
+        scores = {
+            category: weights[category] / total + self.base_score
+            for category, total in self.category_totals.items()
+            if weights.get(category, 0.0) > 0
+        }
+
+        if scores:
+            predicted_category = max(scores, key=scores.get)
+            confidence = min(self.max_confidence, scores[predicted_category])
+        else:
+            predicted_category = self.fallback_category
+            confidence = self.fallback_confidence
+
+        return ClassificationResult(
+            predictedCategory=predicted_category,
+            confidence=confidence
+        )
+
+    def classify_batch(self, texts: List[str]) -> List[ClassificationResult]:
+        """Classify many texts with the same compiled matcher"""
+        return [self.classify(text) for text in texts]
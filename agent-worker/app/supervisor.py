@@ -0,0 +1,105 @@
+import os
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+import threading
+import uvicorn
+from .kb_service import KnowledgeBaseService
+from .kb_sync import KBSyncService, create_article_source
+from .kb_snapshot import SnapshotPublisher, read_current
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotBuilder:
+    """
+    Keeps the parent's index in sync with the article source and publishes
+    a new snapshot generation whenever it changes
+    """
+
+    def __init__(self, directory: str, min_interval: float = None):
+        self.kb_service = KnowledgeBaseService()
+        self.publisher = SnapshotPublisher(directory)
+        self.source = create_article_source()
+        self.sync = KBSyncService(self.kb_service, self.source) if self.source else None
+        self.min_interval = min_interval if min_interval is not None else \
+            float(os.getenv("KB_SNAPSHOT_MIN_INTERVAL_SECONDS", "5"))
+        self.published_version = None
+        self.ready = threading.Event()
+
+    def publish_if_changed(self):
+        index = self.kb_service.index
+        if (index, index.version) != self.published_version:
+            self.publisher.publish(index)
+            self.published_version = (index, index.version)
+
+    async def run(self):
+        if self.sync:
+            try:
+                await self.sync.initial_load()
+            except Exception as e:
+                logger.error(f"KB sync startup failed, publishing built-in sample articles: {e}")
+                self.sync = None
+        self.publish_if_changed()
+        self.ready.set()
+
+        if not self.sync:
+            return
+
+        while True:
+            await asyncio.sleep(max(self.sync.poll_interval, self.min_interval))
+            try:
+                await self.sync.poll_once()
+                # Snapshots are immutable, so changes are batched per interval
+                await asyncio.to_thread(self.publish_if_changed)
+            except Exception as e:
+                logger.error(f"KB snapshot update failed: {e}")
+
+    def start(self):
+        """Run the builder on its own event loop in a daemon thread"""
+        thread = threading.Thread(target=asyncio.run, args=(self.run(),),
+                                  name="kb-snapshot-builder", daemon=True)
+        thread.start()
+        return thread
+
+
+def main():
+    """
+    Run uvicorn with several worker processes sharing one KB index
+
+    The supervisor loads and syncs articles once and publishes each index
+    generation as a snapshot file; workers map the current snapshot
+    read-only and hot-swap when a new generation appears.
+    """
+    parser = argparse.ArgumentParser(description="Run the agent worker with a shared KB index")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    directory = os.getenv("KB_SNAPSHOT_DIR") or tempfile.mkdtemp(prefix="kb-snapshots-")
+    # Workers inherit the environment and follow the snapshots instead of syncing
+    os.environ["KB_SNAPSHOT_DIR"] = directory
+
+    start = time.perf_counter()
+    existing = read_current(directory)
+    builder = SnapshotBuilder(directory)
+    builder.start()
+    if existing:
+        # A snapshot left by a previous run or baked into the image serves
+        # until the builder publishes a fresh generation
+        logger.info(f"Starting {args.workers} workers on existing KB snapshot {existing[0]}")
+    else:
+        builder.ready.wait()
+        logger.info(f"First KB snapshot ready in {time.perf_counter() - start:.2f}s, "
+                    f"starting {args.workers} workers")
+
+    uvicorn.run("app.main:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import sys
+import json
+import argparse
+from typing import Dict, Tuple
+
+
+def _key(result: Dict) -> Tuple:
+    return (result["mode"], result["target"], result["kbSize"], result["concurrency"])
+
+
+def compare(baseline: Dict, candidate: Dict, threshold: float) -> int:
+    """
+    Print per-scenario changes between two result files and return the
+    number of scenarios whose p95 latency regressed beyond `threshold`
+    """
+    base = {_key(r): r for r in baseline["results"]}
+    regressions = 0
+
+    print(f"baseline {baseline['meta']['commit']} -> candidate {candidate['meta']['commit']}")
+    for result in candidate["results"]:
+        before = base.get(_key(result))
+        if before is None:
+            continue
+
+        p95_before = before["latencyMs"]["p95"]
+        p95_after = result["latencyMs"]["p95"]
+        p95_change = (p95_after - p95_before) / p95_before if p95_before else 0.0
+        rps_change = (result["throughputRps"] - before["throughputRps"]) / before["throughputRps"] \
+            if before["throughputRps"] else 0.0
+
+        regressed = p95_change > threshold
+        regressions += regressed
+        mode, target, kb_size, concurrency = _key(result)
+        print(
+            f"{'REGRESSION' if regressed else 'ok':<10} {mode:<10} {target:<8} "
+            f"kb={str(kb_size):<7} c={concurrency:<4} "
+            f"p95 {p95_before:.2f} -> {p95_after:.2f}ms ({p95_change:+.1%})  "
+            f"throughput {rps_change:+.1%}  "
+            f"rss {before['peakRssMb']} -> {result['peakRssMb']}MB"
+        )
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Relative p95 increase counted as a regression")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.candidate, encoding="utf-8") as f:
+        candidate = json.load(f)
+
+    sys.exit(1 if compare(baseline, candidate, args.threshold) else 0)
+
+
+if __name__ == "__main__":
+    main()
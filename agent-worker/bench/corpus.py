@@ -0,0 +1,110 @@
+import os
+import json
+import random
+from typing import Any, Dict, List
+from app.kb_service import SAMPLE_ARTICLES
+
+DEFAULT_FIXTURES = os.path.join(
+    os.path.dirname(__file__), "..", "..", "tests", "fixtures", "tickets.json"
+)
+
+# Filler mixed into generated text so tickets and articles are not verbatim copies
+FILLER = (
+    "please advise as soon as possible",
+    "this started happening yesterday",
+    "I have tried this several times already",
+    "my colleague has the same problem",
+    "the order was placed last week",
+    "I am using the mobile app",
+    "this is blocking our team",
+    "thanks in advance for your help",
+    "the issue appears intermittently",
+    "we are on the annual plan",
+)
+
+VOCABULARY = (
+    "account", "settings", "invoice", "payment", "card", "refund", "charge",
+    "subscription", "login", "password", "error", "browser", "cache", "server",
+    "timeout", "crash", "package", "delivery", "tracking", "courier", "address",
+    "warehouse", "return", "exchange", "discount", "plan", "upgrade", "export",
+    "report", "notification", "email", "profile", "security", "session", "api",
+)
+
+
+SYLLABLES = ("ka", "lo", "mi", "ne", "su", "ta", "ri", "po", "ve", "da", "zu", "fe")
+
+
+def _long_tail(rng: random.Random, size: int) -> List[str]:
+    """Pseudo-words for a Zipf-distributed tail, like product and error names"""
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))))
+    return sorted(words)
+
+
+def load_fixture_tickets(path: str = DEFAULT_FIXTURES) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["sampleTickets"]
+
+
+def _sentences(text: str) -> List[str]:
+    return [s.strip() for s in text.replace("!", ".").replace("?", ".").split(".") if s.strip()]
+
+
+def generate_tickets(count: int, seed: int = 0,
+                     fixtures_path: str = DEFAULT_FIXTURES) -> List[Dict[str, Any]]:
+    """
+    Synthesize tickets by recombining fixture tickets of the same category
+    with filler, so category signal is preserved but texts vary
+    """
+    rng = random.Random(seed)
+    fixtures = load_fixture_tickets(fixtures_path)
+    tickets = []
+    for i in range(count):
+        base = rng.choice(fixtures)
+        same_category = [t for t in fixtures if t["category"] == base["category"]]
+        sentences = _sentences(base["description"])
+        sentences += _sentences(rng.choice(same_category)["description"])
+        rng.shuffle(sentences)
+        sentences = sentences[:rng.randint(2, len(sentences))]
+        sentences.append(rng.choice(FILLER))
+        tickets.append({
+            "id": f"bench_ticket_{i}",
+            "title": base["title"],
+            "description": ". ".join(sentences) + ".",
+            "category": "other"
+        })
+    return tickets
+
+
+def generate_articles(count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    Synthesize a KB of `count` articles from the seed articles
+
+    The seed articles are always included; the rest shuffle their sentences
+    and add support vocabulary plus a long tail of rarer terms, so that
+    postings lengths resemble a real KB rather than every term matching
+    every article.
+    """
+    rng = random.Random(seed)
+    tail = _long_tail(rng, 20000)
+    # Word frequency falls off with rank, as in natural text
+    tail_weights = [1.0 / rank for rank in range(1, len(tail) + 1)]
+
+    articles = [dict(article) for article in SAMPLE_ARTICLES[:count]]
+    for i in range(len(articles), count):
+        base = rng.choice(SAMPLE_ARTICLES)
+        sentences = _sentences(base["body"])
+        rng.shuffle(sentences)
+        extra = " ".join(
+            rng.choices(VOCABULARY, k=rng.randint(2, 8)) +
+            rng.choices(tail, weights=tail_weights, k=rng.randint(10, 60))
+        )
+        articles.append({
+            "id": f"bench_kb_{i}",
+            "title": f"{base['title']} ({rng.choice(VOCABULARY)} {i})",
+            "body": ". ".join(sentences) + ". " + extra + ".",
+            "tags": base["tags"] + rng.sample(VOCABULARY, 2),
+            "category": base["category"]
+        })
+    return articles
@@ -0,0 +1,240 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import platform
+import resource
+import subprocess
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List
+
+# The benchmark always runs offline against the deterministic stub
+os.environ.setdefault("STUB_MODE", "true")
+os.environ.setdefault("KB_SOURCE", "builtin")
+# Generated tickets overlap heavily; keep measurements independent of
+# cache and near-duplicate cluster state
+os.environ.setdefault("TRIAGE_CACHE_ENABLED", "false")
+os.environ.setdefault("TRIAGE_DEDUP_ENABLED", "false")
+
+from app.agent import AgentService
+from app.kb_service import KnowledgeBaseService
+from app.models import TriageRequest
+from .corpus import DEFAULT_FIXTURES, generate_articles, generate_tickets
+
+TARGETS = ("classify", "search", "triage")
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def current_rss_mb():
+    """Resident set size right now, where /proc is available"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except OSError:
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def summarize(latencies: List[float], elapsed: float) -> Dict[str, Any]:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "throughputRps": round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+        "latencyMs": {
+            "p50": round(percentile(ordered, 0.50) * 1000, 3),
+            "p95": round(percentile(ordered, 0.95) * 1000, 3),
+            "p99": round(percentile(ordered, 0.99) * 1000, 3),
+            "mean": round(sum(ordered) / len(ordered) * 1000, 3) if ordered else 0.0,
+            "max": round(ordered[-1] * 1000, 3) if ordered else 0.0
+        },
+        "peakRssMb": round(peak_rss_mb(), 1)
+    }
+
+
+async def drive(operation: Callable[[Any], Awaitable[Any]], items: List[Any],
+                concurrency: int) -> Dict[str, Any]:
+    """Run `operation` over items with a fixed number of concurrent callers"""
+    latencies: List[float] = []
+    queue = list(reversed(items))
+
+    async def caller():
+        while queue:
+            item = queue.pop()
+            start = time.perf_counter()
+            await operation(item)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[caller() for _ in range(concurrency)])
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def in_process_operations(agent: AgentService) -> Dict[str, Callable]:
+    llm = agent.llm_provider
+    kb = agent.kb_service
+
+    async def classify(ticket):
+        llm._stub_classify(f"{ticket['title']} {ticket['description']}")
+
+    async def search(ticket):
+        await kb.search_articles(f"{ticket['title']} {ticket['description']}")
+
+    async def triage(ticket):
+        await agent.process_triage(
+            TriageRequest(ticket=ticket, traceId=ticket["id"])
+        )
+
+    return {"classify": classify, "search": search, "triage": triage}
+
+
+def http_operations(client, base_url: str) -> Dict[str, Callable]:
+    async def triage(ticket):
+        response = await client.post(
+            f"{base_url}/triage", json={"ticket": ticket, "traceId": ticket["id"]}
+        )
+        response.raise_for_status()
+
+    return {"triage": triage}
+
+
+async def run_in_process(args, tickets) -> List[Dict[str, Any]]:
+    results = []
+    for kb_size in args.kb_sizes:
+        articles = generate_articles(kb_size, seed=args.seed)
+        rss_before = current_rss_mb()
+        start = time.perf_counter()
+        kb_service = KnowledgeBaseService(articles)
+        build_seconds = time.perf_counter() - start
+        rss_after = current_rss_mb()
+        index_rss = round(rss_after - rss_before, 1) if rss_before is not None else None
+
+        agent = AgentService()
+        agent.kb_service = kb_service
+        operations = in_process_operations(agent)
+
+        for target in args.targets:
+            for concurrency in args.concurrency:
+                # Warm up code paths and allocators before measuring
+                await drive(operations[target], tickets[:args.warmup], concurrency)
+                summary = await drive(operations[target], tickets, concurrency)
+                results.append({
+                    "mode": "in-process",
+                    "target": target,
+                    "kbSize": kb_size,
+                    "concurrency": concurrency,
+                    "indexBuildMs": round(build_seconds * 1000, 1),
+                    "indexRssMb": index_rss,
+                    **summary
+                })
+                log_result(results[-1])
+    return results
+
+
+async def run_http(args, tickets) -> List[Dict[str, Any]]:
+    import httpx
+
+    results = []
+    limits = httpx.Limits(max_connections=max(args.concurrency))
+    async with httpx.AsyncClient(limits=limits, timeout=60.0) as client:
+        operations = http_operations(client, args.http.rstrip("/"))
+        for concurrency in args.concurrency:
+            await drive(operations["triage"], tickets[:args.warmup], concurrency)
+            summary = await drive(operations["triage"], tickets, concurrency)
+            results.append({
+                "mode": "http",
+                "target": "triage",
+                "kbSize": None,
+                "concurrency": concurrency,
+                **summary
+            })
+            log_result(results[-1])
+    return results
+
+
+def log_result(result: Dict[str, Any]):
+    latency = result["latencyMs"]
+    print(
+        f"{result['mode']:<10} {result['target']:<8} kb={str(result['kbSize']):<7} "
+        f"c={result['concurrency']:<4} {result['throughputRps']:>10.1f} req/s  "
+        f"p50={latency['p50']:.2f}ms p95={latency['p95']:.2f}ms p99={latency['p99']:.2f}ms  "
+        f"rss={result['peakRssMb']}MB",
+        file=sys.stderr
+    )
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(__file__), check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def parse_args(argv=None):
+    def int_list(value: str) -> List[int]:
+        return [int(v) for v in value.split(",") if v]
+
+    parser = argparse.ArgumentParser(description="Benchmark the agent worker in stub mode")
+    parser.add_argument("--kb-sizes", type=int_list, default=[10, 1000, 10000])
+    parser.add_argument("--tickets", type=int, default=500)
+    parser.add_argument("--concurrency", type=int_list, default=[1, 16])
+    parser.add_argument("--targets", type=lambda v: v.split(","), default=list(TARGETS))
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES)
+    parser.add_argument("--http", help="Base URL of a running worker; benchmarks POST /triage")
+    parser.add_argument("--output", help="Write results JSON here (default: stdout)")
+    args = parser.parse_args(argv)
+
+    unknown = set(args.targets) - set(TARGETS)
+    if unknown:
+        parser.error(f"unknown targets: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    tickets = generate_tickets(args.tickets, seed=args.seed, fixtures_path=args.fixtures)
+    runner = run_http if args.http else run_in_process
+    results = asyncio.run(runner(args, tickets))
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpuCount": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("output", "fixtures")}
+        },
+        "results": results
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
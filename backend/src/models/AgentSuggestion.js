@@ -25,6 +25,9 @@ const agentSuggestionSchema = new mongoose.Schema({
     min: 0,
     max: 1
   },
+  clusterId: {
+    type: String
+  },
   autoClosed: {
     type: Boolean,
     default: false
@@ -44,6 +47,14 @@ const agentSuggestionSchema = new mongoose.Schema({
     },
     latencyMs: {
       type: Number
+    },
+    skippedStages: [{
+      type: String
+    }],
+    tokens: {
+      prompt: Number,
+      completion: Number,
+      saved: Number
     }
   },
   createdAt: {
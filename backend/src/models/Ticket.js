@@ -57,6 +57,10 @@ const ticketSchema = new mongoose.Schema({
     type: mongoose.Schema.Types.ObjectId,
     ref: 'AgentSuggestion'
   },
+  // Near-duplicate tickets triaged together by the agent worker
+  clusterId: {
+    type: String
+  },
   replies: [replySchema],
   attachmentUrls: [{
     type: String
@@ -74,5 +78,6 @@ const ticketSchema = new mongoose.Schema({
 ticketSchema.index({ createdBy: 1, status: 1 });
 ticketSchema.index({ assignee: 1, status: 1 });
 ticketSchema.index({ createdAt: -1 });
+ticketSchema.index({ clusterId: 1, createdAt: -1 }, { sparse: true });
 
 module.exports = mongoose.model('Ticket', ticketSchema);
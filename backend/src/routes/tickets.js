@@ -64,13 +64,17 @@ router.post('/', async (req, res) => {
 // Get tickets
 router.get('/', async (req, res) => {
   try {
-    const { status, myTickets, page = 1, limit = 20 } = req.query;
+    const { status, clusterId, myTickets, page = 1, limit = 20 } = req.query;
     
     let filter = {};
     
     if (status) {
       filter.status = status;
     }
+
+    if (clusterId) {
+      filter.clusterId = clusterId;
+    }
     
     if (myTickets === 'true') {
       if (req.user.role === 'user') {
@@ -195,6 +199,53 @@ router.post('/:id/reply', async (req, res) => {
   }
 });
 
+// Generate a full AI draft for a suggestion whose triage skipped drafting
+router.post('/:id/draft', async (req, res) => {
+  try {
+    if (!['agent', 'admin'].includes(req.user.role)) {
+      return res.status(403).json({ error: 'Only agents can request drafts' });
+    }
+
+    const traceId = uuidv4();
+
+    const ticket = await Ticket.findById(req.params.id);
+    if (!ticket) {
+      return res.status(404).json({ error: 'Ticket not found' });
+    }
+
+    const suggestion = ticket.agentSuggestionId
+      ? await AgentSuggestion.findById(ticket.agentSuggestionId)
+      : null;
+    if (!suggestion) {
+      return res.status(404).json({ error: 'Agent suggestion not found' });
+    }
+
+    const draft = await agentService.requestDraft(ticket, suggestion, traceId);
+
+    suggestion.draftReply = draft.draftReply;
+    suggestion.modelInfo.skippedStages = (suggestion.modelInfo.skippedStages || [])
+      .filter((stage) => stage !== 'draft_response');
+    await suggestion.save();
+
+    await auditService.log({
+      ticketId: ticket._id,
+      traceId,
+      actor: 'agent',
+      action: 'DRAFT_GENERATED',
+      meta: {
+        agentId: req.user.id,
+        suggestionId: suggestion._id,
+        latencyMs: draft.processingTimeMs
+      }
+    });
+
+    res.json({ suggestion });
+  } catch (error) {
+    console.error('Generate draft error:', error);
+    res.status(500).json({ error: 'Failed to generate draft' });
+  }
+});
+
 // Assign ticket
 router.post('/:id/assign', async (req, res) => {
   try {
@@ -1,5 +1,8 @@
+const os = require('os');
 const Queue = require('bull');
+const Redis = require('ioredis');
 const axios = require('axios');
+const { v4: uuidv4 } = require('uuid');
 const winston = require('winston');
 const Ticket = require('../models/Ticket');
 const AgentSuggestion = require('../models/AgentSuggestion');
@@ -14,6 +17,145 @@ const logger = winston.createLogger({
 
 const triageQueue = new Queue('triage', process.env.REDIS_URL);
 
+const transport = process.env.AGENT_TRANSPORT || 'http';
+const jobsStream = process.env.TRIAGE_JOBS_STREAM || 'triage:jobs';
+const resultsStream = process.env.TRIAGE_RESULTS_STREAM || 'triage:results';
+const resultsGroup = 'backend';
+const consumerName = `${os.hostname()}-${process.pid}`;
+
+// Request body for the agent worker, shared by the HTTP and stream transports
+const buildTriagePayload = (ticketId, ticket, traceId, config) => ({
+  ticket: {
+    id: ticketId.toString(),
+    title: ticket.title,
+    description: ticket.description,
+    category: ticket.category
+  },
+  traceId,
+  // Auto-close thresholds let the agent skip drafting for tickets
+  // that will be assigned to a human anyway
+  thresholds: {
+    autoCloseEnabled: config.autoCloseEnabled,
+    confidenceThreshold: config.confidenceThreshold,
+    categoryThresholds: config.categoryThresholds?.toObject
+      ? config.categoryThresholds.toObject()
+      : config.categoryThresholds
+  }
+});
+
+// Save the agent's suggestion and auto-close or assign the ticket
+const applyTriageResult = async (ticket, traceId, config, result) => {
+  const ticketId = ticket._id;
+  const { suggestion, processingTimeMs } = result;
+
+  // Save agent suggestion
+  const agentSuggestion = new AgentSuggestion({
+    ticketId,
+    predictedCategory: suggestion.predictedCategory,
+    articleIds: suggestion.articleIds || [],
+    draftReply: suggestion.draftReply,
+    confidence: suggestion.confidence,
+    clusterId: suggestion.clusterId,
+    modelInfo: {
+      ...suggestion.modelInfo,
+      latencyMs: processingTimeMs
+    }
+  });
+
+  await agentSuggestion.save();
+
+  // Update ticket
+  ticket.agentSuggestionId = agentSuggestion._id;
+  if (suggestion.clusterId) {
+    ticket.clusterId = suggestion.clusterId;
+  }
+  ticket.status = 'triaged';
+  ticket.updatedAt = new Date();
+
+  // Check auto-close conditions
+  const threshold = config.categoryThresholds?.[suggestion.predictedCategory] 
+    || config.confidenceThreshold;
+
+  // A near-duplicate's suggestion reuses the draft written for the first
+  // ticket of its cluster, so it goes to a human rather than the customer
+  const reusedDraft = Boolean(suggestion.modelInfo?.clusterReused);
+
+  const shouldAutoClose = config.autoCloseEnabled && 
+                         !reusedDraft &&
+                         suggestion.confidence >= threshold;
+
+  if (shouldAutoClose) {
+    // Auto-close the ticket
+    ticket.status = 'resolved';
+    ticket.replies.push({
+      author: null,
+      content: suggestion.draftReply,
+      isAgent: true
+    });
+    
+    agentSuggestion.autoClosed = true;
+    await agentSuggestion.save();
+
+    await auditService.log({
+      ticketId,
+      traceId,
+      actor: 'system',
+      action: 'AUTO_CLOSED',
+      meta: {
+        confidence: suggestion.confidence,
+        threshold,
+        suggestionId: agentSuggestion._id
+      }
+    });
+  } else {
+    // Assign to human
+    ticket.status = 'waiting_human';
+    
+    await auditService.log({
+      ticketId,
+      traceId,
+      actor: 'system',
+      action: 'ASSIGNED_TO_HUMAN',
+      meta: {
+        confidence: suggestion.confidence,
+        threshold,
+        reason: reusedDraft && suggestion.confidence >= threshold
+          ? 'reused_cluster_draft'
+          : 'confidence_below_threshold'
+      }
+    });
+  }
+
+  await ticket.save();
+
+  logger.info(`Triage completed for ticket ${ticketId}`, {
+    traceId,
+    autoClosed: shouldAutoClose,
+    confidence: suggestion.confidence
+  });
+};
+
+const markTriageFailed = async (ticketId, traceId, error) => {
+  logger.error(`Triage failed for ticket ${ticketId}:`, error);
+  
+  // Update ticket status to indicate triage failure
+  await Ticket.findByIdAndUpdate(ticketId, {
+    status: 'waiting_human',
+    updatedAt: new Date()
+  });
+
+  await auditService.log({
+    ticketId,
+    traceId,
+    actor: 'system',
+    action: 'TRIAGE_FAILED',
+    meta: {
+      error: error.message,
+      stack: error.stack
+    }
+  });
+};
+
 // Process triage jobs
 triageQueue.process(5, async (job) => {
   const { ticketId, traceId } = job.data;
@@ -34,128 +176,161 @@ triageQueue.process(5, async (job) => {
       meta: { ticketTitle: ticket.title }
     });
 
+    const config = await Config.findOne() || new Config();
+
     // Call agent service
     const response = await axios.post(
       `${process.env.AGENT_SERVICE_URL}/triage`,
-      {
-        ticket: {
-          id: ticketId,
-          title: ticket.title,
-          description: ticket.description,
-          category: ticket.category
-        },
-        traceId
-      },
+      buildTriagePayload(ticketId, ticket, traceId, config),
       {
         timeout: 30000,
         headers: { 'X-Trace-ID': traceId }
       }
     );
 
-    const { suggestion, processingTimeMs } = response.data;
+    await applyTriageResult(ticket, traceId, config, response.data);
 
-    // Save agent suggestion
-    const agentSuggestion = new AgentSuggestion({
-      ticketId,
-      predictedCategory: suggestion.predictedCategory,
-      articleIds: suggestion.articleIds || [],
-      draftReply: suggestion.draftReply,
-      confidence: suggestion.confidence,
-      modelInfo: {
-        ...suggestion.modelInfo,
-        latencyMs: processingTimeMs
-      }
-    });
+  } catch (error) {
+    await markTriageFailed(ticketId, traceId, error);
+    throw error;
+  }
+});
 
-    await agentSuggestion.save();
+// Stream transport: hand the job to the agent worker's Redis stream consumer
+// instead of holding a Bull slot open for the whole HTTP call
+let streamRedis = null;
+const getStreamRedis = () => {
+  if (!streamRedis) {
+    streamRedis = new Redis(process.env.REDIS_URL);
+  }
+  return streamRedis;
+};
 
-    // Update ticket
-    ticket.agentSuggestionId = agentSuggestion._id;
-    ticket.status = 'triaged';
-    ticket.updatedAt = new Date();
+const publishTriageJob = async (ticketId, traceId) => {
+  const ticket = await Ticket.findById(ticketId);
+  if (!ticket) {
+    throw new Error('Ticket not found');
+  }
 
-    // Check auto-close conditions
-    const config = await Config.findOne() || new Config();
-    const threshold = config.categoryThresholds?.[suggestion.predictedCategory] 
-      || config.confidenceThreshold;
-
-    const shouldAutoClose = config.autoCloseEnabled && 
-                           suggestion.confidence >= threshold;
-
-    if (shouldAutoClose) {
-      // Auto-close the ticket
-      ticket.status = 'resolved';
-      ticket.replies.push({
-        author: null,
-        content: suggestion.draftReply,
-        isAgent: true
-      });
-      
-      agentSuggestion.autoClosed = true;
-      await agentSuggestion.save();
-
-      await auditService.log({
-        ticketId,
-        traceId,
-        actor: 'system',
-        action: 'AUTO_CLOSED',
-        meta: {
-          confidence: suggestion.confidence,
-          threshold,
-          suggestionId: agentSuggestion._id
-        }
-      });
-    } else {
-      // Assign to human
-      ticket.status = 'waiting_human';
-      
-      await auditService.log({
-        ticketId,
-        traceId,
-        actor: 'system',
-        action: 'ASSIGNED_TO_HUMAN',
-        meta: {
-          confidence: suggestion.confidence,
-          threshold,
-          reason: 'confidence_below_threshold'
-        }
-      });
-    }
+  await auditService.log({
+    ticketId,
+    traceId,
+    actor: 'system',
+    action: 'TRIAGE_STARTED',
+    meta: { ticketTitle: ticket.title, transport: 'stream' }
+  });
 
-    await ticket.save();
+  const config = await Config.findOne() || new Config();
+  const jobId = uuidv4();
+  const payload = buildTriagePayload(ticketId, ticket, traceId, config);
 
-    logger.info(`Triage completed for ticket ${ticketId}`, {
-      traceId,
-      autoClosed: shouldAutoClose,
-      confidence: suggestion.confidence
-    });
+  await getStreamRedis().xadd(
+    jobsStream, '*', 'jobId', jobId, 'payload', JSON.stringify(payload)
+  );
+
+  logger.info(`Published triage job for ticket ${ticketId}`, { jobId, traceId });
+  return { id: jobId };
+};
+
+const handleTriageResult = async (fields) => {
+  const { ticketId, traceId } = fields;
+  const config = await Config.findOne() || new Config();
+
+  if (fields.status === 'ok') {
+    try {
+      const ticket = await Ticket.findById(ticketId);
+      if (!ticket) {
+        throw new Error('Ticket not found');
+      }
+      await applyTriageResult(ticket, traceId, config, JSON.parse(fields.result));
+    } catch (error) {
+      await markTriageFailed(ticketId, traceId, error);
+    }
+  } else {
+    await markTriageFailed(ticketId, traceId, new Error(fields.error || 'Triage failed'));
+  }
+};
 
+// Consume triage results written back by the agent worker
+const startResultsConsumer = async () => {
+  // Blocking reads need a connection of their own
+  const redis = new Redis(process.env.REDIS_URL);
+
+  try {
+    await redis.xgroup('CREATE', resultsStream, resultsGroup, '0', 'MKSTREAM');
   } catch (error) {
-    logger.error(`Triage failed for ticket ${ticketId}:`, error);
-    
-    // Update ticket status to indicate triage failure
-    await Ticket.findByIdAndUpdate(ticketId, {
-      status: 'waiting_human',
-      updatedAt: new Date()
-    });
+    if (!error.message.includes('BUSYGROUP')) {
+      throw error;
+    }
+  }
 
-    await auditService.log({
-      ticketId,
-      traceId,
-      actor: 'system',
-      action: 'TRIAGE_FAILED',
-      meta: {
-        error: error.message,
-        stack: error.stack
+  // Results delivered to this consumer before a restart are retried first
+  let cursor = '0';
+  for (;;) {
+    try {
+      const response = await redis.xreadgroup(
+        'GROUP', resultsGroup, consumerName,
+        'COUNT', 10, 'BLOCK', 5000,
+        'STREAMS', resultsStream, cursor
+      );
+      const entries = response ? response[0][1] : [];
+      if (cursor === '0' && entries.length === 0) {
+        cursor = '>';
       }
-    });
 
-    throw error;
+      for (const [id, values] of entries) {
+        const fields = {};
+        for (let i = 0; i < values.length; i += 2) {
+          fields[values[i]] = values[i + 1];
+        }
+        try {
+          await handleTriageResult(fields);
+        } catch (error) {
+          logger.error(`Failed to apply triage result ${id}:`, error);
+        }
+        await redis.xack(resultsStream, resultsGroup, id);
+      }
+    } catch (error) {
+      logger.error('Triage results consumer error:', error);
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+    }
   }
-});
+};
+
+if (transport === 'stream') {
+  startResultsConsumer();
+}
+
+// Draft a reply on demand for a suggestion whose triage skipped drafting
+const requestDraft = async (ticket, suggestion, traceId) => {
+  const response = await axios.post(
+    `${process.env.AGENT_SERVICE_URL}/draft`,
+    {
+      ticket: {
+        id: ticket._id.toString(),
+        title: ticket.title,
+        description: ticket.description,
+        category: ticket.category
+      },
+      traceId,
+      category: suggestion.predictedCategory,
+      articleIds: suggestion.articleIds.map((id) => id.toString())
+    },
+    {
+      timeout: 30000,
+      headers: { 'X-Trace-ID': traceId }
+    }
+  );
+
+  return response.data;
+};
 
 // Queue a triage job
 const queueTriage = async (ticketId, traceId) => {
+  if (transport === 'stream') {
+    return publishTriageJob(ticketId, traceId);
+  }
+
   const job = await triageQueue.add(
     'triage',
     { ticketId, traceId },
@@ -176,5 +351,6 @@ const queueTriage = async (ticketId, traceId) => {
 
 module.exports = {
   queueTriage,
+  requestDraft,
   triageQueue
 };
@@ -0,0 +1,19 @@
+import os
+import sys
+import pytest
+
+# The worker is run from its own directory (python -m app.main), not installed
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "agent-worker"))
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    """AgentService on the fake provider, without hedging, batch windows or dedup"""
+    from app.agent import AgentService
+
+    monkeypatch.setenv("LLM_PROVIDER", "fake")
+    monkeypatch.setenv("FAKE_LLM_LATENCY_MS", "0")
+    monkeypatch.setenv("LLM_HEDGE_ENABLED", "false")
+    monkeypatch.setenv("TRIAGE_BATCH_WINDOW_MS", "0")
+    monkeypatch.setenv("TRIAGE_DEDUP_ENABLED", "false")
+    return AgentService()
@@ -0,0 +1,63 @@
+import asyncio
+from app.models import TicketData, TriageRequest
+
+
+def make_requests():
+    return [
+        TriageRequest(
+            ticket=TicketData(id=f"t{i}", title=title, description="Please help"),
+            traceId=f"trace-{i}"
+        )
+        for i, title in enumerate(["Charged twice", "Login broken", "Parcel lost"])
+    ]
+
+
+def test_batch_returns_per_ticket_trace_ids(agent):
+    results = asyncio.run(agent.process_batch(make_requests()))
+    assert [r.suggestion.modelInfo["traceId"] for r in results] == ["trace-0", "trace-1", "trace-2"]
+
+
+def test_classification_failure_is_isolated(agent, monkeypatch):
+    classify = agent._classify_ticket
+    searched = []
+
+    async def flaky_classify(ticket):
+        if ticket.id == "t1":
+            raise RuntimeError("classification failed")
+        return await classify(ticket)
+
+    search_batch = agent.kb_service.search_batch
+
+    async def recording_search_batch(queries):
+        searched.extend(query for query, _ in queries)
+        return await search_batch(queries)
+
+    monkeypatch.setattr(agent, "_classify_ticket", flaky_classify)
+    monkeypatch.setattr(agent.kb_service, "search_batch", recording_search_batch)
+
+    results = asyncio.run(agent.process_batch(make_requests()))
+    assert isinstance(results[1], RuntimeError)
+    assert results[0].suggestion.modelInfo["traceId"] == "trace-0"
+    assert results[2].suggestion.modelInfo["traceId"] == "trace-2"
+    # The failed ticket is left out of retrieval
+    assert searched == ["Charged twice Please help", "Parcel lost Please help"]
+
+
+def test_retrieval_failure_is_isolated(agent, monkeypatch):
+    search_articles = agent.kb_service.search_articles
+
+    async def failing_search_batch(queries):
+        raise RuntimeError("index unavailable")
+
+    async def flaky_search(query, category=None):
+        if query.startswith("Login"):
+            raise RuntimeError("search failed")
+        return await search_articles(query, category)
+
+    monkeypatch.setattr(agent.kb_service, "search_batch", failing_search_batch)
+    monkeypatch.setattr(agent.kb_service, "search_articles", flaky_search)
+
+    results = asyncio.run(agent.process_batch(make_requests()))
+    assert isinstance(results[1], RuntimeError)
+    assert [r.suggestion.modelInfo["traceId"] for r in (results[0], results[2])] == \
+        ["trace-0", "trace-2"]
@@ -0,0 +1,98 @@
+import os
+import sys
+import asyncio
+import subprocess
+from app.dedup import DuplicateDetector, MinHasher
+from app.models import TicketData, TriageRequest, TriageThresholds
+
+FIRST = "Order 1234 never arrived, the tracking page says delivered but nothing is at my door"
+DUPLICATE = "Order 5678 never arrived, tracking page says delivered but nothing is at my door!"
+UNRELATED = "I cannot log in to the dashboard, the password reset email never comes"
+
+
+def test_signatures_estimate_similarity():
+    hasher = MinHasher()
+    first, duplicate, unrelated = (hasher.signature(t) for t in (FIRST, DUPLICATE, UNRELATED))
+
+    def similarity(a, b):
+        return sum(x == y for x, y in zip(a, b)) / len(a)
+
+    assert hasher.signature(FIRST) == first
+    assert len(first) == 64
+    assert similarity(first, duplicate) > 0.6
+    assert similarity(first, unrelated) < 0.2
+    assert hasher.signature("!!!") is None
+
+
+def test_near_duplicates_share_a_cluster():
+    async def scenario():
+        detector = DuplicateDetector(threshold=0.6, window_seconds=60)
+        first, created = detector.assign(FIRST)
+        duplicate, duplicate_created = detector.assign(DUPLICATE)
+        unrelated, unrelated_created = detector.assign(UNRELATED)
+        return first, created, duplicate, duplicate_created, unrelated, unrelated_created
+
+    first, created, duplicate, duplicate_created, unrelated, unrelated_created = asyncio.run(scenario())
+    assert created and unrelated_created and not duplicate_created
+    assert duplicate is first
+    assert first.size == 2
+    assert unrelated is not first
+
+
+def test_dedup_does_not_need_numpy():
+    code = (
+        "import sys; sys.modules['numpy'] = None\n"
+        "from app.dedup import MinHasher\n"
+        "assert MinHasher().signature('refund please') is not None\n"
+    )
+    worker_dir = os.path.join(os.path.dirname(__file__), "..", "..", "agent-worker")
+    subprocess.run([sys.executable, "-c", code], cwd=worker_dir, check=True)
+
+
+def test_duplicate_reuses_draft_only_as_a_suggestion(agent):
+    agent.dedup = DuplicateDetector(threshold=0.6, window_seconds=60)
+    provider = agent.llm_provider.provider
+
+    async def scenario():
+        first = await agent.process_triage(TriageRequest(
+            ticket=TicketData(id="t1", title="Parcel missing", description=FIRST), traceId="trace-1"
+        ))
+        calls = provider.calls
+        duplicate = await agent.process_triage(TriageRequest(
+            ticket=TicketData(id="t2", title="Parcel missing", description=DUPLICATE), traceId="trace-2"
+        ))
+        return first.suggestion, duplicate.suggestion, provider.calls - calls
+
+    first, duplicate, calls = asyncio.run(scenario())
+    assert calls == 0
+    assert duplicate.clusterId == first.clusterId
+    assert duplicate.draftReply == first.draftReply
+    # The backend does not auto-close suggestions carrying another ticket's draft
+    assert duplicate.modelInfo["clusterReused"]
+    assert not first.modelInfo["clusterReused"]
+
+
+def test_duplicate_does_not_draft_when_first_ticket_skipped(agent):
+    agent.dedup = DuplicateDetector(threshold=0.6, window_seconds=60)
+    # Separate stages, so the first ticket can skip drafting
+    agent.llm_provider.combined_mode = False
+    provider = agent.llm_provider.provider
+    never = TriageThresholds(autoCloseEnabled=False)
+    always = TriageThresholds(confidenceThreshold=0.0)
+
+    async def scenario():
+        await agent.process_triage(TriageRequest(
+            ticket=TicketData(id="t1", title="Parcel missing", description=FIRST),
+            traceId="trace-1", thresholds=never
+        ))
+        calls = provider.calls
+        duplicate = await agent.process_triage(TriageRequest(
+            ticket=TicketData(id="t2", title="Parcel missing", description=DUPLICATE),
+            traceId="trace-2", thresholds=always
+        ))
+        return duplicate.suggestion, provider.calls - calls
+
+    duplicate, calls = asyncio.run(scenario())
+    assert calls == 0
+    assert duplicate.modelInfo["clusterReused"]
+    assert duplicate.modelInfo["skippedStages"] == ["draft_response"]
@@ -0,0 +1,101 @@
+from app.kb_index import KBIndex, CATEGORY_BONUS
+
+
+def article(article_id, title, body, tags=(), category="other"):
+    return {"id": article_id, "title": title, "body": body,
+            "tags": list(tags), "category": category}
+
+
+def make_index():
+    index = KBIndex()
+    index.build([
+        article("refunds", "Refund policy", "Refunds are issued within five days",
+                ["billing"], "billing"),
+        article("login", "Login problems", "Reset your password to sign in again",
+                ["tech"], "tech"),
+        article("delivery", "Delivery times", "Orders ship within two business days",
+                ["shipping"], "shipping")
+    ])
+    return index
+
+
+def ids(index, query, category=None, limit=3):
+    top, _ = index.search(query, category, limit)
+    return [article_id for _, article_id in top]
+
+
+def test_add_makes_article_searchable():
+    index = make_index()
+    assert ids(index, "warranty") == []
+
+    index.add(article("warranty", "Warranty claims", "Send the warranty card with the item"))
+
+    assert ids(index, "warranty") == ["warranty"]
+    assert "warranty" in index.vocabulary()
+
+
+def test_remove_drops_article_and_its_terms():
+    index = make_index()
+    assert index.remove("login")
+    assert not index.remove("login")
+
+    assert ids(index, "password") == []
+    assert "password" not in index.vocabulary()
+    assert "login" not in index.articles
+    assert len(index) == 2
+
+
+def test_update_replaces_previous_content():
+    index = make_index()
+    index.add(article("delivery", "Courier tracking", "Track the parcel with the courier",
+                      ["shipping"], "shipping"))
+
+    assert ids(index, "business") == []
+    assert ids(index, "courier") == ["delivery"]
+    assert index.articles["delivery"]["title"] == "Courier tracking"
+    assert len(index) == 3
+
+
+def test_updates_match_a_fresh_build():
+    incremental = make_index()
+    incremental.remove("refunds")
+    incremental.add(article("login", "Login problems", "Use two factor codes to sign in",
+                            ["tech"], "tech"))
+
+    rebuilt = KBIndex()
+    rebuilt.build([
+        article("login", "Login problems", "Use two factor codes to sign in",
+                ["tech"], "tech"),
+        article("delivery", "Delivery times", "Orders ship within two business days",
+                ["shipping"], "shipping")
+    ])
+
+    for query in ["two days", "sign in codes", "refund"]:
+        assert incremental.search(query) == rebuilt.search(query)
+
+
+def test_title_outweighs_tags_outweighs_body():
+    index = KBIndex()
+    index.build([
+        article("in-body", "Alpha", "gamma delta"),
+        article("in-tags", "Beta", "delta epsilon", ["gamma"]),
+        article("in-title", "Gamma", "epsilon delta")
+    ])
+
+    assert ids(index, "gamma") == ["in-title", "in-tags", "in-body"]
+
+
+def test_category_bonus_ranks_members_first():
+    index = make_index()
+    top, _ = index.search("within days", "shipping")
+    assert top[0][1] == "delivery"
+
+
+def test_query_without_terms_returns_category_members():
+    index = make_index()
+    for query in ["", "??? !!!"]:
+        top, num_matches = index.search(query, "billing")
+        assert top == [(CATEGORY_BONUS, "refunds")]
+        assert num_matches == 1
+
+    assert index.search("", None) == ([], 0)
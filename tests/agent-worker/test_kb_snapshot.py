@@ -0,0 +1,80 @@
+import os
+import pytest
+from app.kb_service import KnowledgeBaseService
+from app.kb_snapshot import SnapshotFollower, SnapshotIndex, SnapshotPublisher, read_current, write_snapshot
+
+QUERIES = [
+    ("I want a refund for the double charge", "billing"),
+    ("cannot login, password reset does not work", "tech"),
+    ("my package tracking shows delayed delivery", "shipping"),
+    ("refund for a lost package", None),
+    ("", "billing"),
+    ("zzz unknown words", None)
+]
+
+
+def make_index():
+    index = KnowledgeBaseService().index
+    # Leave a free slot and a replaced body behind, as live updates do
+    index.remove("kb_002")
+    index.add(dict(index.articles["kb_001"], body="Refunds now take three business days."))
+    return index
+
+
+def test_snapshot_ranks_like_the_index(tmp_path):
+    index = make_index()
+    path = str(tmp_path / "kb.snap")
+    write_snapshot(index, path, generation=7)
+    snapshot = SnapshotIndex(path)
+
+    assert snapshot.version == 7
+    assert snapshot.fingerprint == index.fingerprint
+    assert dict(snapshot.articles) == {
+        article_id: {key: value for key, value in article.items() if key != "updatedAt"}
+        for article_id, article in index.articles.items()
+    }
+    for query, category in QUERIES:
+        expected, expected_matches = index.search(query, category, limit=5)
+        actual, actual_matches = snapshot.search(query, category, limit=5)
+        assert [article_id for _, article_id in actual] == [article_id for _, article_id in expected]
+        assert [score for score, _ in actual] == pytest.approx([score for score, _ in expected])
+        assert actual_matches == expected_matches
+
+
+def test_snapshot_is_read_only(tmp_path):
+    path = str(tmp_path / "kb.snap")
+    write_snapshot(make_index(), path, generation=1)
+    snapshot = SnapshotIndex(path)
+
+    with pytest.raises(TypeError):
+        snapshot.remove("kb_001")
+
+
+def test_publisher_keeps_latest_generations(tmp_path):
+    directory = str(tmp_path)
+    index = make_index()
+    kb_service = KnowledgeBaseService(articles=[])
+    follower = SnapshotFollower(kb_service, directory, poll_interval=0)
+
+    publisher = SnapshotPublisher(directory, keep=3)
+    publisher.publish(index)
+    assert follower.refresh()
+    attached = kb_service.index
+    assert not follower.refresh()
+
+    for _ in range(4):
+        publisher.publish(index)
+
+    assert sorted(name for name in os.listdir(directory) if name.endswith(".snap")) == [
+        "kb-00000003.snap", "kb-00000004.snap", "kb-00000005.snap"
+    ]
+    assert read_current(directory) == ("kb-00000005.snap", 5)
+    # The unlinked first generation stays readable through its mapping
+    assert attached.search("refund", "billing")[0]
+
+    assert follower.refresh()
+    assert kb_service.index.version == 5
+
+    # A restarted publisher continues the generation sequence
+    assert SnapshotPublisher(directory, keep=3).publish(index) == "kb-00000006.snap"
+    assert not os.path.exists(os.path.join(directory, "kb-00000003.snap"))
@@ -0,0 +1,119 @@
+import os
+import json
+import asyncio
+import pytest
+from app.kb_service import KnowledgeBaseService
+from app.kb_sync import ArticleSource, InMemoryArticleSource, FileArticleSource, KBSyncService
+
+
+def doc(article_id, title, updated_at, status="published"):
+    return {"_id": article_id, "title": title, "body": f"{title} article body",
+            "tags": [], "category": "other", "status": status, "updatedAt": updated_at}
+
+
+def make_sync(source, reconcile_every=0):
+    return KBSyncService(KnowledgeBaseService(articles=[]), source,
+                         poll_interval=0, reconcile_every=reconcile_every)
+
+
+def titles(sync):
+    return {article_id: article["title"]
+            for article_id, article in sync.kb_service.index.articles.items()}
+
+
+def test_article_source_is_abstract():
+    with pytest.raises(TypeError):
+        ArticleSource()
+
+
+def test_in_memory_deltas_apply_incrementally():
+    source = InMemoryArticleSource([
+        doc("a1", "Refunds", "2024-01-01T00:00:00Z"),
+        doc("a2", "Draft", "2024-01-01T00:00:00Z", status="draft")
+    ])
+    sync = make_sync(source)
+
+    async def scenario():
+        await sync.initial_load()
+        loaded = titles(sync)
+
+        source.put(doc("a3", "Shipping", "2024-01-02T00:00:00Z"))
+        source.put(doc("a1", "Refund policy", "2024-01-02T00:00:00Z"))
+        await sync.poll_once()
+        updated = titles(sync)
+
+        source.put(doc("a3", "Shipping", "2024-01-03T00:00:00Z", status="draft"))
+        await sync.poll_once()
+        return loaded, updated, titles(sync)
+
+    loaded, updated, final = asyncio.run(scenario())
+    assert loaded == {"a1": "Refunds"}
+    assert updated == {"a1": "Refund policy", "a3": "Shipping"}
+    assert final == {"a1": "Refund policy"}
+
+
+def test_unchanged_articles_in_cursor_window_are_not_reindexed():
+    source = InMemoryArticleSource([doc("a1", "Refunds", "2024-01-01T00:00:00Z")])
+    sync = make_sync(source)
+
+    async def scenario():
+        await sync.initial_load()
+        version = sync.kb_service.index.version
+        # The cursor is inclusive, so the last article comes back on every poll
+        await sync.poll_once()
+        return version, sync.kb_service.index.version
+
+    before, after = asyncio.run(scenario())
+    assert before == after
+
+
+def test_hard_deletes_are_reconciled():
+    source = InMemoryArticleSource([
+        doc("a1", "Refunds", "2024-01-01T00:00:00Z"),
+        doc("a2", "Shipping", "2024-01-01T00:00:00Z")
+    ])
+    sync = make_sync(source, reconcile_every=2)
+
+    async def scenario():
+        await sync.initial_load()
+        # Hard deletes leave nothing behind for the updatedAt cursor to find
+        source.delete("a2")
+        await sync.poll_once()
+        after_first = titles(sync)
+        await sync.poll_once()
+        return after_first, titles(sync)
+
+    after_first, final = asyncio.run(scenario())
+    assert "a2" in after_first
+    assert final == {"a1": "Refunds"}
+
+
+def test_file_source_picks_up_rewrites(tmp_path):
+    path = tmp_path / "articles.jsonl"
+
+    def write(docs, mtime):
+        path.write_text("\n".join(json.dumps(d) for d in docs))
+        os.utime(path, (mtime, mtime))
+
+    write([
+        {"_id": {"$oid": "a1"}, "title": "Refunds", "body": "Refund body"},
+        {"_id": {"$oid": "a2"}, "title": "Shipping", "body": "Shipping body"}
+    ], 1000)
+    sync = make_sync(FileArticleSource(str(path)), reconcile_every=1)
+
+    async def scenario():
+        await sync.initial_load()
+        loaded = titles(sync)
+
+        # Exports without updatedAt: changed articles get a fresh timestamp,
+        # dropped articles are found by reconciliation
+        write([
+            {"_id": {"$oid": "a1"}, "title": "Refund policy", "body": "Refund body"},
+            {"_id": {"$oid": "a3"}, "title": "Login", "body": "Login body"}
+        ], 2000)
+        await sync.poll_once()
+        return loaded, titles(sync)
+
+    loaded, final = asyncio.run(scenario())
+    assert loaded == {"a1": "Refunds", "a2": "Shipping"}
+    assert final == {"a1": "Refund policy", "a3": "Login"}
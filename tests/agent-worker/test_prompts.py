@@ -0,0 +1,141 @@
+import re
+import pytest
+from app.llm_provider import LLMProvider
+from app.models import ArticleMatch, TicketData
+from app.prompts import (
+    LATEST_PROMPT_VERSION, PROMPT_SETS, PromptBuilder,
+    compress_stack_traces, estimate_tokens, fit_text
+)
+
+PYTHON_TRACE = "\n".join(
+    ["Traceback (most recent call last):"] +
+    [f'  File "/app/module{i}.py", line {i}, in handler{i}\n    step{i}()' for i in range(10)] +
+    ["ValueError: bad input"]
+)
+
+
+def make_articles(count=3, body="Refunds are issued within five business days. "):
+    return [
+        ArticleMatch(id=f"kb_{i}", title=f"Refund article {i}", score=1.0, snippet=body * 4)
+        for i in range(count)
+    ]
+
+
+def test_fit_text_keeps_short_text():
+    assert fit_text("Charged twice", 10) == "Charged twice"
+
+
+def test_fit_text_keeps_beginning_and_end_within_budget():
+    text = "My order never arrived. " + "filler words here " * 500 + "Order number 12345."
+    fitted = fit_text(text, 100)
+
+    assert estimate_tokens(fitted) <= 100
+    assert fitted.startswith("My order never arrived.")
+    assert fitted.endswith("Order number 12345.")
+    assert "characters omitted" in fitted
+
+
+def test_python_trace_keeps_outer_and_inner_frames():
+    compressed = compress_stack_traces(PYTHON_TRACE).splitlines()
+
+    assert '  File "/app/module0.py", line 0, in handler0' in compressed
+    assert '  File "/app/module2.py", line 2, in handler2' in compressed
+    assert '  File "/app/module3.py", line 3, in handler3' not in compressed
+    assert '  File "/app/module9.py", line 9, in handler9' in compressed
+    assert "    step9()" in compressed
+    assert "    [... 5 frames omitted]" in compressed
+    assert compressed[-1] == "ValueError: bad input"
+
+
+def test_repeated_frames_traces_and_log_lines_collapse():
+    recursion = "\n".join(["Error: too much recursion"] + ["    at walk (tree.js:10:5)"] * 50)
+    logs = "\n".join(["WARN retrying connection"] * 20)
+    compressed = compress_stack_traces(f"{recursion}\n{recursion}\n{logs}")
+
+    assert compressed.splitlines() == [
+        "Error: too much recursion",
+        "    at walk (tree.js:10:5)",
+        "    [previous frame repeated 49 more times]",
+        "Error: too much recursion",
+        "    [same stack trace as above]",
+        "WARN retrying connection [repeated 20 times]"
+    ]
+
+
+@pytest.mark.parametrize("max_input_tokens", [400, 600, 1200])
+@pytest.mark.parametrize("num_articles", [0, 1, 5])
+def test_draft_prompt_fits_the_token_budget(max_input_tokens, num_articles):
+    builder = PromptBuilder(max_input_tokens=max_input_tokens)
+    ticket = TicketData(
+        id="t1", title="Refund not received",
+        description="I asked for a refund. " + PYTHON_TRACE + " more detail" * 400 + " Please help."
+    )
+
+    prompt = builder.draft(ticket, make_articles(num_articles), "billing")
+    assert prompt.tokens <= max_input_tokens
+    assert prompt.saved_tokens > 0
+    assert "Refund not received" in prompt.text
+    assert "I asked for a refund." in prompt.text
+    assert "Please help." in prompt.text
+    if num_articles:
+        assert "Refund article 0" in prompt.text
+
+
+def test_classify_prompts_cap_each_ticket():
+    builder = PromptBuilder(classify_ticket_tokens=50)
+    long_text = "refund " * 1000
+
+    single = builder.classify(long_text)
+    assert single.tokens <= builder.templates["classify"].overhead_tokens + 50
+
+    batch = builder.classify_batch([long_text, "short ticket", long_text])
+    lines = [line for line in batch.text.splitlines() if re.match(r"\[\d+\] ", line)]
+    assert [line.split()[0] for line in lines] == ["[0]", "[1]", "[2]"]
+    assert all(estimate_tokens(line) <= 55 for line in lines)
+
+
+@pytest.mark.parametrize("version", sorted(PROMPT_SETS))
+def test_prompt_sets_render(version):
+    builder = PromptBuilder(version=version)
+    ticket = TicketData(id="t1", title="Charged twice", description="Refund please")
+    articles = make_articles(1)
+
+    prompts = [
+        builder.classify("Charged twice Refund please"),
+        builder.classify_batch(["Charged twice", "Parcel lost"]),
+        builder.draft(ticket, articles, "billing")
+    ]
+    if "triage" in builder.templates:
+        prompts.append(builder.triage(ticket, articles))
+
+    for prompt in prompts:
+        assert "{" not in prompt.text.replace('{"', "")
+        assert prompt.tokens == estimate_tokens(prompt.text)
+    assert "Charged twice" in prompts[0].text
+    assert "[1] Parcel lost" in prompts[1].text
+    assert "Category: billing" in prompts[2].text
+    assert "Refund article 0" in prompts[2].text
+
+
+def test_latest_prompts_end_with_the_ticket():
+    # Shared instruction prefixes are what makes provider prefix caching apply
+    builder = PromptBuilder(version="v1.1")
+    assert builder.classify("Charged twice").text.endswith("Ticket: Charged twice")
+
+
+def test_prompt_version_selects_the_template_set(monkeypatch):
+    monkeypatch.setenv("LLM_PROVIDER", "fake")
+    monkeypatch.delenv("PROMPT_VERSION", raising=False)
+    assert PromptBuilder().version == LATEST_PROMPT_VERSION
+
+    monkeypatch.setenv("PROMPT_VERSION", "v1.0")
+    builder = PromptBuilder()
+    assert builder.templates is PROMPT_SETS["v1.0"]
+    llm = LLMProvider()
+    assert llm.prompt_version == "v1.0"
+    # v1.0 has no combined prompt, so classification and draft stay separate
+    assert not llm.combined_mode
+
+    monkeypatch.setenv("PROMPT_VERSION", "v9")
+    with pytest.raises(ValueError):
+        PromptBuilder()
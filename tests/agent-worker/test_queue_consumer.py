@@ -0,0 +1,215 @@
+import json
+import asyncio
+from collections import Counter
+import fakeredis
+from app.models import AgentSuggestion, CategoryEnum, TriageResponse
+from app.queue_consumer import TriageQueueConsumer
+
+JOBS, RESULTS, DEAD, GROUP = "triage:jobs", "triage:results", "triage:dead", "agent-workers"
+
+
+class FakeAgentService:
+    """Answers every ticket after `delay` seconds, or fails while `failing`"""
+
+    def __init__(self, delay: float = 0.0, failing: bool = False):
+        self.delay = delay
+        self.failing = failing
+        self.release = None
+        self.calls = Counter()
+
+    async def process_triage(self, request):
+        self.calls[request.ticket.id] += 1
+        if self.release is not None:
+            await self.release.wait()
+        await asyncio.sleep(self.delay)
+        if self.failing:
+            raise RuntimeError("LLM unavailable")
+        return TriageResponse(
+            suggestion=AgentSuggestion(
+                predictedCategory=CategoryEnum.BILLING, articleIds=[], draftReply="Refunded.",
+                confidence=0.9, modelInfo={}
+            ),
+            processingTimeMs=1
+        )
+
+
+def job(ticket_id: str) -> dict:
+    return {
+        "jobId": f"job-{ticket_id}",
+        "payload": json.dumps({
+            "ticket": {"id": ticket_id, "title": "Charged twice", "description": "Refund please"},
+            "traceId": f"trace-{ticket_id}"
+        })
+    }
+
+
+def make_consumer(redis, agent, **kwargs):
+    options = {"visibility_timeout_ms": 60000, "block_ms": 10, "consumer": "worker-1"}
+    options.update(kwargs)
+    return TriageQueueConsumer(agent, redis, jobs_stream=JOBS, results_stream=RESULTS,
+                               dead_letter_stream=DEAD, group=GROUP, **options)
+
+
+async def wait_until(condition, timeout: float = 3.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not await condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+async def results(redis):
+    return [{key.decode(): value.decode() for key, value in fields.items()}
+            for _, fields in await redis.xrange(RESULTS)]
+
+
+async def pending(redis) -> int:
+    return (await redis.xpending(JOBS, GROUP))["pending"]
+
+
+async def has_results(redis, count: int) -> bool:
+    return await redis.xlen(RESULTS) >= count
+
+
+async def holds(consumer, count: int) -> bool:
+    return consumer.in_flight >= count
+
+
+def test_completed_job_is_answered_and_acknowledged():
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis()
+        agent = FakeAgentService()
+        consumer = make_consumer(redis, agent)
+        await consumer.start()
+        await redis.xadd(JOBS, job("t1"))
+
+        await wait_until(lambda: has_results(redis, 1))
+        answered = await results(redis)
+        outstanding = await pending(redis)
+        await consumer.stop()
+        return answered, outstanding, consumer.stats
+
+    answered, outstanding, stats = asyncio.run(scenario())
+    assert [(r["jobId"], r["ticketId"], r["status"]) for r in answered] == [("job-t1", "t1", "ok")]
+    assert json.loads(answered[0]["result"])["suggestion"]["draftReply"] == "Refunded."
+    assert outstanding == 0
+    assert stats["processed"] == 1
+
+
+def test_job_of_dead_consumer_is_reclaimed():
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis()
+        consumer = make_consumer(redis, FakeAgentService(), visibility_timeout_ms=50)
+        await consumer.ensure_group()
+        await redis.xadd(JOBS, job("t1"))
+        # Another worker reads the job and dies without acknowledging it
+        await redis.xreadgroup(GROUP, "worker-dead", {JOBS: ">"}, count=1)
+
+        await consumer.start()
+        await wait_until(lambda: has_results(redis, 1))
+        outstanding = await pending(redis)
+        await consumer.stop()
+        return outstanding, consumer.stats
+
+    outstanding, stats = asyncio.run(scenario())
+    assert outstanding == 0
+    assert stats["reclaimed"] == 1
+    assert stats["processed"] == 1
+
+
+def test_jobs_in_flight_are_not_reclaimed():
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis()
+        # Jobs run and wait for a slot for several visibility timeouts
+        agent = FakeAgentService(delay=0.15)
+        consumer = make_consumer(redis, agent, visibility_timeout_ms=40,
+                                 prefetch=3, concurrency=1)
+        other = make_consumer(redis, agent, visibility_timeout_ms=40, consumer="worker-2")
+        await consumer.start()
+        for ticket_id in ("t1", "t2", "t3"):
+            await redis.xadd(JOBS, job(ticket_id))
+        await wait_until(lambda: holds(consumer, 3))
+
+        await other.start()
+        await wait_until(lambda: has_results(redis, 3))
+        await asyncio.sleep(0.1)
+        answered = await results(redis)
+        await other.stop()
+        await consumer.stop()
+        return agent.calls, answered, consumer.stats, other.stats
+
+    calls, answered, stats, other_stats = asyncio.run(scenario())
+    assert calls == {"t1": 1, "t2": 1, "t3": 1}
+    assert sorted(r["ticketId"] for r in answered) == ["t1", "t2", "t3"]
+    assert stats["reclaimed"] == other_stats["reclaimed"] == 0
+
+
+def test_job_exceeding_max_deliveries_is_dead_lettered():
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis()
+        agent = FakeAgentService(failing=True)
+        consumer = make_consumer(redis, agent, visibility_timeout_ms=30, max_deliveries=2)
+        await consumer.start()
+        await redis.xadd(JOBS, job("t1"))
+
+        await wait_until(lambda: has_results(redis, 1))
+        answered = await results(redis)
+        dead = await redis.xrange(DEAD)
+        outstanding = await pending(redis)
+        await consumer.stop()
+        return agent.calls, answered, dead, outstanding, consumer.stats
+
+    calls, answered, dead, outstanding, stats = asyncio.run(scenario())
+    assert calls["t1"] == 2
+    assert [(r["ticketId"], r["status"], r["error"]) for r in answered] == \
+        [("t1", "error", "max deliveries exceeded")]
+    assert len(dead) == 1
+    assert dead[0][1][b"reason"] == b"max deliveries exceeded"
+    assert outstanding == 0
+    assert stats["failed"] == 2
+    assert stats["deadLettered"] == 1
+
+
+def test_malformed_job_is_dead_lettered():
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis()
+        consumer = make_consumer(redis, FakeAgentService())
+        await consumer.start()
+        await redis.xadd(JOBS, {"jobId": "job-bad", "payload": "{not json"})
+
+        await wait_until(lambda: has_results(redis, 1))
+        answered = await results(redis)
+        dead = await redis.xlen(DEAD)
+        await consumer.stop()
+        return answered, dead
+
+    answered, dead = asyncio.run(scenario())
+    assert answered[0]["jobId"] == "job-bad"
+    assert answered[0]["status"] == "error"
+    assert answered[0]["error"].startswith("malformed job")
+    assert dead == 1
+
+
+def test_reads_stop_at_prefetch_until_a_slot_frees():
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis()
+        agent = FakeAgentService()
+        agent.release = asyncio.Event()
+        consumer = make_consumer(redis, agent, prefetch=2, concurrency=1)
+        await consumer.start()
+        for i in range(5):
+            await redis.xadd(JOBS, job(f"t{i}"))
+
+        await wait_until(lambda: holds(consumer, 2))
+        await asyncio.sleep(0.1)
+        held, read, started = consumer.in_flight, await pending(redis), sum(agent.calls.values())
+
+        agent.release.set()
+        await wait_until(lambda: has_results(redis, 5))
+        outstanding = await pending(redis)
+        await consumer.stop()
+        return held, read, started, outstanding
+
+    held, read, started, outstanding = asyncio.run(scenario())
+    # Two jobs read, only one of them being processed
+    assert (held, read, started) == (2, 2, 1)
+    assert outstanding == 0
@@ -0,0 +1,133 @@
+import time
+import asyncio
+import pytest
+from app.llm_provider import LLMFallbackError, LLMProvider
+from app.providers import FakeProvider
+from app.resilience import AdaptiveLimiter, CircuitBreaker
+
+
+@pytest.fixture
+def make_llm(monkeypatch):
+    def make(provider, **env):
+        monkeypatch.setenv("LLM_HEDGE_ENABLED", "false")
+        monkeypatch.setenv("LLM_CIRCUIT_FAILURES", "2")
+        monkeypatch.setenv("LLM_CIRCUIT_RESET_SECONDS", "0.05")
+        for name, value in env.items():
+            monkeypatch.setenv(name, value)
+        return LLMProvider(provider=provider)
+    return make
+
+
+async def classify_cause(llm):
+    """None if the LLM classified the text, otherwise the fallback cause"""
+    try:
+        await llm.classify_ticket("I was charged twice", fallback=False)
+    except LLMFallbackError as e:
+        return e.cause
+
+
+def test_circuit_opens_probes_and_closes(make_llm):
+    fake = FakeProvider(latency_ms=0, error_rate=1.0)
+    llm = make_llm(fake)
+
+    async def scenario():
+        opening = [await classify_cause(llm) for _ in range(3)]
+        assert llm.breaker.state == CircuitBreaker.OPEN
+        calls_while_open = fake.calls
+
+        # After the reset period a failed probe re-opens the circuit
+        await asyncio.sleep(0.06)
+        failed_probe = await classify_cause(llm)
+        reopened = (llm.breaker.state, await classify_cause(llm))
+
+        # A successful probe closes it; calls arriving meanwhile are rejected
+        await asyncio.sleep(0.06)
+        fake.error_rate = 0.0
+        fake.latency_ms = 20
+        probes = await asyncio.gather(classify_cause(llm), classify_cause(llm))
+        return opening, calls_while_open, failed_probe, reopened, probes
+
+    opening, calls_while_open, failed_probe, reopened, probes = asyncio.run(scenario())
+    assert opening == ["provider_error", "provider_error", "circuit_open"]
+    assert calls_while_open == 2
+    assert failed_probe == "provider_error"
+    assert reopened == (CircuitBreaker.OPEN, "circuit_open")
+    assert probes == [None, "circuit_open"]
+    assert llm.breaker.state == CircuitBreaker.CLOSED
+    assert fake.calls == 4
+
+
+def test_hedge_beats_slow_primary(make_llm):
+    class SlowFirstProvider(FakeProvider):
+        async def generate(self, prompt, schema=None):
+            self.latency_ms = 1000 if self.calls == 0 else 0
+            return await super().generate(prompt, schema)
+
+    fake = SlowFirstProvider()
+    llm = make_llm(fake, LLM_HEDGE_ENABLED="true")
+    for _ in range(llm.latency.min_samples):
+        llm.latency.observe(0.01)
+
+    async def scenario():
+        start = time.perf_counter()
+        cause = await classify_cause(llm)
+        elapsed = time.perf_counter() - start
+        # Let the cancelled primary release its slot
+        await asyncio.sleep(0.01)
+        return cause, elapsed
+
+    cause, elapsed = asyncio.run(scenario())
+    assert cause is None
+    assert elapsed < 0.5
+    assert fake.calls == 2
+    assert llm.limiter.in_flight == 0
+
+
+def test_no_hedge_without_latency_history(make_llm):
+    fake = FakeProvider(latency_ms=30)
+    llm = make_llm(fake, LLM_HEDGE_ENABLED="true")
+
+    assert asyncio.run(classify_cause(llm)) is None
+    assert fake.calls == 1
+
+
+def test_limiter_halves_on_timeout_and_grows_on_success(make_llm):
+    fake = FakeProvider(latency_ms=200)
+    llm = make_llm(fake, GEMINI_MAX_CONCURRENCY="8", GEMINI_TIMEOUT_SECONDS="0.05")
+
+    async def scenario():
+        timed_out = await classify_cause(llm)
+        after_timeout = llm.limiter.limit
+
+        fake.latency_ms = 0
+        for _ in range(4):
+            await classify_cause(llm)
+        return timed_out, after_timeout, llm.limiter.limit
+
+    timed_out, after_timeout, after_successes = asyncio.run(scenario())
+    assert timed_out == "timeout"
+    assert after_timeout == 4
+    # Additive increase: +1/limit per success, about +1 per round of calls
+    assert 4.9 < after_successes < 5
+
+
+def test_limiter_bounds_concurrency():
+    limiter = AdaptiveLimiter(max_limit=4, min_limit=1, initial_limit=2)
+    running = peak = 0
+
+    async def call():
+        nonlocal running, peak
+        await limiter.acquire()
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        limiter.release(False)
+
+    async def scenario():
+        await asyncio.gather(*[call() for _ in range(6)])
+
+    asyncio.run(scenario())
+    assert peak == 2
+    assert limiter.limit == 1
+    assert limiter.in_flight == 0
@@ -0,0 +1,91 @@
+import re
+import json
+import asyncio
+from app import retriage
+from app.models import TriageThresholds
+from app.providers import FakeProvider
+
+
+def test_chunk_is_classified_in_micro_batch_groups(agent, monkeypatch):
+    agent.llm_provider.classify_batch_size = 8
+    prompts = []
+
+    class RecordingProvider(FakeProvider):
+        async def generate(self, prompt, schema=None):
+            prompts.append(prompt)
+            return await super().generate(prompt, schema)
+
+    agent.llm_provider.provider = RecordingProvider(latency_ms=0)
+    monkeypatch.setattr(retriage, "_agent", agent, raising=False)
+    monkeypatch.setattr(retriage, "_thresholds", TriageThresholds(), raising=False)
+    tickets = [
+        {"id": f"t{i}", "title": "Charged twice", "description": "Refund please " * 50}
+        for i in range(20)
+    ]
+
+    rows = asyncio.run(retriage._triage_chunk(tickets))
+    assert [row["ticketId"] for row in rows] == [ticket["id"] for ticket in tickets]
+    assert sorted(len(re.findall(r"^\[\d+\] ", prompt, re.MULTILINE)) for prompt in prompts) == [4, 8, 8]
+    # Each ticket keeps the share of the prompt budget it gets from /triage
+    assert all("Refund please " * 20 in prompt for prompt in prompts)
+
+
+def test_thresholds_default_to_backend_config():
+    thresholds = retriage.load_thresholds()
+    assert thresholds.autoCloseEnabled
+    assert thresholds.categoryThresholds == {
+        "billing": 0.78, "tech": 0.85, "shipping": 0.75, "other": 0.80
+    }
+    assert thresholds.threshold_for("tech") == 0.85
+
+
+def test_thresholds_load_from_config_export(tmp_path):
+    # Fields missing from the document keep the backend's schema defaults
+    doc = {"_id": {"$oid": "cfg"}, "autoCloseEnabled": False, "confidenceThreshold": 0.7,
+           "categoryThresholds": {"tech": 0.9}}
+    jsonl = tmp_path / "configs.jsonl"
+    jsonl.write_text(json.dumps(doc) + "\n")
+    array = tmp_path / "configs.json"
+    array.write_text(json.dumps([doc]))
+
+    for path in (jsonl, array):
+        thresholds = retriage.load_thresholds(str(path))
+        assert not thresholds.autoCloseEnabled
+        assert thresholds.confidenceThreshold == 0.7
+        assert thresholds.categoryThresholds == {
+            "billing": 0.78, "tech": 0.9, "shipping": 0.75, "other": 0.80
+        }
+
+
+def test_checkpoint_records_thresholds_and_model(tmp_path, monkeypatch):
+    tickets = tmp_path / "tickets.jsonl"
+    tickets.write_text("\n".join(
+        json.dumps({"_id": {"$oid": f"t{i}"}, "title": "Charged twice", "description": "Refund please"})
+        for i in range(3)
+    ))
+    output = str(tmp_path / "results.jsonl")
+    # run() configures the environment for its workers; setting the names
+    # first makes monkeypatch restore them afterwards
+    for name in ("STUB_MODE", "PROMPT_VERSION", "TRIAGE_CACHE_ENABLED", "TRIAGE_DEDUP_ENABLED",
+                 "TRIAGE_BATCH_WINDOW_MS", "KB_SOURCE", "KB_SOURCE_PATH"):
+        monkeypatch.setenv(name, "")
+        monkeypatch.delenv(name)
+
+    args = retriage.parse_args([
+        str(tickets), output, "--stub", "--workers", "1",
+        "--threshold", "0.5", "--category-threshold", "tech=0.95", "--no-auto-close"
+    ])
+    summary = retriage.run(args)
+
+    with open(output + ".checkpoint.json", encoding="utf-8") as f:
+        settings = json.load(f)["settings"]
+    assert settings == summary["settings"]
+    assert settings["stub"] is True
+    assert (settings["provider"], settings["model"]) == ("stub", "deterministic-v1")
+    assert settings["thresholds"] == {
+        "autoCloseEnabled": False,
+        "confidenceThreshold": 0.5,
+        "categoryThresholds": {"billing": 0.78, "tech": 0.95, "shipping": 0.75, "other": 0.80}
+    }
+    assert summary["tickets"] == 3
+    assert summary["autoCloseRate"] == 0
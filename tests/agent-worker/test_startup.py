@@ -0,0 +1,59 @@
+import json
+import time
+import asyncio
+from fastapi.testclient import TestClient
+from app import main
+from app.kb_sync import KBSyncService
+
+ARTICLES = [{
+    "_id": "art-refunds", "title": "Refunds for duplicate charges", "status": "published",
+    "body": "If you were charged twice, the duplicate charge is refunded within 5 days.",
+    "tags": ["billing", "refund"], "category": "billing"
+}]
+TRIAGE = {
+    "ticket": {"id": "t1", "title": "Charged twice", "description": "Duplicate charge refund"},
+    "traceId": "trace-1"
+}
+
+
+def test_routes_wait_for_the_configured_kb(monkeypatch, tmp_path):
+    source = tmp_path / "articles.jsonl"
+    source.write_text("\n".join(json.dumps(article) for article in ARTICLES))
+    monkeypatch.setenv("KB_SOURCE", "file")
+    monkeypatch.setenv("KB_SOURCE_PATH", str(source))
+    monkeypatch.setenv("STUB_MODE", "true")
+    monkeypatch.setenv("TRIAGE_DEDUP_ENABLED", "false")
+    monkeypatch.delenv("KB_SNAPSHOT_DIR", raising=False)
+    monkeypatch.delenv("KB_BOOTSTRAP_SNAPSHOT_DIR", raising=False)
+
+    initial_load = KBSyncService.initial_load
+
+    async def slow_initial_load(self):
+        await asyncio.sleep(0.5)
+        await initial_load(self)
+
+    monkeypatch.setattr(KBSyncService, "initial_load", slow_initial_load)
+
+    with TestClient(main.app) as client:
+        # The agent is built first; the KB load is still under way
+        deadline = time.monotonic() + 5
+        while main.agent_service is None:
+            assert time.monotonic() < deadline, "agent was never built"
+            time.sleep(0.01)
+        assert client.get("/health").status_code == 200
+        assert client.get("/ready").status_code == 503
+        for path in ("/triage", "/triage/batch", "/draft"):
+            payload = {"requests": [TRIAGE]} if path == "/triage/batch" else TRIAGE
+            assert client.post(path, json=payload).status_code == 503
+
+        deadline = time.monotonic() + 5
+        while client.get("/ready").status_code != 200:
+            assert time.monotonic() < deadline, "worker never became ready"
+            time.sleep(0.05)
+
+        ready = client.get("/ready").json()
+        response = client.post("/triage", json=TRIAGE)
+
+    assert set(ready["startupSeconds"]) == {"import", "agent", "kb", "ready"}
+    assert response.status_code == 200
+    assert response.json()["suggestion"]["articleIds"] == ["art-refunds"]
@@ -0,0 +1,72 @@
+import time
+import asyncio
+from app.models import TicketData, TriageRequest
+from app.providers import FakeProvider, Generation
+
+CHUNKS = ("Sorry about the double charge. ", "A refund is on its way. ", "Best regards")
+
+
+class ChunkedProvider(FakeProvider):
+    """Streams a fixed draft with a pause before each chunk"""
+
+    def __init__(self, chunk_delay: float = 0.05, fail_after: int = None):
+        super().__init__(latency_ms=0)
+        self.chunk_delay = chunk_delay
+        self.fail_after = fail_after
+
+    async def stream(self, prompt: str):
+        for i, chunk in enumerate(CHUNKS):
+            if i == self.fail_after:
+                raise RuntimeError("Connection reset mid-stream")
+            await asyncio.sleep(self.chunk_delay)
+            yield Generation(chunk)
+        yield Generation("", 10, 3)
+
+
+def stream(agent, provider):
+    agent.llm_provider.provider = provider
+    request = TriageRequest(
+        ticket=TicketData(id="t1", title="Charged twice", description="My card was billed twice"),
+        traceId="trace-1"
+    )
+
+    async def collect():
+        return [(event, data, time.perf_counter())
+                async for event, data in agent.stream_triage(request)]
+
+    return asyncio.run(collect())
+
+
+def cached_drafts(agent):
+    return [value for _, value in agent.cache._entries.values() if isinstance(value, str)]
+
+
+def test_draft_deltas_arrive_while_generating(agent):
+    events = stream(agent, ChunkedProvider())
+
+    deltas = [(data["text"], at) for event, data, at in events if event == "draft_delta"]
+    assert [text for text, _ in deltas] == list(CHUNKS)
+    # Chunks are forwarded as produced, not all at once after the completion
+    assert deltas[-1][1] - deltas[0][1] >= 0.08
+    assert events[-1][0] == "suggestion"
+    assert events[-1][1]["suggestion"]["draftReply"] == "".join(CHUNKS).strip()
+    assert cached_drafts(agent) == ["".join(CHUNKS).strip()]
+
+
+def test_failure_mid_stream_resets_and_is_not_cached(agent):
+    events = stream(agent, ChunkedProvider(fail_after=1))
+
+    names = [event for event, _, _ in events]
+    assert names.index("draft_reset") == names.index("draft_delta") + 1
+    suggestion = events[-1][1]["suggestion"]
+    assert suggestion["draftReply"].startswith("Thank you for contacting us regarding your billing")
+    assert cached_drafts(agent) == []
+
+
+def test_fallback_before_output_is_not_cached(agent):
+    events = stream(agent, ChunkedProvider(fail_after=0))
+
+    names = [event for event, _, _ in events]
+    assert "draft_reset" not in names
+    assert names.count("draft_delta") == 1
+    assert cached_drafts(agent) == []
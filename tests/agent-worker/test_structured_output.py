@@ -0,0 +1,130 @@
+import asyncio
+import pytest
+from app.models import CategoryEnum, TicketData, TriageRequest
+from app.providers import FakeProvider
+from app.prompts import PromptBuilder
+from app.structured_output import (
+    CLASSIFICATION_BATCH_SCHEMA, TRIAGE_SCHEMA, StructuredOutputError,
+    extract_json, parse_classification, parse_triage
+)
+
+
+def test_extract_json_from_code_fence():
+    text = '```json\n{"category": "billing", "confidence": 0.9}\n```'
+    assert extract_json(text) == {"category": "billing", "confidence": 0.9}
+
+
+def test_extract_json_surrounded_by_prose():
+    text = 'Sure! Here is the result: {"category": "tech", "confidence": 0.7} Let me know.'
+    assert extract_json(text) == {"category": "tech", "confidence": 0.7}
+
+
+def test_extract_json_ignores_brackets_inside_strings():
+    text = 'Result: {"draft": "Use the {reset} link ] and [retry}", "category": "tech"} done'
+    assert extract_json(text) == {"draft": "Use the {reset} link ] and [retry}", "category": "tech"}
+
+
+def test_extract_json_handles_escaped_quotes():
+    text = r'{"draft": "Click \"Reset\" then {ok}", "confidence": 1}'
+    assert extract_json(text)["draft"] == 'Click "Reset" then {ok}'
+
+
+def test_extract_json_forgives_trailing_commas():
+    text = '{"category": "shipping", "confidence": 0.6,}'
+    assert extract_json(text) == {"category": "shipping", "confidence": 0.6}
+    assert extract_json('[{"index": 0, "category": "other",},]', list) == \
+        [{"index": 0, "category": "other"}]
+
+
+def test_extract_json_array():
+    text = 'Here you go:\n[{"index": 0, "category": "billing", "confidence": 0.8}]'
+    assert extract_json(text, list) == [{"index": 0, "category": "billing", "confidence": 0.8}]
+
+
+def test_extract_json_skips_unparseable_value():
+    text = 'Template: {category: billing}. Answer: {"category": "billing", "confidence": 0.5}'
+    assert extract_json(text) == {"category": "billing", "confidence": 0.5}
+
+
+def test_extract_json_truncated_input():
+    with pytest.raises(StructuredOutputError) as error:
+        extract_json('{"category": "billing", "draft": "Thank you for')
+    assert error.value.cause == "invalid_json"
+
+
+def test_extract_json_without_json():
+    with pytest.raises(StructuredOutputError) as error:
+        extract_json("I could not classify this ticket.")
+    assert error.value.cause == "no_json"
+
+
+def test_extract_json_invalid_value():
+    with pytest.raises(StructuredOutputError) as error:
+        extract_json("{category: billing}")
+    assert error.value.cause == "invalid_json"
+
+
+def test_parse_classification_normalizes_and_clamps():
+    result = parse_classification({"category": " Billing ", "confidence": "1.4"})
+    assert result.predictedCategory == CategoryEnum.BILLING
+    assert result.confidence == 1.0
+    assert parse_classification({"category": "tech", "confidence": -2}).confidence == 0.0
+
+
+@pytest.mark.parametrize("data", [
+    {"category": "refunds", "confidence": 0.5},
+    {"category": "billing"},
+    {"category": "billing", "confidence": "high"},
+    ["billing", 0.5],
+])
+def test_parse_classification_rejects_invalid(data):
+    with pytest.raises(StructuredOutputError) as error:
+        parse_classification(data)
+    assert error.value.cause == "schema"
+
+
+def test_parse_triage():
+    classification, draft = parse_triage(
+        {"category": "shipping", "confidence": 0.8, "draft": "  Your parcel ships today.\n"}
+    )
+    assert classification.predictedCategory == CategoryEnum.SHIPPING
+    assert classification.confidence == 0.8
+    assert draft == "Your parcel ships today."
+
+
+@pytest.mark.parametrize("draft", [None, "", "   ", 42])
+def test_parse_triage_requires_draft(draft):
+    data = {"category": "shipping", "confidence": 0.8}
+    if draft is not None:
+        data["draft"] = draft
+    with pytest.raises(StructuredOutputError) as error:
+        parse_triage(data)
+    assert error.value.cause == "schema"
+
+
+def test_fake_provider_answers_schema_with_json():
+    provider = FakeProvider(latency_ms=0)
+    prompt = PromptBuilder().classify_batch(["Charged twice", "Parcel lost", "App crashes"])
+
+    async def generate():
+        triage = await provider.generate("Triage this ticket", schema=TRIAGE_SCHEMA)
+        batch = await provider.generate(prompt.text, schema=CLASSIFICATION_BATCH_SCHEMA)
+        plain = await provider.generate("Draft a reply")
+        return triage.text, batch.text, plain.text
+
+    triage, batch, plain = asyncio.run(generate())
+    parse_triage(extract_json(triage))
+    assert [item["index"] for item in extract_json(batch, list)] == [0, 1, 2]
+    assert plain == "This is a fake completion."
+
+
+def test_combined_triage_makes_one_call_with_fake_provider(agent):
+    request = TriageRequest(
+        ticket=TicketData(id="t1", title="Charged twice", description="Refund please"),
+        traceId="trace-1"
+    )
+
+    response = asyncio.run(agent.process_triage(request))
+    assert agent.llm_provider.combined_mode
+    assert agent.llm_provider.provider.calls == 1
+    assert response.suggestion.draftReply == "This is a fake completion."
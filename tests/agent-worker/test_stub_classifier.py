@@ -0,0 +1,58 @@
+import json
+import random
+import pytest
+from app.models import ClassificationResult, CategoryEnum
+from app.stub_classifier import DEFAULT_CONFIG_PATH, KeywordClassifier
+
+with open(DEFAULT_CONFIG_PATH, encoding="utf-8") as f:
+    CONFIG = json.load(f)
+
+
+def substring_classify(text):
+    """The original stub classifier: one substring check per keyword"""
+    text_lower = text.lower()
+    scores = {}
+    for category, keywords in CONFIG["categories"].items():
+        matches = sum(1 for keyword in keywords if keyword in text_lower)
+        if matches > 0:
+            scores[category] = matches / len(keywords) + 0.3
+
+    if scores:
+        predicted_category = max(scores, key=scores.get)
+        confidence = min(0.95, scores[predicted_category])
+    else:
+        predicted_category = "other"
+        confidence = 0.2
+    return ClassificationResult(
+        predictedCategory=CategoryEnum(predicted_category), confidence=confidence
+    )
+
+
+@pytest.mark.parametrize("text", [
+    "billost",
+    "errorder",
+    "My package was lost",
+    "Refund the double charge on my credit card",
+    "Login error: password not working",
+    "BILLING address for the shipment",
+    "nothing relevant here",
+    ""
+])
+def test_matches_substring_classifier(text):
+    assert KeywordClassifier.from_file().classify(text) == substring_classify(text)
+
+
+def test_matches_substring_classifier_on_overlapping_keywords():
+    keywords = [keyword for keywords in CONFIG["categories"].values() for keyword in keywords]
+    rng = random.Random(7)
+    classifier = KeywordClassifier.from_file()
+
+    for _ in range(2000):
+        # Glue keyword pieces together so keywords overlap and share prefixes
+        pieces = []
+        for keyword in rng.sample(keywords, rng.randint(1, 4)):
+            start = rng.randint(0, len(keyword) // 2)
+            end = rng.randint(len(keyword) // 2 + 1, len(keyword))
+            pieces.append(keyword[start:end] if rng.random() < 0.5 else keyword)
+        text = rng.choice(["", " "]).join(pieces)
+        assert classifier.classify(text) == substring_classify(text), text
@@ -0,0 +1,99 @@
+import json
+import asyncio
+from app.models import TicketData
+
+
+def make_ticket():
+    return TicketData(id="t1", title="Refund request", description="I was charged twice this month")
+
+
+def test_classification_fallback_is_not_cached(agent):
+    provider = agent.llm_provider.provider
+    provider.error_rate = 1.0
+
+    async def scenario():
+        first = await agent._classify_ticket(make_ticket())
+        provider.error_rate = 0.0
+        provider.respond = lambda prompt: json.dumps({"category": "other", "confidence": 0.9})
+        second = await agent._classify_ticket(make_ticket())
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first == agent.llm_provider.keyword_classify(
+        "Refund request I was charged twice this month"
+    )
+    assert second.predictedCategory.value == "other"
+    assert second.confidence == 0.9
+
+
+def test_draft_fallback_is_not_cached(agent):
+    provider = agent.llm_provider.provider
+    provider.error_rate = 1.0
+    ticket = make_ticket()
+
+    async def scenario():
+        classification = await agent._classify_ticket(ticket)
+        first = await agent._draft_response(ticket, [], classification)
+        provider.error_rate = 0.0
+        provider.respond = lambda prompt: "Refund issued."
+        second = await agent._draft_response(ticket, [], classification)
+        return classification, first, second
+
+    classification, first, second = asyncio.run(scenario())
+    category = classification.predictedCategory.value
+    assert first == agent.llm_provider.template_draft(ticket, [], category)
+    assert second == "Refund issued."
+
+
+def test_llm_results_are_cached(agent):
+    provider = agent.llm_provider.provider
+    provider.respond = lambda prompt: json.dumps({"category": "billing", "confidence": 0.8})
+
+    async def scenario():
+        await agent._classify_ticket(make_ticket())
+        await agent._classify_ticket(make_ticket())
+
+    asyncio.run(scenario())
+    assert provider.calls == 1
+    assert agent.cache.get_stats()["hits"] == 1
+
+
+def test_kb_change_invalidates_cached_draft(agent):
+    provider = agent.llm_provider.provider
+    ticket = make_ticket()
+    replies = iter(["First draft.", "Second draft."])
+
+    async def scenario():
+        classification = await agent._classify_ticket(ticket)
+        provider.respond = lambda prompt: next(replies)
+        articles = await agent.kb_service.search_articles(
+            f"{ticket.title} {ticket.description}", classification.predictedCategory.value
+        )
+        first = await agent._draft_response(ticket, articles, classification)
+        cached = await agent._draft_response(ticket, articles, classification)
+        agent.kb_service.apply_changes([{
+            "id": "kb_new", "title": "Warranty", "body": "Warranty claims",
+            "tags": [], "category": "other"
+        }], [])
+        redrafted = await agent._draft_response(ticket, articles, classification)
+        return first, cached, redrafted
+
+    assert asyncio.run(scenario()) == ("First draft.", "First draft.", "Second draft.")
+
+
+def test_kb_fingerprint_depends_only_on_content(agent):
+    kb_service = agent.kb_service
+    articles = [kb_service.index.articles[article_id] for article_id in kb_service.index.articles]
+    extra = {"id": "kb_new", "title": "Warranty", "body": "Warranty claims",
+             "tags": [], "category": "other"}
+
+    # A process that saw an extra article come and go has a different
+    # mutation count but serves the same KB
+    other = kb_service.new_index()
+    other.build(articles[::-1] + [extra])
+    other.remove("kb_new")
+    assert other.version != kb_service.index.version
+    assert other.fingerprint == kb_service.index.fingerprint
+
+    other.add(dict(articles[0], body=articles[0]["body"] + " Updated."))
+    assert other.fingerprint != kb_service.index.fingerprint